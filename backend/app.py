@@ -1,13 +1,31 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import asyncio
 import os
+import json
 import logging
+import signal
+import time
 
+from config import config
+from services.admission_control import AdmissionController, AdmissionRejected
+from services.batch_service import BatchService
+from services.catalog_loader import CatalogValidationError, CatalogWatcher
 from services.llm_service import LLMService
+from services.metrics import MetricsRegistry
+from services.product_pages import ProductPages, etag_matches, normalize_page_query
 from services.product_service import ProductService
+from services.rate_limiter import RateLimiter
+from services.segment_cache import SegmentCache
+from services.session_store import SessionStore
+
+logging.basicConfig(level=config['LOG_LEVEL'], format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI Product Recommendation API")
 
@@ -21,8 +39,111 @@ app.add_middleware(
 )
 
 # Initialize services
+# Shared by all workers when served by serve.py (see MetricsRegistry.share)
+metrics = MetricsRegistry()
 product_service = ProductService()
-llm_service = LLMService()
+# Bounds the recommendation requests that go to the LLM; /api/products and cache hits bypass it
+admission = None
+if config['ADMISSION_MAX_CONCURRENCY'] > 0:
+    admission = AdmissionController(
+        config['ADMISSION_MAX_CONCURRENCY'], config['ADMISSION_MAX_QUEUE'], metrics=metrics
+    )
+# Recommendations precomputed by scripts/precompute_segments.py; loaded before serve.py forks
+segment_cache = SegmentCache(config['SEGMENT_CACHE_PATH'] or None)
+segment_cache.load(product_service.catalog)
+llm_service = LLMService(product_service, metrics=metrics, admission=admission, segments=segment_cache)
+# LLM calls are already paced per backend by the router; this limiter only holds the batch back after a 429
+rate_limiter = RateLimiter()
+batch_service = BatchService(
+    llm_service, rate_limiter, workers=config['BATCH_WORKERS'], max_retries=config['BATCH_MAX_RETRIES']
+)
+
+product_pages = ProductPages(
+    product_service,
+    page_size=config['PRODUCT_PAGE_SIZE'],
+    max_limit=config['PRODUCT_PAGE_MAX_LIMIT'],
+    max_entries=config['PRODUCT_PAGE_CACHE_SIZE']
+)
+
+catalog_watcher = CatalogWatcher(product_service, config['CATALOG_WATCH_INTERVAL'])
+
+# Browsing sessions fed by /api/events; restored before serve.py forks, so every worker starts with them
+session_store = SessionStore(
+    max_sessions=config['SESSION_MAX_SESSIONS'],
+    max_views=config['SESSION_MAX_VIEWS'],
+    idle_seconds=config['SESSION_IDLE_SECONDS'],
+    snapshot_path=config['SESSION_SNAPSHOT_PATH'] or None,
+    metrics=metrics
+)
+session_store.load()
+
+# Readiness: set once startup has run, cleared as soon as shutdown begins (see serve.py)
+service_state = {'ready': False, 'draining': False}
+
+def log_warmup_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Pre-encoding product listings failed: %s", future.exception())
+
+@app.on_event("startup")
+async def startup():
+    """
+    Start watching the catalog file for changes, snapshotting sessions and refreshing
+    precomputed segments, and pre-encode the product listing
+    """
+    if config['CATALOG_WATCH_INTERVAL'] > 0:
+        catalog_watcher.start()
+    session_store.start(config['SESSION_SNAPSHOT_INTERVAL'])
+    if config['SEGMENT_REFRESH']:
+        segment_cache.start(batch_service, product_service)
+    # Kept so the warm-up is not garbage collected and its failure is logged
+    app.state.listing_warmup = asyncio.get_running_loop().run_in_executor(None, product_pages.warm)
+    app.state.listing_warmup.add_done_callback(log_warmup_failure)
+    service_state['ready'] = True
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Stop the catalog watcher, snapshot sessions, let in-flight LLM calls finish, flush cache writes and close pooled connections
+    """
+    service_state['draining'] = True
+    catalog_watcher.stop()
+    segment_cache.stop()
+    await run_in_threadpool(session_store.stop)
+    abandoned = await llm_service.drain(config['SHUTDOWN_DRAIN_SECONDS'])
+    if abandoned:
+        logger.warning("Shutting down with %d LLM calls still in flight", abandoned)
+    await run_in_threadpool(llm_service.cache.flush)
+    await llm_service.close()
+
+@app.get("/healthz")
+async def liveness():
+    """
+    Liveness probe: the process is up and its event loop is responsive
+    """
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz")
+async def readiness():
+    """
+    Readiness probe: 200 once the worker has started with a catalog, 503 while starting or draining
+    """
+    catalog = product_service.catalog
+    ready = service_state['ready'] and not service_state['draining'] and len(catalog.products) > 0
+    body = {
+        "status": "ready" if ready else ("draining" if service_state['draining'] else "starting"),
+        "pid": os.getpid(),
+        "catalog_version": catalog.version,
+        "products": len(catalog.products),
+        "llm_calls_in_flight": llm_service.llm_client.active,
+    }
+    return Response(content=json.dumps(body), status_code=200 if ready else 503, media_type="application/json")
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: recommendation stage and request latency histograms, cache, fallback, error and token counters
+    """
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Define request models
 class UserPreferences(BaseModel):
@@ -33,17 +154,123 @@ class UserPreferences(BaseModel):
 class RecommendationRequest(BaseModel):
     preferences: UserPreferences
     browsing_history: List[str] = []
+    # Used for the browsing history when none is sent (see POST /api/events)
+    session_id: Optional[str] = None
+
+class ViewEvent(BaseModel):
+    session_id: str
+    product_id: str
+    type: str = "view"
+
+def request_history(request):
+    """
+    Browsing history of a recommendation request: the one sent, else the session's recent views
+    """
+    if request.browsing_history or not request.session_id:
+        return request.browsing_history
+    return session_store.history(request.session_id)
+
+# Milliseconds the client is prepared to wait, e.g. what is left of its own timeout
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+def request_deadline(request):
+    """
+    time.monotonic() by which a recommendation request must be answered
+
+    Taken from the X-Request-Timeout-Ms header, else RECOMMENDATION_DEADLINE_MS.
+    """
+    timeout_ms = config['RECOMMENDATION_DEADLINE_MS']
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            timeout_ms = max(float(header), 0.0)
+        except ValueError:
+            pass
+    return time.monotonic() + timeout_ms / 1000
+
+def overloaded_response(rejection):
+    """
+    429 with Retry-After for a request shed by admission control
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Recommendation service overloaded, retry later", "reason": rejection.reason},
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
 
 @app.get("/api/products")
-async def get_products():
+async def get_products(
+    request: Request,
+    category: Optional[List[str]] = Query(None),
+    brand: Optional[List[str]] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
     """
-    Return the full product catalog
+    Return the product catalog, or one filtered, sorted page of it
+
+    Without query parameters the full catalog is returned as a JSON array.
+    Any filter, sort or paging parameter returns a page object instead.
+    Responses carry an ETag; a matching If-None-Match gets 304.
     """
-    products = product_service.get_all_products()
-    return products
+    paged = (any((category, brand, tag, in_stock, sort, cursor, offset))
+             or any(value is not None for value in (min_price, max_price, limit)))
+    try:
+        query = normalize_page_query(category, brand, tag, min_price, max_price, in_stock, sort) if paged else None
+        listing = product_pages.listing(query, offset, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"ETag": listing.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), listing.etag):
+        product_pages.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    body = product_pages.cached_body(listing)
+    if body is None:
+        body = await run_in_threadpool(product_pages.body, listing)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/search")
+async def search_products(
+    q: str = Query(..., max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    prefix: bool = True,
+    category: Optional[List[str]] = Query(None),
+    brand: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+):
+    """
+    Full-text product search with BM25 ranking and typeahead prefix matching
+    """
+    results = product_service.search_products(
+        q,
+        limit=limit,
+        prefix=prefix,
+        categories=category,
+        brands=brand,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock
+    )
+    return {"query": q, "results": results, "count": len(results)}
+
+@app.get("/api/catalog/listings")
+async def get_product_listing_stats():
+    """
+    Return counters for the pre-encoded product listing cache
+    """
+    return product_pages.stats()
 
 @app.post("/api/recommendations")
-async def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest, http_request: Request):
     """
     Generate personalized product recommendations based on user preferences
     and browsing history
@@ -51,32 +278,211 @@ async def get_recommendations(request: RecommendationRequest):
     try:
         # Extract user preferences and browsing history from request
         user_preferences = request.preferences.dict()
-        browsing_history = request.browsing_history
+        browsing_history = request_history(request)
 
-          # Log received request data for debugging
-        logging.info(f"Received request with preferences: {user_preferences}, browsing history: {browsing_history}")
+        # Formatted only when debug logging is enabled
+        logger.debug("Received request with preferences: %s, browsing history: %s", user_preferences, browsing_history)
         
         # Use the LLM service to generate recommendations
-        recommendations = llm_service.generate_recommendations(
+        recommendations = await llm_service.generate_recommendations(
             user_preferences,
             browsing_history,
-            product_service.get_all_products()
+            deadline=request_deadline(http_request)
         )
         
         return recommendations
     
+    except AdmissionRejected as e:
+        return overloaded_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/api/recommendations/stream")
+async def stream_recommendations(request: RecommendationRequest, http_request: Request, format: str = "ndjson"):
+    """
+    Stream recommendations as they are generated
+
+    With format=ndjson (default) each line is a JSON object: one per
+    recommendation, then {"done": true, "count": n} or {"error": ...}.
+    With format=sse the same payloads are sent as server-sent events named
+    "recommendation", "done" and "error".
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+
+    stream = llm_service.stream_recommendations(
+        request.preferences.dict(), request_history(request), deadline=request_deadline(http_request)
+    )
+    # Admission is decided before the first event, while a 429 can still be sent
+    try:
+        first = await stream.__anext__()
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except StopAsyncIteration:
+        first = None
+
+    async def events():
+        if first is not None:
+            yield first
+        async for event in stream:
+            yield event
+
+    async def ndjson():
+        async for event, payload in events():
+            if event == "done":
+                payload = {"done": True, **payload}
+            yield json.dumps(payload) + "\n"
+
+    async def sse():
+        async for event, payload in events():
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    if format == "sse":
+        return StreamingResponse(sse(), media_type="text/event-stream")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/api/recommendations/batch")
+async def batch_recommendations(request: Request):
+    """
+    Generate recommendations for many requests in one call
+
+    The body is JSONL (one recommendation request per line, with an optional
+    "id"). Identical requests are computed once. One JSON line per record is
+    streamed back as results complete: {"id": ..., "recommendations": [...],
+    "count": n} or {"id": ..., "error": ...}.
+    """
+    # The body is read up front: StreamingResponse listens for client disconnects
+    # on the same receive channel, so it cannot be consumed while streaming.
+    # Use scripts/batch_recommend.py for files too large to post at once.
+    lines = (await request.body()).decode().splitlines()
+
+    async def ndjson():
+        async for result in batch_service.run(lines):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/api/recommendations/cache")
+async def get_recommendation_cache_stats():
+    """
+    Return recommendation cache hit/miss counters
+    """
+    return llm_service.cache.stats()
+
+@app.get("/api/recommendations/prompts")
+async def get_prompt_prefix_stats():
+    """
+    Return prompt prefix cache counters and prompt bytes reused vs rendered
+    """
+    return llm_service.prompt_builder.stats()
+
+@app.get("/api/recommendations/admission")
+async def get_admission_stats():
+    """
+    Return this worker's admission control state: slots in use, queue depth, projected wait and shed counts
+    """
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.stats()}
+
+@app.get("/api/recommendations/segments")
+async def get_segment_stats():
+    """
+    Return the precomputed segments: how many, the catalog they were generated from, hits and refreshes
+    """
+    return segment_cache.stats()
+
+@app.get("/api/recommendations/coalescing")
+async def get_recommendation_coalescing_stats():
+    """
+    Return counters for requests that shared an in-flight LLM call
+    """
+    return llm_service.single_flight.stats()
+
+@app.get("/api/llm/backends")
+async def get_llm_backends():
+    """
+    Return LLM retry and failover counters and each backend's health, concurrency limit and rate limiter state
+    """
+    return llm_service.llm_client.stats()
+
+@app.post("/api/events")
+async def record_event(event: ViewEvent):
+    """
+    Record a product view in a browsing session
+
+    Recommendation requests that send the session_id and no browsing_history
+    use the session's recent views instead.
+    """
+    if event.type != "view":
+        raise HTTPException(status_code=400, detail="Only 'view' events are supported")
+    product = product_service.get_product_by_id(event.product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail=f"Product with ID '{event.product_id}' not found.")
+    views = session_store.record_view(event.session_id, product)
+    return {"session_id": event.session_id, "views": views}
+
+@app.get("/api/sessions")
+async def get_session_stats():
+    """
+    Return this worker's session store counters
+    """
+    return session_store.stats()
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """
+    Return a session's recent views, category/brand/tag affinities and price band
+    """
+    profile = session_store.profile(session_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return profile
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    Forget a session
+    """
+    if not session_store.forget(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
+
+@app.get("/api/catalog")
+async def get_catalog_status():
+    """
+    Return the catalog version and reload counters
+    """
+    return product_service.status()
+
+@app.post("/api/catalog/reload")
+async def reload_catalog():
+    """
+    Reload the catalog from its data file
+
+    Parsing and indexing run in a worker thread while requests keep being
+    served from the current catalog. If the file is invalid the current
+    catalog stays in service and 422 is returned. Under serve.py, the other
+    workers reload too once this one has (the response does not wait for them).
+    """
+    try:
+        await run_in_threadpool(catalog_watcher.reload)
+    except CatalogValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Catalog rejected: {str(e)}")
+    if service_state.get('master_pid'):
+        # Under serve.py the master passes the reload on to the other workers
+        os.kill(service_state['master_pid'], signal.SIGUSR1)
+    return product_service.status()
+
 @app.get("/api/products/{product_id}")
 async def get_product_by_id(product_id: str):
     """
     Return product details by ID
     """
     try:
-        product = product_service.get_product_by_id(product_id)
+        product = product_service.get_product_json(product_id)
         if product:
-            return product
+            return Response(content=product, media_type="application/json")
         else:
             raise HTTPException(status_code=404, detail="Product not found")
     except Exception as e:
@@ -92,5 +498,5 @@ async def generic_exception_handler(request: Request, exc: Exception):
     }
 
 if __name__ == "__main__":
-    # Run the API with uvicorn
+    # Development server with auto-reload; use serve.py for production
     uvicorn.run("app:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Candidate filtering latency at 10k, 100k and 1M products
+
+Usage:
+    python -m benchmarks.bench_candidate_filter [--sizes 10000 100000 1000000] [--repeat 50]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_columns
+from services.candidate_filter import CandidateFilter
+
+SCENARIOS = {
+    'no preferences': {'priceRange': 'all', 'categories': [], 'brands': []},
+    'one category': {'priceRange': 'all', 'categories': ['Electronics'], 'brands': []},
+    'category + price': {'priceRange': 'medium', 'categories': ['Electronics', 'Home'], 'brands': []},
+    'category + brands + price': {
+        'priceRange': '20-150',
+        'categories': ['Electronics', 'Home', 'Sports'],
+        'brands': ['Brand1', 'Brand7', 'Brand42'],
+    },
+}
+
+
+def time_call(fn, repeat):
+    """
+    Return (p50, p99) latency in milliseconds over `repeat` calls
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'products':>10}  {'scenario':<28} {'history':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        candidate_filter = CandidateFilter(**generate_columns(size))
+        browsed = np.arange(0, size, max(size // 3, 1))[:3]
+        for name, preferences in SCENARIOS.items():
+            for history in ((), browsed):
+                p50, p99 = time_call(
+                    lambda: candidate_filter.select(preferences, browsed_positions=history, k=20),
+                    args.repeat,
+                )
+                print(f"{size:>10}  {name:<28} {len(history):>8} {p50:>8.3f} {p99:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Request latency while the catalog is reloaded in the background
+
+Serves candidate selection in a loop on the main thread while another thread
+reloads a synthetic catalog file, and compares latency before and during the
+reload. In-flight work keeps using its snapshot, so the reload should add
+GIL contention but no stall.
+
+`--change price` edits a price between reloads, which reuses the search
+index; `--change text` edits a product name, which rebuilds it.
+
+Usage:
+    python -m benchmarks.bench_catalog_reload [--products 100000] [--reloads 3] [--change price|text]
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_products
+from config import config
+
+
+def percentiles(samples):
+    values = np.array(samples) * 1000
+    return f"p50 {np.percentile(values, 50):6.2f} ms  p99 {np.percentile(values, 99):6.2f} ms  max {values.max():7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--reloads', type=int, default=3)
+    parser.add_argument('--change', choices=('price', 'text'), default='price')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='catalog-reload-')
+    data_path = os.path.join(workdir, 'products.json')
+    products = generate_products(args.products)
+    with open(data_path, 'w') as file:
+        json.dump(products, file)
+    config['DATA_PATH'] = data_path
+    config['EMBEDDING_INDEX_PATH'] = os.path.join(workdir, 'embeddings')
+    config['SIMILARITY_TABLE_PATH'] = os.path.join(workdir, 'similarity')
+
+    # Imported after the config is pointed at the synthetic catalog
+    from services.product_service import ProductService
+
+    start = time.perf_counter()
+    product_service = ProductService()
+    print(f"{args.products} products loaded in {time.perf_counter() - start:.2f}s")
+    categories = product_service.catalog.categories()
+    preferences = [{'priceRange': 'medium', 'categories': [c], 'brands': []} for c in categories]
+
+    def request(i):
+        catalog = product_service.catalog
+        started = time.perf_counter()
+        mask = catalog.candidate_filter.candidate_mask(preferences[i % len(preferences)], [])
+        catalog.candidate_filter.select(preferences[i % len(preferences)], [], k=20, mask=mask)
+        return time.perf_counter() - started
+
+    baseline = [request(i) for i in range(300)]
+    print(f"idle         {percentiles(baseline)}")
+
+    for reload_number in range(args.reloads):
+        if args.change == 'text':
+            products[reload_number]['name'] += f" Mk {reload_number + 2}"
+        else:
+            products[reload_number]['price'] = round(products[reload_number]['price'] + 1, 2)
+        with open(data_path, 'w') as file:
+            json.dump(products, file)
+
+        reload_time = {}
+
+        def reload():
+            started = time.perf_counter()
+            product_service.reload()
+            reload_time['seconds'] = time.perf_counter() - started
+
+        thread = threading.Thread(target=reload)
+        during = []
+        thread.start()
+        i = 0
+        while thread.is_alive():
+            during.append(request(i))
+            i += 1
+        thread.join()
+        print(f"reload v{product_service.catalog_version}  {percentiles(during)}  "
+              f"({len(during)} requests during a {reload_time['seconds']:.2f}s reload)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Catalog cold-start time and memory per worker for each catalog format
+
+Writes a synthetic catalog as products.json, JSONL and a binary snapshot,
+then loads each in a fresh process (as a uvicorn worker would) and reports
+load + index time, resident memory (RSS) and private memory (RSS minus pages
+shared with other processes, such as the snapshot's memory maps).
+"dicts" is the previous loader: json.load into a list of dicts plus an ID map.
+The embedding index is not included.
+
+Usage:
+    python -m benchmarks.bench_catalog_startup [--products 100000]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_catalog import generate_products
+
+
+def memory_mb():
+    """
+    (RSS, private) memory of this process in MB, from /proc (Linux only)
+    """
+    values = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Private_Clean:', 'Private_Dirty:'):
+                values[parts[0]] = int(parts[1]) / 1024
+    return values['Rss:'], values['Private_Clean:'] + values['Private_Dirty:']
+
+
+def child(fmt, path):
+    """
+    Load one catalog format and print timings and memory as JSON
+    """
+    baseline_rss, baseline_private = memory_mb()
+    start = time.perf_counter()
+    if fmt == 'dicts':
+        with open(path) as file:
+            products = json.load(file)
+        by_id = {product['id']: position for position, product in enumerate(products)}
+
+        def get(product_id):
+            return products[by_id[product_id]]
+        count = len(products)
+    else:
+        from services.catalog_index import CatalogIndex
+        from services.catalog_loader import load_catalog
+        catalog = CatalogIndex(load_catalog(path))
+        get = catalog.get
+        count = len(catalog)
+    seconds = time.perf_counter() - start
+
+    # Touch a sample of products, as serving requests would
+    rng = random.Random(0)
+    for _ in range(1000):
+        get(f"prod{rng.randint(1, count):07d}")
+    rss, private = memory_mb()
+    print(json.dumps({'seconds': seconds, 'rss_mb': rss - baseline_rss, 'private_mb': private - baseline_private}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--child', nargs=2, metavar=('FORMAT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    from services.product_table import ProductTable
+
+    workdir = tempfile.mkdtemp(prefix='catalog-startup-')
+    paths = {
+        'dicts': os.path.join(workdir, 'products.json'),
+        'json': os.path.join(workdir, 'products.json'),
+        'jsonl': os.path.join(workdir, 'products.jsonl'),
+        'snapshot': os.path.join(workdir, 'products.catalog'),
+    }
+    products = generate_products(args.products)
+    with open(paths['json'], 'w') as file:
+        json.dump(products, file)
+    with open(paths['jsonl'], 'w') as file:
+        for product in products:
+            file.write(json.dumps(product) + '\n')
+    ProductTable.from_products(products).save(paths['snapshot'])
+    del products
+    print(f"{args.products} products, products.json {os.path.getsize(paths['json']) / 2**20:.0f} MB")
+
+    print(f"{'format':<10}{'load+index':>12}{'RSS':>12}{'private':>12}")
+    for fmt, path in paths.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_catalog_startup', '--child', fmt, path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{fmt:<10}{result['seconds']:>11.2f}s{result['rss_mb']:>9.0f} MB{result['private_mb']:>9.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Completion tokens and latency: JSON replies vs. the compact line format
+
+Runs blocking recommendation requests through LLMService against the local
+stub once per LLM_RESPONSE_FORMAT. The stub generates one token (4
+characters) per --token-ms after --latency-ms, so generation time grows with
+the reply length as it does with a real model. Reports completion tokens,
+end-to-end latency, the time spent parsing and enriching the reply, and how
+many requests were answered by the LLM rather than the fallback ranker.
+
+Usage:
+    python -m benchmarks.bench_compact_output [--requests 30] [--latency-ms 300] [--token-ms 10]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import StubState, running_stub
+from config import config
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.prompt_builder import PRESET_PRICE_RANGES, RESPONSE_FORMATS
+from services.recommendation_cache import RecommendationCache
+
+
+async def run_format(product_service, base_url, response_format, users):
+    """
+    Send every (preferences, history) pair once with the given response format
+    """
+    config['LLM_RESPONSE_FORMAT'] = response_format
+    service = LLMService(
+        product_service,
+        llm_client=LLMClient(AiohttpTransport(base_url, api_key='stub')),
+        cache=RecommendationCache(ttl_seconds=0),
+        latency_budget_ms=0,
+    )
+    catalog = product_service.catalog
+    latencies, tokens, parse_us, answered = [], [], [], 0
+    for preferences, history in users:
+        start = time.perf_counter()
+        response = await service.generate_recommendations(preferences, history)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.get('source') == 'fallback' or not response.get('recommendations'):
+            continue
+        answered += 1
+        tokens.append(response['usage'].get('completion_tokens') or 0)
+
+    # Parse cost alone, on replies captured from the stub for the same prompts
+    parse = service._parse_compact_response if response_format == 'compact' else \
+        service._parse_recommendation_response
+    prompts = [service.build_prompt(p, h, catalog) for p, h in users]
+    replies = []
+    for prompt in prompts:
+        reply = await service.llm_client.chat_completion(
+            model=service.model_name, messages=service._build_messages(prompt),
+            max_tokens=service.completion_limit(prompt), temperature=0
+        )
+        replies.append((reply['choices'][0]['message']['content'], prompt.id_map))
+    for content, id_map in replies * 20:
+        start = time.perf_counter()
+        parse(content, catalog, id_map)
+        parse_us.append((time.perf_counter() - start) * 1e6)
+    await service.close()
+    return {
+        'completion_tokens': float(np.mean(tokens)) if tokens else 0.0,
+        'max_tokens': service.completion_limit(prompts[0]),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'parse_us': float(np.percentile(parse_us, 50)),
+        'answered': answered,
+        'requests': len(users),
+    }
+
+
+async def run(args):
+    product_service = ProductService()
+    catalog = product_service.catalog
+    categories = sorted(catalog.categories())
+    ids = [p['id'] for p in catalog.products_at(list(range(min(len(catalog), 200))))]
+    rng = random.Random(args.seed)
+    users = [
+        ({'priceRange': rng.choice(PRESET_PRICE_RANGES), 'categories': rng.sample(categories, 1), 'brands': []},
+         rng.sample(ids, rng.randint(0, 3)))
+        for _ in range(args.requests)
+    ]
+    state = StubState(latency_ms=args.latency_ms, chunk_chars=4, chunk_delay_ms=args.token_ms, seed=args.seed)
+    results = {}
+    async with running_stub(state) as (base_url, state):
+        for response_format in RESPONSE_FORMATS:
+            results[response_format] = await run_format(product_service, base_url, response_format, users)
+
+    print(f"{'format':<9}{'completion tok':>15}{'max_tokens':>11}{'p50 ms':>9}{'p99 ms':>9}{'parse us':>10}"
+          f"{'answered':>10}")
+    for response_format, stats in results.items():
+        print(f"{response_format:<9}{stats['completion_tokens']:>15.1f}{stats['max_tokens']:>11}"
+              f"{stats['p50_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['parse_us']:>10.1f}"
+              f"{stats['answered']:>6}/{stats['requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='Stub time to first token')
+    parser.add_argument('--token-ms', type=float, default=10.0, help='Stub generation time per token')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
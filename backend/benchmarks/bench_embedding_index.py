@@ -0,0 +1,113 @@
+"""
+Embedding index build and query latency at 10k, 100k and 1M products
+
+Query latency is measured on synthetic topic-structured vectors written with
+EmbeddingIndex.write_vectors; text embedding and incremental rebuild
+throughput are measured on synthetic products.
+
+Usage:
+    python -m benchmarks.bench_embedding_index [--sizes 10000 100000 1000000] [--queries 200]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_products
+from services.embedding_index import EmbeddingIndex
+
+
+def synthetic_vectors(count, dim, topics=500, terms_per_topic=24, noise_terms=8, seed=7):
+    """
+    Sparse non-negative vectors drawn from a mixture of topics
+    """
+    rng = np.random.default_rng(seed)
+    topic_terms = rng.integers(0, dim, size=(topics, terms_per_topic))
+    vectors = np.zeros((count, dim), dtype=np.float32)
+    chunk = 100_000
+    for start in range(0, count, chunk):
+        rows = min(chunk, count - start)
+        topic = rng.integers(0, topics, size=rows)
+        terms = np.concatenate(
+            (topic_terms[topic][:, rng.permutation(terms_per_topic)[:12]],
+             rng.integers(0, dim, size=(rows, noise_terms))),
+            axis=1,
+        )
+        block = vectors[start:start + rows]
+        np.add.at(block, (np.repeat(np.arange(rows), terms.shape[1]), terms.ravel()), 1.0)
+        np.log1p(block, out=block)
+    return vectors
+
+
+def percentiles(samples):
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 99))
+
+
+def bench_queries(size, dim, queries, nprobe):
+    with tempfile.TemporaryDirectory() as path:
+        index = EmbeddingIndex(path, dim=dim, nprobe=nprobe)
+        start = time.perf_counter()
+        index.write_vectors([f"prod{i}" for i in range(size)], synthetic_vectors(size, dim))
+        build_s = time.perf_counter() - start
+
+        rng = np.random.default_rng(1)
+        mask = rng.random(size) < 0.3
+        single, masked, batched = [], [], []
+        for _ in range(queries):
+            browsed = rng.integers(0, size, size=3)
+            start = time.perf_counter()
+            index.similar_to(browsed, k=20)
+            single.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            index.similar_to(browsed, k=20, mask=mask)
+            masked.append((time.perf_counter() - start) * 1000)
+
+        profiles = np.stack([index.profile(rng.integers(0, size, size=3)) for _ in range(32)])
+        for _ in range(max(queries // 10, 1)):
+            start = time.perf_counter()
+            index.search(profiles, k=20)
+            batched.append((time.perf_counter() - start) * 1000 / len(profiles))
+        return build_s, percentiles(single), percentiles(masked), percentiles(batched)
+
+
+def bench_text(count, dim):
+    with tempfile.TemporaryDirectory() as path:
+        products = generate_products(count)
+        index = EmbeddingIndex(path, dim=dim)
+        start = time.perf_counter()
+        index.build(products)
+        full_s = time.perf_counter() - start
+
+        for product in products[::100]:
+            product['description'] += ' Updated.'
+        start = time.perf_counter()
+        stats = index.build(products)
+        incremental_s = time.perf_counter() - start
+        return full_s, incremental_s, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--text-products', type=int, default=20_000)
+    args = parser.parse_args()
+
+    full_s, incremental_s, stats = bench_text(args.text_products, args.dim)
+    print(f"text build: {args.text_products} products in {full_s:.2f}s; "
+          f"incremental rebuild ({stats['embedded']} changed) in {incremental_s:.2f}s")
+
+    print(f"{'products':>10} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'masked p50':>11} {'masked p99':>11} {'batched/q ms':>13}")
+    for size in args.sizes:
+        build_s, single, masked, batched = bench_queries(size, args.dim, args.queries, args.nprobe)
+        print(f"{size:>10} {build_s:>8.1f} {single[0]:>8.3f} {single[1]:>8.3f} "
+              f"{masked[0]:>11.3f} {masked[1]:>11.3f} {batched[0]:>13.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Microbenchmarks of the request pipeline at several catalog sizes
+
+For each size a synthetic snapshot is written and loaded through
+ProductService, with its search index, embedding index and similarity table.
+Then, with seeded random inputs, it times:
+
+- product_lookup: ProductService.get_product_by_id
+- product_json: ProductService.get_product_json (pre-encoded /api/products/{id} body)
+- products_by_ids: ProductService.get_products_by_ids with 10 IDs
+- candidate_filter: preference mask and top-k selection (CandidateFilter)
+- select_candidates: full candidate selection with a browsing history
+  (similarity table, embedding index, preference filter)
+- prompt_build: LLMService.build_prompt (history lookup, candidates, prompt)
+- parse_response: LLMService._parse_recommendation_response on a stub answer
+
+Usage:
+    python -m benchmarks.bench_pipeline [--sizes 1k 100k] [--iterations 2000] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import build_content
+from benchmarks.synthetic_catalog import CATEGORIES, parse_size, write_catalog
+from config import config
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.prompt_builder import PRESET_PRICE_RANGES
+from services.recommendation_cache import RecommendationCache
+
+
+def summarize(samples):
+    """
+    Latency summary of per-call samples (seconds): throughput and percentiles in microseconds
+    """
+    values = np.asarray(samples) * 1e6
+    return {
+        'calls': len(values),
+        'ops_per_s': round(len(values) / (values.sum() / 1e6), 1),
+        'mean_us': round(float(values.mean()), 2),
+        'p50_us': round(float(np.percentile(values, 50)), 2),
+        'p95_us': round(float(np.percentile(values, 95)), 2),
+        'p99_us': round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def measure(fn, inputs, warmup=20):
+    for args in inputs[:warmup]:
+        fn(*args)
+    samples = []
+    for args in inputs:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def load_services(count, workdir):
+    """
+    Write a synthetic catalog of `count` products and load the services on it
+    """
+    config['DATA_PATH'] = write_catalog(count, os.path.join(workdir, f"products-{count}.catalog"))
+    config['EMBEDDING_INDEX_PATH'] = os.path.join(workdir, f"embeddings-{count}")
+    config['SIMILARITY_TABLE_PATH'] = os.path.join(workdir, f"similarity-{count}")
+    start = time.perf_counter()
+    product_service = ProductService()
+    load_seconds = time.perf_counter() - start
+    llm_service = LLMService(product_service, cache=RecommendationCache(ttl_seconds=0))
+    return product_service, llm_service, load_seconds
+
+
+def run_size(count, iterations, workdir, seed=0):
+    """
+    Run every microbenchmark on one catalog size
+
+    Returns:
+    - dict: Benchmark name -> latency summary, plus 'load_seconds'
+    """
+    product_service, llm_service, load_seconds = load_services(count, workdir)
+    catalog = product_service.catalog
+    rng = random.Random(seed)
+    ids = [catalog.products_at([rng.randrange(count)])[0]['id'] for _ in range(iterations)]
+
+    def preferences():
+        return {
+            'priceRange': rng.choice(PRESET_PRICE_RANGES),
+            'categories': rng.sample(CATEGORIES, rng.choice((1, 1, 2))),
+            'brands': [f"Brand{rng.randrange(500)}"] if rng.random() < 0.2 else [],
+        }
+
+    users = [(preferences(), rng.sample(ids, rng.randint(1, 5))) for _ in range(iterations)]
+
+    def filter_candidates(user_preferences):
+        mask = catalog.candidate_filter.candidate_mask(user_preferences, [])
+        return catalog.candidate_filter.select(user_preferences, [], k=llm_service.candidate_count, mask=mask)
+
+    def select_candidates(user_preferences, history):
+        browsed = catalog.get_many(history)
+        return llm_service._select_candidates(user_preferences, browsed, catalog, k=llm_service.candidate_count)
+
+    prompts = [llm_service.build_prompt(p, h, catalog) for p, h in users[:200]]
+    answers = [(build_content(prompt.text, 5), catalog, prompt.id_map) for prompt in prompts]
+
+    results = {
+        'load_seconds': round(load_seconds, 2),
+        'product_lookup': measure(product_service.get_product_by_id, [(i,) for i in ids]),
+        'product_json': measure(product_service.get_product_json, [(i,) for i in ids]),
+        'products_by_ids': measure(
+            product_service.get_products_by_ids, [(rng.sample(ids, 10),) for _ in range(iterations)]
+        ),
+        'candidate_filter': measure(filter_candidates, [(p,) for p, _ in users]),
+        'select_candidates': measure(select_candidates, users),
+        'prompt_build': measure(lambda p, h: llm_service.build_prompt(p, h, catalog), users),
+        'parse_response': measure(
+            llm_service._parse_recommendation_response, (answers * (iterations // len(answers) + 1))[:iterations]
+        ),
+    }
+    return results
+
+
+def run(sizes, iterations):
+    """
+    Returns:
+    - dict: '<products>' -> results of run_size
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    try:
+        return {str(count): run_size(count, iterations, workdir) for count in sizes}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results):
+    for size, benchmarks in results.items():
+        print(f"{size} products (loaded in {benchmarks['load_seconds']:.1f}s)")
+        for name, stats in benchmarks.items():
+            if name == 'load_seconds':
+                continue
+            print(f"  {name:<20}{stats['p50_us']:>10.1f} us p50{stats['p95_us']:>10.1f} us p95"
+                  f"{stats['p99_us']:>10.1f} us p99{stats['ops_per_s']:>12.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['1k', '100k'], help='Catalog sizes (1k, 100k, 1m or counts)')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run([parse_size(size) for size in args.sizes], args.iterations)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+GET /api/products cost: re-serializing the catalog vs pre-encoded pages
+
+Compares, on a synthetic catalog, the previous full-catalog response
+(materialize every product, then JSONResponse) with the pre-encoded full
+catalog, a cold and a cached filtered page, and a 304 revalidation.
+
+Usage:
+    python -m benchmarks.bench_product_listing [--products 100000]
+"""
+import argparse
+import time
+
+from fastapi.responses import JSONResponse
+
+from benchmarks.synthetic_catalog import generate_products
+from services.catalog_index import CatalogIndex
+from services.product_pages import ProductPages, etag_matches, normalize_page_query
+
+
+class _CatalogHolder:
+    """
+    Minimal stand-in for ProductService: a current catalog and reload hooks
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def add_reload_listener(self, callback):
+        pass
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    args = parser.parse_args()
+
+    catalog = CatalogIndex(generate_products(args.products))
+    pages = ProductPages(_CatalogHolder(catalog))
+    full = pages.listing()
+    query = normalize_page_query(categories=['Electronics'], min_price=20, max_price=200, in_stock=True,
+                                 sort='-rating')
+    page = pages.listing(query, offset=100, limit=50)
+
+    def cold_page():
+        pages.cache.invalidate()
+        pages.body(page)
+
+    results = [
+        ('full catalog, JSONResponse of dicts (before)', timed(lambda: JSONResponse(list(catalog.products)), 1)),
+        ('full catalog, first encode', timed(lambda: pages.body(full), 1)),
+        ('full catalog, pre-encoded', timed(lambda: pages.cached_body(full), 1000)),
+        ('filtered sorted page, cold', timed(cold_page, 20)),
+        ('filtered sorted page, cached', timed(lambda: pages.cached_body(page), 1000)),
+        ('304 revalidation (listing + ETag check)',
+         timed(lambda: etag_matches(full.etag, pages.listing().etag), 1000)),
+    ]
+    print(f"{args.products} products, full response {len(pages.body(full)) / 2**20:.1f} MB")
+    for label, ms in results:
+        print(f"{label:<46}{ms:>10.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
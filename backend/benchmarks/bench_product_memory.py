@@ -0,0 +1,88 @@
+"""
+Bytes per product: list of product dicts vs the columnar ProductTable
+
+For each catalog size a synthetic catalog is written to disk and loaded in a
+fresh process, once as dicts (json.load, the previous in-memory
+representation) and once as a ProductTable (streamed from JSONL, so no dicts
+are built). Reported per product: the process RSS growth, and for the table
+also the exact size of its column arrays.
+
+Usage:
+    python -m benchmarks.bench_product_memory [--sizes 100000 1000000]
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic_catalog import generate_products
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def child(fmt, path):
+    """
+    Load one representation and print its memory use as JSON
+    """
+    from services.catalog_loader import load_jsonl
+
+    baseline = rss_bytes()
+    if fmt == 'dicts':
+        with open(path) as file:
+            products = json.load(file)
+        count, columns = len(products), None
+    else:
+        products = load_jsonl(path)
+        count, columns = len(products), products.nbytes
+    gc.collect()
+    print(json.dumps({'count': count, 'rss': rss_bytes() - baseline, 'columns': columns}))
+
+
+def measure(fmt, path):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_product_memory', '--child', fmt, path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--child', nargs=2, metavar=('FORMAT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='product-memory-')
+    print(f"{'products':>10}{'dicts RSS':>14}{'table RSS':>14}{'table columns':>16}{'saving':>9}")
+    for size in args.sizes:
+        json_path = os.path.join(workdir, f"products-{size}.json")
+        jsonl_path = os.path.join(workdir, f"products-{size}.jsonl")
+        products = generate_products(size)
+        with open(json_path, 'w') as file:
+            json.dump(products, file)
+        with open(jsonl_path, 'w') as file:
+            for product in products:
+                file.write(json.dumps(product) + '\n')
+        del products
+
+        dicts = measure('dicts', json_path)
+        table = measure('table', jsonl_path)
+        per_dict = dicts['rss'] / size
+        per_row = table['rss'] / size
+        print(f"{size:>10}{per_dict:>10.0f} B/p{per_row:>10.0f} B/p{table['columns'] / size:>12.0f} B/p"
+              f"{per_dict / per_row:>8.1f}x")
+        os.remove(json_path)
+        os.remove(jsonl_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Prompt assembly with shared prefixes: build time and prompt bytes reused
+
+Builds recommendation prompts for simulated users of a synthetic catalog.
+Users pick one or two categories and a preset price range; some also name
+brands (their prompts get no catalog sections). Every user has a short
+browsing history. Reported: build time per prompt with the prefix cache and
+with every prefix rendered again, the share of prompt bytes taken from
+cached prefixes, and the share of prompts that start with a prefix an
+earlier prompt already sent (what provider-side prompt caching can match).
+
+Usage:
+    python -m benchmarks.bench_prompt_prefix [--products 100000] [--users 2000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.synthetic_catalog import CATEGORIES, generate_products
+from services.catalog_index import CatalogIndex
+from services.prompt_builder import PRESET_PRICE_RANGES, PromptBuilder
+from services.tokenizer import Tokenizer
+
+
+def simulated_users(catalog, count, rng):
+    users = []
+    for _ in range(count):
+        preferences = {
+            'priceRange': rng.choice(PRESET_PRICE_RANGES),
+            'categories': rng.sample(CATEGORIES, rng.choice((1, 1, 2))),
+            'brands': [f"Brand{rng.randrange(500)}"] if rng.random() < 0.2 else [],
+        }
+        history = catalog.products_at(rng.sample(range(len(catalog.products)), rng.randint(0, 6)))
+        users.append((preferences, history))
+    return users
+
+
+def run(builder, catalog, users, cold):
+    seen = set()
+    shared = 0
+    start = time.perf_counter()
+    for preferences, history in users:
+        if cold:
+            builder._prefixes.invalidate()
+        browsed = catalog.positions_of([p['id'] for p in history])
+        mask = catalog.candidate_filter.candidate_mask(preferences, browsed)
+        candidates = catalog.products_at(catalog.candidate_filter.select(preferences, browsed, k=20, mask=mask))
+        prompt = builder.build(preferences, history, candidates, catalog)
+        shared += prompt.prefix_version in seen
+        seen.add(prompt.prefix_version)
+    elapsed = (time.perf_counter() - start) / len(users) * 1000
+    return elapsed, shared / len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    catalog = CatalogIndex(generate_products(args.products))
+    users = simulated_users(catalog, args.users, random.Random(0))
+    builder = PromptBuilder(Tokenizer.from_config(), 1500)
+
+    start = time.perf_counter()
+    builder.prepare(catalog)
+    print(f"{args.products} products: {builder.stats()['catalog_sections']} catalog sections rendered "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    cold_ms, _ = run(builder, catalog, users, cold=True)
+    builder.prepare(catalog)
+    builder.bytes_reused = builder.bytes_rendered = 0
+    warm_ms, shared = run(builder, catalog, users, cold=False)
+    stats = builder.stats()
+    print(f"{'build per prompt, prefixes rendered each time':<48}{cold_ms:8.3f} ms")
+    print(f"{'build per prompt, cached prefixes':<48}{warm_ms:8.3f} ms")
+    print(f"{'prompt bytes reused from cached prefixes':<48}{stats['reuse_ratio']:8.1%}")
+    print(f"{'prompts starting with an already-sent prefix':<48}{shared:8.1%}   ({stats['prefixes']} distinct)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Full-text search benchmarks: index build, typeahead, full queries and filtered queries
+
+Runs on a synthetic catalog (1M products by default) through
+CatalogIndex.search, so filter masks are included in the timings. Queries
+are drawn from the indexed vocabulary: typeahead queries are 1-3 words with
+a partly typed last word, full queries are whole words.
+
+Usage:
+    python -m benchmarks.bench_search [--products 1000000] [--queries 2000]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import CATEGORIES, generate_products
+from services.catalog_index import CatalogIndex
+from services.product_table import ProductTable
+from services.search_index import SearchIndex
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return f"p50 {np.percentile(samples, 50):6.2f} ms   p99 {np.percentile(samples, 99):6.2f} ms   " \
+           f"max {samples.max():6.2f} ms"
+
+
+def run(catalog, queries, **options):
+    # Warm up any lazily built state (sort orders, first-touch pages)
+    for query in queries[:20]:
+        catalog.search(query, **options)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        catalog.search(query, **options)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    table = ProductTable.from_products(generate_products(args.products))
+    start = time.perf_counter()
+    index = SearchIndex.build(table)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    reused = SearchIndex.build(table, previous=index)
+    reuse = time.perf_counter() - start
+    assert reused is index
+    catalog = CatalogIndex(table, search_index=index)
+    print(f"{args.products} products, {index.terms} terms, {len(index.docs)} postings "
+          f"({index.nbytes / 2**20:.0f} MB)")
+    print(f"build {build:.2f}s, reload with unchanged text {reuse:.2f}s")
+
+    rng = random.Random(0)
+    words = [term.decode() for term in index._sorted_terms if not term.isdigit()]
+    numbers = [term.decode() for term in index._sorted_terms if term.isdigit()]
+
+    def phrase(count):
+        return [rng.choice(words if rng.random() < 0.8 else numbers) for _ in range(count)]
+
+    typeahead = []
+    for _ in range(args.queries):
+        parts = phrase(rng.randint(1, 3))
+        parts[-1] = parts[-1][:rng.randint(1, len(parts[-1]))]
+        typeahead.append(' '.join(parts))
+    full = [' '.join(phrase(rng.randint(1, 3))) for _ in range(args.queries)]
+
+    print(f"{'typeahead':<32}{run(catalog, typeahead)}")
+    print(f"{'typeahead, category + price':<32}"
+          f"{run(catalog, typeahead, categories=[CATEGORIES[4]], min_price=20, max_price=200)}")
+    print(f"{'typeahead, brand + in stock':<32}{run(catalog, typeahead, brands=['Brand7', 'Brand8'], in_stock=True)}")
+    print(f"{'full query (exact BM25)':<32}{run(catalog, full, prefix=False)}")
+    print(f"{'full query, category':<32}{run(catalog, full, prefix=False, categories=[CATEGORIES[2]])}")
+
+
+if __name__ == '__main__':
+    main()
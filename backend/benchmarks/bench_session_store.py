@@ -0,0 +1,89 @@
+"""
+Session store: view recording, history lookups, memory and snapshots
+
+Fills a SessionStore with --sessions sessions of --views random views each
+from a synthetic catalog and reports the cost per recorded view (including
+the affinity updates), per history lookup and per profile summary, the
+memory held per session, and the time and size of a snapshot and of
+loading it back. A recommendation request that sends a session id instead
+of its history is also compared by JSON body size.
+
+Usage:
+    python -m benchmarks.bench_session_store [--sessions 10000] [--views 50] [--products 1k]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_catalog import generate_products, parse_size
+from services.session_store import SessionStore
+
+
+def per_call(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--views', type=int, default=50, help='Views per session (SESSION_MAX_VIEWS)')
+    parser.add_argument('--products', default='1k')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    products = generate_products(parse_size(args.products))
+    session_ids = [f"session-{i:08d}" for i in range(args.sessions)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessions.json')
+        store = SessionStore(max_sessions=args.sessions, max_views=args.views, snapshot_path=path)
+
+        events = [(session_id, rng.choice(products)) for _ in range(args.views) for session_id in session_ids]
+        tracemalloc.start()
+        start = time.perf_counter()
+        for session_id, product in events:
+            store.record_view(session_id, product)
+        record_us = (time.perf_counter() - start) / len(events) * 1e6
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # Full buffers now: every further view also forgets the oldest one
+        more = [(rng.choice(session_ids), rng.choice(products)) for _ in range(100000)]
+        evicting_us = per_call(lambda event: store.record_view(*event), more)
+        lookups = [rng.choice(session_ids) for _ in range(100000)]
+        history_us = per_call(store.history, lookups)
+        profile_us = per_call(store.profile, lookups[:10000])
+
+        start = time.perf_counter()
+        store.snapshot()
+        snapshot_s = time.perf_counter() - start
+        size = os.path.getsize(path)
+        restored = SessionStore(max_sessions=args.sessions, max_views=args.views, snapshot_path=path)
+        start = time.perf_counter()
+        restored.load()
+        load_s = time.perf_counter() - start
+
+    history = store.history(session_ids[0])
+    with_history = len(json.dumps({'preferences': {}, 'browsing_history': history}))
+    with_session = len(json.dumps({'preferences': {}, 'session_id': session_ids[0]}))
+
+    print(f"{args.sessions} sessions x {args.views} views, {len(products)} products")
+    print(f"record view (filling)              {record_us:8.2f} us")
+    print(f"record view (full ring buffer)     {evicting_us:8.2f} us")
+    print(f"history lookup                     {history_us:8.2f} us")
+    print(f"profile summary                    {profile_us:8.2f} us")
+    print(f"memory per session                 {held / args.sessions / 1024:8.1f} KiB")
+    print(f"snapshot                           {snapshot_s:8.2f} s  ({size / 1e6:.1f} MB)")
+    print(f"load snapshot                      {load_s:8.2f} s  ({len(restored)} sessions)")
+    print(f"request body with history          {with_history:8d} bytes")
+    print(f"request body with session id       {with_session:8d} bytes")
+
+
+if __name__ == '__main__':
+    main()
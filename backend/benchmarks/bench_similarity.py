@@ -0,0 +1,93 @@
+"""
+Similar-products table: full build, incremental update and candidate merge latency
+
+Builds the table for a synthetic catalog, then updates it after changing a
+small fraction of the products (prices and tags edited, some removed, some
+added) and checks the result matches a full rebuild. Candidate latency is
+SimilarityTable.related on the memory-mapped table for browsing histories
+of 1-10 products, with and without a preference mask.
+
+Usage:
+    python -m benchmarks.bench_similarity [--products 1000000] [--changed 0.0002] [--requests 2000]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_products
+from services.candidate_filter import CandidateFilter
+from services.product_table import ProductTable
+from services.similarity_table import SimilarityTable
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1e6
+    return f"p50 {np.percentile(samples, 50):8.1f} us   p99 {np.percentile(samples, 99):8.1f} us"
+
+
+def timed(fn, histories):
+    samples = []
+    for history in histories:
+        start = time.perf_counter()
+        fn(history)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def edit_catalog(products, fraction, rng):
+    """
+    Copy of the catalog with `fraction` of its products edited, removed or added
+    """
+    products = [dict(product) for product in products]
+    count = max(1, int(len(products) * fraction))
+    for i in rng.sample(range(len(products)), count):
+        products[i]['price'] = round(products[i]['price'] * rng.uniform(0.5, 2.0), 2)
+    for i in rng.sample(range(len(products)), count):
+        products[i]['tags'] = sorted(rng.sample(['gift', 'eco', 'travel', 'smart', 'classic'], 2))
+    for i in sorted(rng.sample(range(len(products)), count), reverse=True):
+        del products[i]
+    for i, product in enumerate(rng.sample(products, count)):
+        products.append(dict(product, id=f"added{i:07d}"))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--changed', type=float, default=0.0002, help='Fraction of products edited per kind')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    products = generate_products(args.products)
+    table = ProductTable.from_products(products)
+    start = time.perf_counter()
+    similarity = SimilarityTable.build(table)
+    build = time.perf_counter() - start
+    print(f"{args.products} products, {similarity.k} neighbours each ({similarity.nbytes / 2**20:.0f} MB)")
+    print(f"{'full build':<40}{build:8.2f} s")
+
+    edited = ProductTable.from_products(edit_catalog(products, args.changed, rng))
+    start = time.perf_counter()
+    updated = SimilarityTable.build(edited, previous=similarity)
+    update = time.perf_counter() - start
+    rebuilt = SimilarityTable.build(edited)
+    mismatched = int((updated.neighbors != rebuilt.neighbors).any(axis=1).sum())
+    print(f"{'incremental update':<40}{update:8.2f} s   ({updated.recomputed} of {len(updated)} rows "
+          f"recomputed, {mismatched} differ from a full rebuild)")
+
+    with tempfile.TemporaryDirectory() as path:
+        similarity.save(path + '/similarity')
+        mapped = SimilarityTable.open(path + '/similarity')
+        histories = [rng.sample(range(len(table)), rng.randint(1, 10)) for _ in range(args.requests)]
+        candidate_filter = CandidateFilter.from_table(table)
+        mask = candidate_filter.mask(categories=['Electronics', 'Home'], max_price=200.0, in_stock=True)
+        print(f"{'related, no filter':<40}{timed(lambda h: mapped.related(h, k=20), histories)}")
+        print(f"{'related, preference mask':<40}{timed(lambda h: mapped.related(h, k=20, mask=mask), histories)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Time to first recommendation: streaming vs. blocking responses
+
+Runs both LLMService paths against the local stub, which generates its answer
+in timed chunks, and reports time to first recommendation and total time.
+
+Usage:
+    python -m benchmarks.bench_streaming [--requests 20] [--latency-ms 300] [--chunk-delay-ms 15]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import StubState, running_stub
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.recommendation_cache import RecommendationCache
+
+
+async def run(args):
+    product_service = ProductService()
+    state = StubState(latency_ms=args.latency_ms, chunk_delay_ms=args.chunk_delay_ms)
+    async with running_stub(state) as (base_url, state):
+        service = LLMService(
+            product_service,
+            llm_client=LLMClient(AiohttpTransport(base_url, api_key='stub')),
+            cache=RecommendationCache(ttl_seconds=0),
+        )
+        preferences = {'priceRange': 'all', 'categories': ['Electronics'], 'brands': []}
+
+        blocking = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            await service.generate_recommendations(preferences, ['prod002'])
+            blocking.append((time.perf_counter() - start) * 1000)
+
+        first, total = [], []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            first_at = None
+            async for event, _ in service.stream_recommendations(preferences, ['prod002']):
+                if event == 'recommendation' and first_at is None:
+                    first_at = time.perf_counter()
+            total.append((time.perf_counter() - start) * 1000)
+            first.append((first_at - start) * 1000)
+        await service.close()
+
+    print(f"{'mode':<10} {'first rec p50 ms':>17} {'total p50 ms':>13}")
+    print(f"{'blocking':<10} {np.percentile(blocking, 50):>17.1f} {np.percentile(blocking, 50):>13.1f}")
+    print(f"{'streaming':<10} {np.percentile(first, 50):>17.1f} {np.percentile(total, 50):>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='Stub time to first token')
+    parser.add_argument('--chunk-delay-ms', type=float, default=15.0, help='Stub time per 16-char chunk')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
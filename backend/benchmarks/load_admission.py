@@ -0,0 +1,131 @@
+"""
+Recommendation traffic spike with and without admission control
+
+Starts serve.py on a synthetic catalog with the stub LLM, once with
+admission control disabled (ADMISSION_MAX_CONCURRENCY=0) and once enabled.
+Each run sends open-loop recommendation requests at --rate per second for
+--seconds. Every request uses a distinct browsing history, so it misses the
+cache. Each request carries X-Request-Timeout-Ms and is abandoned by the
+client at that deadline. Meanwhile a few loops fetch /api/products/{id} to
+show that product reads are unaffected.
+
+LLM calls are limited to --llm-concurrency in flight (LLM_MAX_CONCURRENCY),
+so the LLM can serve about llm_concurrency / latency requests per second and
+a higher --rate overloads it. Reported per run: answered in time (by the
+LLM or the fallback ranker), shed with 429, abandoned at the client
+deadline, p50/p99 of the answered requests, product read p99, and the LLM
+calls still queued or running when the spike ends (work for clients that
+are gone).
+
+Usage:
+    python -m benchmarks.load_admission [--rate 60] [--seconds 10] [--timeout-ms 2000] [--llm-latency-ms 500]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+import numpy as np
+
+from benchmarks.load_http import ServerProcess, discover
+from benchmarks.synthetic_catalog import parse_size
+
+
+async def recommendation(session, base, body, timeout_ms, outcomes, latencies):
+    start = time.perf_counter()
+    try:
+        async with session.post(f"{base}/api/recommendations", json=body,
+                                headers={'X-Request-Timeout-Ms': str(timeout_ms)},
+                                timeout=aiohttp.ClientTimeout(total=timeout_ms / 1000)) as response:
+            payload = json.loads(await response.read())
+    except asyncio.TimeoutError:
+        outcomes['abandoned'] += 1
+        return
+    except aiohttp.ClientError:
+        outcomes['error'] += 1
+        return
+    if response.status == 429:
+        outcomes['shed'] += 1
+        return
+    if response.status != 200:
+        outcomes['error'] += 1
+        return
+    latencies.append((time.perf_counter() - start) * 1000)
+    outcomes[payload.get('source', 'llm')] += 1
+
+
+async def product_reads(session, base, ids, stop, latencies, rng):
+    while not stop.is_set():
+        start = time.perf_counter()
+        async with session.get(f"{base}/api/products/{rng.choice(ids)}") as response:
+            await response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def spike(base, args):
+    rng = random.Random(0)
+    outcomes = {'llm': 0, 'cache': 0, 'fallback': 0, 'stale': 0, 'shed': 0, 'abandoned': 0, 'error': 0}
+    latencies, product_latencies = [], []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        ids, categories = await discover(session, base)
+        stop = asyncio.Event()
+        readers = [asyncio.ensure_future(product_reads(session, base, ids, stop, product_latencies, rng))
+                   for _ in range(4)]
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(args.rate * args.seconds)):
+            await asyncio.sleep(max(start + i / args.rate - time.perf_counter(), 0))
+            body = {
+                'preferences': {'priceRange': 'all', 'categories': [rng.choice(categories)], 'brands': []},
+                'browsing_history': rng.sample(ids, 3),
+            }
+            tasks.append(asyncio.ensure_future(
+                recommendation(session, base, body, args.timeout_ms, outcomes, latencies)
+            ))
+        await asyncio.gather(*tasks)
+        stop.set()
+        await asyncio.gather(*readers)
+        async with session.get(f"{base}/api/llm/backends") as response:
+            backlog = json.loads(await response.read())['active']
+    values = np.asarray(latencies or [0.0])
+    return {
+        **outcomes,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'product_p99_ms': float(np.percentile(product_latencies or [0.0], 99)),
+        'llm_backlog': backlog,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=60.0, help='Recommendation requests per second')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--timeout-ms', type=float, default=2000.0, help='Client deadline per request')
+    parser.add_argument('--llm-latency-ms', type=float, default=500.0)
+    parser.add_argument('--llm-concurrency', type=int, default=8, help='LLM calls in flight (LLM_MAX_CONCURRENCY)')
+    parser.add_argument('--admission-concurrency', type=int, default=8, help='ADMISSION_MAX_CONCURRENCY when enabled')
+    parser.add_argument('--products', default='100k')
+    args = parser.parse_args()
+
+    print(f"{'admission':<10}{'llm':>6}{'fallback':>9}{'shed':>6}{'abandoned':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'products p99':>14}{'llm backlog':>13}")
+    for label, slots in (('off', 0), ('on', args.admission_concurrency)):
+        env = {
+            'ADMISSION_MAX_CONCURRENCY': str(slots),
+            'LLM_MAX_CONCURRENCY': str(args.llm_concurrency),
+            'LLM_LATENCY_BUDGET_MS': '0',
+            'RECOMMENDATION_CACHE_TTL': '0',
+        }
+        with ServerProcess(parse_size(args.products), 1, args.llm_latency_ms, env=env) as base:
+            r = asyncio.run(spike(base, args))
+        print(f"{label:<10}{r['llm']:>6}{r['fallback']:>9}{r['shed']:>6}{r['abandoned']:>10}{r['p50_ms']:>9.0f}"
+              f"{r['p99_ms']:>9.0f}{r['product_p99_ms']:>14.1f}{r['llm_backlog']:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Load test of request coalescing against the local chat-completions stub
+
+Simulates a campaign burst: many concurrent requests with the default
+preferences and empty history. Runs once without and once with single-flight
+coalescing and reports upstream LLM calls and latency for each. The response
+cache is disabled so only coalescing is measured.
+
+Usage:
+    python -m benchmarks.load_coalescing [--requests 300] [--latency-ms 500]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import StubState, running_stub
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.recommendation_cache import RecommendationCache
+
+DEFAULT_PREFERENCES = {'priceRange': 'all', 'categories': [], 'brands': []}
+
+
+async def burst(product_service, coalesce, args):
+    state = StubState(latency_ms=args.latency_ms)
+    async with running_stub(state) as (base_url, state):
+        service = LLMService(
+            product_service,
+            llm_client=LLMClient(AiohttpTransport(base_url, api_key='stub'), max_concurrency=args.limit),
+            cache=RecommendationCache(ttl_seconds=0),
+            coalesce=coalesce,
+        )
+        latencies = []
+
+        async def one():
+            start = time.perf_counter()
+            result = await service.generate_recommendations(dict(DEFAULT_PREFERENCES), [])
+            latencies.append((time.perf_counter() - start) * 1000)
+            return 'error' not in result
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        await service.close()
+        return {
+            'ok': sum(results),
+            'upstream_calls': state.requests,
+            'coalesced': service.single_flight.coalesced,
+            'elapsed_s': elapsed,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+        }
+
+
+async def run(args):
+    product_service = ProductService()
+    print(f"{'mode':<14} {'ok':>5} {'upstream':>9} {'coalesced':>10} {'elapsed s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, coalesce in (('independent', False), ('single-flight', True)):
+        r = await burst(product_service, coalesce, args)
+        print(f"{label:<14} {r['ok']:>5} {r['upstream_calls']:>9} {r['coalesced']:>10} "
+              f"{r['elapsed_s']:>10.2f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--latency-ms', type=float, default=500.0)
+    parser.add_argument('--limit', type=int, default=32, help='LLM client concurrency limit')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
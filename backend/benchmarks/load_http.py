@@ -0,0 +1,270 @@
+"""
+HTTP load generator: throughput and latency percentiles for each API endpoint
+
+Each endpoint is loaded in turn for a fixed time by a fixed number of
+concurrent connections, with seeded request parameters:
+
+- product: GET /api/products/{id}
+- products_page: GET /api/products, one category sorted by rating, at a random offset
+- search: GET /api/search with a typeahead query
+- recommendations: POST /api/recommendations with random preferences and history
+- recommendations_stream: POST /api/recommendations/stream, reading the whole stream
+
+Product IDs and categories are read from the server, so any running backend
+can be targeted with --url. Without --url a synthetic catalog is written and
+served by serve.py, with the deterministic stub from
+benchmarks/stub_llm_server.py as the LLM, so no API key is needed.
+
+Usage:
+    python -m benchmarks.load_http [--products 100k] [--workers 1] [--seconds 10] [--concurrency 32]
+    python -m benchmarks.load_http --url http://localhost:5000 [--endpoints search product]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+import numpy as np
+
+from benchmarks.synthetic_catalog import parse_size, write_catalog
+
+ENDPOINTS = ('product', 'products_page', 'search', 'recommendations', 'recommendations_stream')
+PRICE_RANGES = ('all', 'low', 'medium', 'high')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base, workers=1, timeout=600):
+    """
+    Wait until /readyz has answered 200 from `workers` distinct worker processes
+    """
+    deadline = time.time() + timeout
+    seen = set()
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base + '/readyz', timeout=2) as response:
+                seen.add(json.loads(response.read())['pid'])
+            if len(seen) >= workers:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{base} did not become ready")
+
+
+class ServerProcess:
+    """
+    serve.py on a synthetic catalog, with the stub LLM, as a context manager yielding the base URL
+    """
+
+    def __init__(self, products, workers=1, llm_latency_ms=200.0, env=None):
+        """
+        Parameters:
+        - products (int): Synthetic catalog size
+        - workers (int): serve.py worker processes
+        - llm_latency_ms (float): Stub LLM latency (seeded +/-25% jitter)
+        - env (dict): Extra environment variables for the server
+        """
+        self.products = products
+        self.workers = workers
+        self.llm_latency_ms = llm_latency_ms
+        self.env = env or {}
+        self.process = None
+        self.stub = None
+        self.workdir = None
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix='load-http-')
+        stub_port, port = free_port(), free_port()
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub_llm_server', '--port', str(stub_port),
+             '--latency-ms', str(self.llm_latency_ms), '--jitter-ms', str(self.llm_latency_ms / 4), '--seed', '0'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        env = dict(
+            os.environ,
+            DATA_PATH=write_catalog(self.products, os.path.join(self.workdir, 'products.catalog')),
+            EMBEDDING_INDEX_PATH=os.path.join(self.workdir, 'embeddings'),
+            SIMILARITY_TABLE_PATH=os.path.join(self.workdir, 'similarity'),
+            CATALOG_WATCH_INTERVAL='0',
+            LLM_API_BASE=f"http://127.0.0.1:{stub_port}/v1",
+            OPENAI_API_KEY='stub',
+            **self.env,
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(self.workers)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base, self.workers)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return base
+
+    def __exit__(self, *exc):
+        for process in (self.process, self.stub):
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def discover(session, base, count=500):
+    """
+    Product IDs and categories to build requests from
+    """
+    async with session.get(f"{base}/api/products", params={'limit': count}) as response:
+        products = json.loads(await response.read())['products']
+    return [p['id'] for p in products], sorted({p['category'] for p in products})
+
+
+def request_factory(endpoint, ids, categories, rng):
+    """
+    Returns a function producing (method, path, json body) for one request to `endpoint`
+    """
+    words = ['wireless', 'premium', 'organic', 'portable', 'smart', 'compact', 'classic', 'outdoor', 'travel']
+
+    def preferences():
+        return {
+            'preferences': {
+                'priceRange': rng.choice(PRICE_RANGES),
+                'categories': rng.sample(categories, min(len(categories), rng.choice((1, 1, 2)))),
+                'brands': [],
+            },
+            'browsing_history': rng.sample(ids, min(len(ids), rng.randint(0, 4))),
+        }
+
+    if endpoint == 'product':
+        return lambda: ('GET', f"/api/products/{rng.choice(ids)}", None)
+    if endpoint == 'products_page':
+        return lambda: ('GET', f"/api/products?category={rng.choice(categories)}&sort=-rating&limit=20"
+                               f"&offset={rng.randrange(0, 2000)}", None)
+    if endpoint == 'search':
+        def search():
+            query = ' '.join(rng.sample(words, rng.randint(1, 2)))
+            return 'GET', f"/api/search?q={query[:rng.randint(3, len(query))]}&limit=10", None
+        return search
+    if endpoint == 'recommendations':
+        return lambda: ('POST', '/api/recommendations', preferences())
+    if endpoint == 'recommendations_stream':
+        return lambda: ('POST', '/api/recommendations/stream', preferences())
+    raise ValueError(f"unknown endpoint '{endpoint}' (use {', '.join(ENDPOINTS)})")
+
+
+async def load(session, base, make_request, seconds, concurrency):
+    """
+    Send requests from `concurrency` loops for `seconds`
+
+    Returns:
+    - dict: requests, throughput, latency percentiles (ms), errors and status codes
+    """
+    latencies = []
+    statuses = {}
+    errors = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+
+    async def loop():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            method, path, body = make_request()
+            sent = time.perf_counter()
+            try:
+                async with session.request(method, base + path, json=body) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                    if response.status >= 400:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - sent)
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    values = np.asarray(latencies or [0.0]) * 1000
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'errors': errors,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run_endpoints(base, endpoints, seconds, concurrency, seed=0):
+    """
+    Load each endpoint in turn
+
+    Returns:
+    - dict: Endpoint name -> result of `load`
+    """
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as session:
+        ids, categories = await discover(session, base)
+        results = {}
+        for endpoint in endpoints:
+            # A seed per endpoint, so the streamed recommendations are not cache hits from the blocking run
+            rng = random.Random(seed * 100 + ENDPOINTS.index(endpoint))
+            make_request = request_factory(endpoint, ids, categories, rng)
+            results[endpoint] = await load(session, base, make_request, seconds, concurrency)
+        return results
+
+
+def run(endpoints=ENDPOINTS, seconds=10.0, concurrency=32, url=None, products=100000, workers=1,
+        llm_latency_ms=200.0):
+    """
+    Load `url`, or a serve.py instance started on a synthetic catalog when no URL is given
+    """
+    if url:
+        return asyncio.run(run_endpoints(url.rstrip('/'), endpoints, seconds, concurrency))
+    with ServerProcess(products, workers, llm_latency_ms) as base:
+        return asyncio.run(run_endpoints(base, endpoints, seconds, concurrency))
+
+
+def print_results(results):
+    print(f"{'endpoint':<24}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<24}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}"
+              f"{stats['p99_ms']:>9.1f}{stats['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Load a running backend instead of starting one')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--seconds', type=float, default=10.0, help='Load time per endpoint')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--products', default='100k', help='Synthetic catalog size (1k, 100k, 1m or a count)')
+    parser.add_argument('--workers', type=int, default=1, help='serve.py workers')
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0, help='Stub LLM latency')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.endpoints, args.seconds, args.concurrency, args.url, parse_size(args.products),
+                  args.workers, args.llm_latency_ms)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Tail latency with and without the LLM latency budget
+
+The stub answers with heavy-tailed latency; with a budget, requests the LLM
+cannot serve in time get the local fallback ranking, bounding p99.
+
+Usage:
+    python -m benchmarks.load_latency_budget [--requests 100] [--budget-ms 500] [--latency-ms 1500] [--jitter-ms 1400]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import StubState, running_stub
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.recommendation_cache import RecommendationCache
+
+
+async def run_mode(product_service, budget_ms, args):
+    state = StubState(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=3)
+    async with running_stub(state) as (base_url, state):
+        service = LLMService(
+            product_service,
+            llm_client=LLMClient(AiohttpTransport(base_url, api_key='stub'), max_concurrency=args.requests),
+            cache=RecommendationCache(ttl_seconds=0),
+            coalesce=False,
+            latency_budget_ms=budget_ms,
+        )
+        categories = product_service.catalog.categories()
+        latencies, fallbacks = [], 0
+
+        async def one(i):
+            nonlocal fallbacks
+            preferences = {'priceRange': 'all', 'categories': [categories[i % len(categories)]], 'brands': []}
+            start = time.perf_counter()
+            result = await service.generate_recommendations(preferences, [])
+            latencies.append((time.perf_counter() - start) * 1000)
+            fallbacks += result.get('source') == 'fallback'
+
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        await service.close()
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), fallbacks
+
+
+async def run(args):
+    product_service = ProductService()
+    print(f"{'budget':<10} {'p50 ms':>8} {'p99 ms':>8} {'fallbacks':>10}")
+    for budget in (0, args.budget_ms):
+        p50, p99, fallbacks = await run_mode(product_service, budget, args)
+        label = f"{budget:.0f} ms" if budget else 'none'
+        print(f"{label:<10} {p50:>8.1f} {p99:>8.1f} {fallbacks:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--budget-ms', type=float, default=500.0)
+    parser.add_argument('--latency-ms', type=float, default=1500.0)
+    parser.add_argument('--jitter-ms', type=float, default=1400.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
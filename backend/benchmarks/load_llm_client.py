@@ -0,0 +1,82 @@
+"""
+Load test of the async LLM path against the local chat-completions stub
+
+Fires concurrent recommendation requests through LLMService while a ticker
+task measures event-loop lag, showing that slow completions no longer block
+other work and that the concurrency limit caps upstream load.
+
+Usage:
+    python -m benchmarks.load_llm_client [--requests 200] [--concurrency 100] [--limit 32] [--latency-ms 300]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.stub_llm_server import StubState, running_stub
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_service import LLMService
+from services.product_service import ProductService
+
+
+async def measure_loop_lag(stop, interval=0.01):
+    """
+    Record how late a periodic timer fires; large values mean a blocked loop
+    """
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+    return lags
+
+
+async def run(args):
+    product_service = ProductService()
+    state = StubState(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5)
+    async with running_stub(state) as (base_url, state):
+        client = LLMClient(AiohttpTransport(base_url, api_key='stub', pool_size=args.limit),
+                           max_concurrency=args.limit)
+        service = LLMService(product_service, llm_client=client)
+        categories = product_service.catalog.categories()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one(i):
+            preferences = {'priceRange': 'all', 'categories': [categories[i % len(categories)]], 'brands': []}
+            async with semaphore:
+                start = time.perf_counter()
+                result = await service.generate_recommendations(preferences, ['prod002'])
+                latencies.append((time.perf_counter() - start) * 1000)
+                return 'error' not in result
+
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(measure_loop_lag(stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        lags = await lag_task
+        await service.close()
+
+    print(f"requests: {args.requests}  ok: {sum(results)}  elapsed: {elapsed:.2f}s  "
+          f"throughput: {args.requests / elapsed:.1f} req/s")
+    print(f"latency ms  p50: {np.percentile(latencies, 50):.1f}  p95: {np.percentile(latencies, 95):.1f}  "
+          f"p99: {np.percentile(latencies, 99):.1f}")
+    print(f"upstream peak in-flight: {state.peak_in_flight} (limit {args.limit})")
+    print(f"event loop lag ms  p99: {np.percentile(lags, 99):.2f}  max: {max(lags):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=32, help='LLM client concurrency limit')
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
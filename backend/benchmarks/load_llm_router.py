@@ -0,0 +1,126 @@
+"""
+LLM router under provider rate limits and outages, against local stubs
+
+Fires --requests chat completions from --concurrency callers in each
+scenario and reports how many succeeded, the 429s the stubs sent, retries,
+failovers, the final adaptive concurrency limit and latency percentiles:
+
+- fixed: plain LLMClient with a fixed concurrency of --concurrency against
+  a primary stub that answers 429 above --capacity requests in flight
+- aimd: LLMRouter on the same primary; the concurrency limit adapts to the 429s
+- failover: LLMRouter with the primary and a slower secondary that absorbs
+  what the primary rejects
+- outage: LLMRouter whose primary refuses connections; after
+  LLM_FAILURE_THRESHOLD failures it is skipped and calls go to the secondary
+
+Usage:
+    python -m benchmarks.load_llm_router [--requests 400] [--concurrency 64] [--capacity 8] [--latency-ms 200]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import openai
+
+from benchmarks.load_http import free_port
+from benchmarks.stub_llm_server import StubState, running_stub
+from services.llm_client import AiohttpTransport, LLMClient
+from services.llm_router import LLMBackend, LLMRouter
+
+SCENARIOS = ('fixed', 'aimd', 'failover', 'outage')
+MESSAGES = [{'role': 'user', 'content': 'p1|Wireless Earbuds|Electronics>Audio|SoundWave|79.99|4.5\n'}]
+
+
+async def fire(client, requests, concurrency):
+    """
+    Send `requests` completions from `concurrency` callers
+
+    Returns:
+    - tuple: (latencies in ms of the successful calls, failed calls)
+    """
+    latencies = []
+    failed = 0
+    remaining = iter(range(requests))
+
+    async def caller():
+        nonlocal failed
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                await client.chat_completion(model='stub', messages=MESSAGES, max_tokens=200, temperature=0)
+            except openai.error.OpenAIError:
+                failed += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return latencies, failed
+
+
+def backend(name, base_url, args):
+    return LLMBackend(name, AiohttpTransport(base_url, api_key='stub'), max_concurrency=args.concurrency)
+
+
+async def run_scenario(scenario, args):
+    primary_state = StubState(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4,
+                              max_concurrency=args.capacity, retry_after=args.retry_after, seed=1)
+    secondary_state = StubState(latency_ms=args.latency_ms * 2, jitter_ms=args.latency_ms / 2, seed=2)
+    async with running_stub(primary_state) as (primary_url, _), running_stub(secondary_state) as (secondary_url, _):
+        if scenario == 'fixed':
+            client = LLMClient(AiohttpTransport(primary_url, api_key='stub'), max_concurrency=args.concurrency)
+        elif scenario == 'aimd':
+            client = LLMRouter([backend('primary', primary_url, args)], max_retries=args.max_retries)
+        elif scenario == 'failover':
+            client = LLMRouter([backend('primary', primary_url, args), backend('secondary', secondary_url, args)],
+                               max_retries=args.max_retries)
+        else:
+            down = f"http://127.0.0.1:{free_port()}/v1"
+            client = LLMRouter([backend('primary', down, args), backend('secondary', secondary_url, args)],
+                               max_retries=args.max_retries)
+        start = time.perf_counter()
+        latencies, failed = await fire(client, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - start
+        await client.close()
+
+    router = client.stats() if isinstance(client, LLMRouter) else {'retries': 0, 'failovers': 0}
+    primary = router['backends'][0] if 'backends' in router else None
+    values = np.asarray(latencies or [0.0])
+    return {
+        'succeeded': len(latencies),
+        'failed': failed,
+        'rejected_429': primary_state.rejected + secondary_state.rejected,
+        'retries': router['retries'],
+        'failovers': router['failovers'],
+        'primary_limit': primary['concurrency_limit'] if primary else args.concurrency,
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+    }
+
+
+async def run(args):
+    print(f"{'scenario':<10}{'ok':>6}{'failed':>8}{'429s':>7}{'retries':>9}{'failover':>10}{'limit':>7}"
+          f"{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for scenario in args.scenarios:
+        r = await run_scenario(scenario, args)
+        print(f"{scenario:<10}{r['succeeded']:>6}{r['failed']:>8}{r['rejected_429']:>7}{r['retries']:>9}"
+              f"{r['failovers']:>10}{r['primary_limit']:>7.1f}{r['throughput_rps']:>8.1f}{r['p50_ms']:>9.0f}"
+              f"{r['p99_ms']:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent callers (and initial limit)')
+    parser.add_argument('--capacity', type=int, default=8, help='Requests the primary stub serves at once')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Primary stub latency')
+    parser.add_argument('--retry-after', type=float, default=0.2, help='Retry-After sent with the 429s')
+    parser.add_argument('--max-retries', type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Cold-cache latency of common preference segments, with and without precomputation
+
+Starts serve.py on a synthetic catalog with the stub LLM twice. The first
+run has no precomputed segments. The second starts from a segments file
+listing every price range x (no category | each category) but generated from
+another catalog, so the server regenerates it in the background at startup
+(as after a catalog change); the time until it is served is reported. Each
+run then requests every segment once, --concurrency at a time, against an
+empty response cache, and reports where the answers came from and their
+latency.
+
+Usage:
+    python -m benchmarks.load_segments [--products 100k] [--llm-latency-ms 800] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+from benchmarks.load_http import ServerProcess
+from benchmarks.synthetic_catalog import CATEGORIES, parse_size
+from services.candidate_filter import PRICE_BUCKETS
+
+
+def segments():
+    return [
+        {'priceRange': price_range, 'categories': categories, 'brands': []}
+        for price_range in ('all', *PRICE_BUCKETS)
+        for categories in [[]] + [[category] for category in CATEGORIES]
+    ]
+
+
+async def wait_precomputed(session, base, timeout=600):
+    """
+    Seconds until the server serves the precomputed segments
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        async with session.get(f"{base}/api/recommendations/segments") as response:
+            stats = json.loads(await response.read())
+        if stats['catalog_version'] is not None:
+            return time.perf_counter() - start
+        await asyncio.sleep(0.1)
+    raise TimeoutError("segments were not precomputed in time")
+
+
+async def cold_requests(base, concurrency, precomputed):
+    sources, latencies = {'llm': 0}, []
+    queue = iter(segments())
+    async with aiohttp.ClientSession() as session:
+        warmup = await wait_precomputed(session, base) if precomputed else None
+
+        async def caller():
+            for preferences in queue:
+                start = time.perf_counter()
+                async with session.post(f"{base}/api/recommendations", json={'preferences': preferences}) as response:
+                    payload = json.loads(await response.read())
+                latencies.append((time.perf_counter() - start) * 1000)
+                source = payload.get('source', 'llm')
+                sources[source] = sources.get(source, 0) + 1
+
+        await asyncio.gather(*(caller() for _ in range(concurrency)))
+        # Precomputed responses look like LLM ones; the server counts them
+        async with session.get(f"{base}/api/recommendations/segments") as response:
+            hits = json.loads(await response.read())['hits']
+        if hits:
+            sources['llm'] -= hits
+            sources['precomputed'] = hits
+    values = np.asarray(latencies)
+    return {
+        'requests': len(latencies),
+        'sources': sources,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'warmup_s': warmup,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', default='100k')
+    parser.add_argument('--llm-latency-ms', type=float, default=800.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load-segments-')
+    try:
+        path = os.path.join(workdir, 'segments.json')
+        with open(path, 'w') as file:
+            json.dump({
+                'catalog_fingerprint': 'previous-catalog', 'generated_at': 0,
+                'segments': [{'preferences': p, 'response': None} for p in segments()],
+            }, file)
+        print(f"{'segments':<13}{'requests':>9}{'p50 ms':>9}{'p99 ms':>9}{'warm-up s':>11}  sources")
+        for label, segment_path in (('none', ''), ('precomputed', path)):
+            env = {
+                'SEGMENT_CACHE_PATH': segment_path,
+                'RECOMMENDATION_CACHE_TTL': '0',
+                'LLM_LATENCY_BUDGET_MS': '0',
+                'ADMISSION_MAX_CONCURRENCY': '0',
+            }
+            with ServerProcess(parse_size(args.products), 1, args.llm_latency_ms, env=env) as base:
+                r = asyncio.run(cold_requests(base, args.concurrency, bool(segment_path)))
+            warmup = f"{r['warmup_s']:.1f}" if r['warmup_s'] is not None else '-'
+            print(f"{label:<13}{r['requests']:>9}{r['p50_ms']:>9.0f}{r['p99_ms']:>9.0f}{warmup:>11}  {r['sources']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
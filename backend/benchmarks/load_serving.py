@@ -0,0 +1,144 @@
+"""
+Throughput of serve.py as the worker count grows, and memory shared between workers
+
+For each worker count, serve.py is started on a synthetic catalog snapshot
+and loaded by several client processes for a fixed time. The load is a mix
+of CPU-bound requests: typeahead searches and filtered, sorted product pages
+at random offsets (mostly uncached). Reported: requests per second, latency
+percentiles, and worker memory. RSS counts shared pages in every worker;
+PSS splits them between the processes sharing them, so PSS well below RSS
+means the preloaded catalog is shared rather than copied.
+
+Throughput can only scale up to the number of cores (the load clients need
+CPU too), so compare worker counts up to os.cpu_count().
+
+Usage:
+    python -m benchmarks.load_serving [--products 100000] [--workers 1 2 4] [--seconds 15]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+from benchmarks.load_http import free_port, wait_ready
+from benchmarks.synthetic_catalog import CATEGORIES, write_catalog
+
+# Tag words used by the synthetic catalog, so searches hit real postings
+WORDS = ['wireless', 'premium', 'organic', 'lightweight', 'portable', 'smart', 'eco', 'durable', 'compact',
+         'comfortable', 'waterproof', 'classic', 'modern', 'kids', 'outdoor', 'travel', 'fitness', 'gift']
+
+
+def request_paths(count, products, seed):
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            query = ' '.join(rng.sample(WORDS, rng.randint(1, 2)))
+            paths.append(f"/api/search?q={query[:rng.randint(3, len(query))]}&limit=10")
+        else:
+            category = rng.choice(CATEGORIES)
+            offset = rng.randrange(0, products // len(CATEGORIES) // 2)
+            paths.append(f"/api/products?category={category}&sort=-rating&limit=20&offset={offset}")
+    return paths
+
+
+async def client(base, paths, seconds, concurrency):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def loop(offset):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    async with session.get(base + paths[i % len(paths)]) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                i += concurrency
+        await asyncio.gather(*(loop(k) for k in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    base, paths, seconds, concurrency = args
+    return asyncio.run(client(base, paths, seconds, concurrency))
+
+
+def memory(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1].lower()] = int(parts[1]) * 1024
+    return values
+
+
+def worker_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--clients', type=int, default=max(2, os.cpu_count() or 1), help='Load client processes')
+    parser.add_argument('--concurrency', type=int, default=16, help='Connections per client process')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load-serving-')
+    env = dict(
+        os.environ,
+        DATA_PATH=write_catalog(args.products, os.path.join(workdir, 'products.catalog')),
+        EMBEDDING_INDEX_PATH=os.path.join(workdir, 'embeddings'),
+        SIMILARITY_TABLE_PATH=os.path.join(workdir, 'similarity'),
+        CATALOG_WATCH_INTERVAL='0',
+    )
+    print(f"{args.products} products, {os.cpu_count()} cores, {args.clients} client processes x "
+          f"{args.concurrency} connections, {args.seconds:.0f}s per run")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'RSS/worker':>12}{'PSS total':>11}")
+
+    for workers in args.workers:
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(base, workers)
+            jobs = [(base, request_paths(5000, args.products, seed), args.seconds, args.concurrency)
+                    for seed in range(args.clients)]
+            with multiprocessing.Pool(args.clients) as pool:
+                results = pool.map(client_process, jobs)
+            latencies = np.concatenate([r[0] for r in results]) * 1000
+            errors = sum(r[1] for r in results)
+            usage = [memory(pid) for pid in worker_pids(server.pid)]
+            rss = sum(u['rss'] for u in usage) / len(usage) / 2**20
+            pss = (sum(u['pss'] for u in usage) + memory(server.pid)['pss']) / 2**20
+            print(f"{workers:>8}{len(latencies) / args.seconds:>10.0f}{np.percentile(latencies, 50):>9.1f}"
+                  f"{np.percentile(latencies, 99):>9.1f}{errors:>8}{rss:>9.0f} MB{pss:>8.0f} MB")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Local stub of the OpenAI chat-completions API for load tests
+
+Answers POST /v1/chat/completions after a configurable delay with a JSON
+array of recommendations built from the product IDs found in the prompt, so
+the backend can be exercised end to end without a real API key. Requests
+with "stream": true get the same content as server-sent events, one chunk
+every --chunk-delay-ms. GET /stats reports request counts and peak concurrency.
+
+To exercise client-side rate limiting and retries, the stub can answer 429
+with a Retry-After header: for a random --reject-rate fraction of requests,
+and for every request beyond --max-concurrency in flight (like a provider
+enforcing a concurrency quota).
+
+Answers are deterministic: the same prompt always gets the same content, and
+latency jitter comes from a seeded generator (--seed). --output selects the
+answer format: "prose" (a sentence before an indented JSON array, as chat
+models tend to answer), "json" (the bare compact array) or "invalid"
+(truncated JSON, to exercise the parse-error path). Prompts asking for the
+compact line format (LLM_RESPONSE_FORMAT=compact) are answered with
+"<id> <score> <reason codes>" lines instead; "invalid" then drops the scores.
+A request's max_tokens cuts the answer at ~4 characters per token, with
+finish_reason "length", like the real API.
+
+Usage:
+    python -m benchmarks.stub_llm_server [--port 8001] [--latency-ms 500] [--jitter-ms 100]
+                                         [--chunk-chars 16] [--chunk-delay-ms 0]
+                                         [--seed 0] [--output prose|json|invalid]
+                                         [--reject-rate 0] [--max-concurrency 0] [--retry-after 1]
+
+Then point the backend at it with LLM_API_BASE=http://localhost:8001/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from services.compact_response import CompactResponseFormat
+
+OUTPUT_FORMATS = ('prose', 'json', 'invalid')
+
+# Reason codes cycled through the compact answer lines
+_REASON_CODES = ('C,H', 'P', 'C,R', 'H', 'B,P')
+
+# Short ids of the compact catalog table ("p1|Name|...", "c1|..." in catalog sections) or legacy "ID: prod001" lines
+_PRODUCT_ID_RE = re.compile(r"^([pc]\d+)\||ID: ([\w-]+)", re.MULTILINE)
+
+
+class StubState:
+    """
+    Behaviour settings and counters shared by the stub's handlers
+    """
+
+    def __init__(self, latency_ms=500.0, jitter_ms=0.0, recommendations=5, chunk_chars=16,
+                 chunk_delay_ms=0.0, seed=0, output='prose', reject_rate=0.0, max_concurrency=0,
+                 retry_after=1.0):
+        """
+        Parameters:
+        - latency_ms (float): Delay before the first byte (time to first token)
+        - jitter_ms (float): Uniform +/- jitter added to latency_ms
+        - recommendations (int): Recommendations per answer
+        - chunk_chars (int): Characters per generated chunk (~4 per token)
+        - chunk_delay_ms (float): Generation time per chunk; a non-streamed
+          answer waits for all chunks before responding
+        - seed (int): Seed of the latency jitter
+        - output (str): Answer format, one of OUTPUT_FORMATS
+        - reject_rate (float): Fraction of requests answered 429 at random
+        - max_concurrency (int): Requests in flight beyond this are answered 429 (0 for no limit)
+        - retry_after (float): Retry-After seconds sent with a 429
+        """
+        if output not in OUTPUT_FORMATS:
+            raise ValueError(f"output must be one of {', '.join(OUTPUT_FORMATS)}")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.recommendations = recommendations
+        self.chunk_chars = chunk_chars
+        self.chunk_delay_ms = chunk_delay_ms
+        self.output = output
+        self.reject_rate = reject_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def delay(self):
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.latency_ms + jitter, 0.0) / 1000
+
+    def reject(self):
+        """
+        Whether to answer the request that just arrived with 429
+        """
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return True
+        return bool(self.reject_rate) and self.random.random() < self.reject_rate
+
+    def stats(self):
+        return {'requests': self.requests, 'rejected': self.rejected, 'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight}
+
+
+def build_content(prompt, count, output='prose'):
+    """
+    Build an LLM-style answer recommending the first `count` catalog IDs in the prompt
+    """
+    found = (short or legacy for short, legacy in _PRODUCT_ID_RE.findall(prompt))
+    product_ids = list(dict.fromkeys(found))[:count]
+    if CompactResponseFormat.RESPONSE_LINE in prompt:
+        if output == 'invalid':
+            return '\n'.join(product_ids)
+        return '\n'.join(f"{product_id} {max(10 - rank, 1)} {_REASON_CODES[rank % len(_REASON_CODES)]}"
+                         for rank, product_id in enumerate(product_ids))
+    recommendations = [
+        {
+            'product_id': product_id,
+            'explanation': f"Recommended because it matches the user's stated interests ({rank + 1}).",
+            'score': max(10 - rank, 1),
+        }
+        for rank, product_id in enumerate(product_ids)
+    ]
+    if output == 'json':
+        return json.dumps(recommendations, separators=(',', ':'))
+    if output == 'invalid':
+        return json.dumps(recommendations)[:-20]
+    return "Here are my recommendations:\n" + json.dumps(recommendations, indent=2)
+
+
+def split_chunks(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+async def stream_completion(request, payload, content):
+    """
+    Send the content as chat-completions server-sent events
+    """
+    state = request.app['state']
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    for chunk in split_chunks(content, state.chunk_chars):
+        await asyncio.sleep(state.chunk_delay_ms / 1000)
+        event = {
+            'object': 'chat.completion.chunk',
+            'model': payload.get('model', 'stub'),
+            'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}],
+        }
+        await response.write(f"data: {json.dumps(event)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def chat_completions(request):
+    state = request.app['state']
+    state.requests += 1
+    if state.reject():
+        state.rejected += 1
+        return web.json_response(
+            {'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit_exceeded'}},
+            status=429, headers={'Retry-After': f"{state.retry_after:g}"},
+        )
+    state.in_flight += 1
+    state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+    try:
+        payload = await request.json()
+        prompt = '\n'.join(m.get('content', '') for m in payload.get('messages', []))
+        await asyncio.sleep(state.delay())
+        content = build_content(prompt, state.recommendations, state.output)
+        finish_reason = 'stop'
+        if payload.get('max_tokens') and len(content) > payload['max_tokens'] * 4:
+            content, finish_reason = content[:payload['max_tokens'] * 4], 'length'
+        if payload.get('stream'):
+            return await stream_completion(request, payload, content)
+        await asyncio.sleep(len(split_chunks(content, state.chunk_chars)) * state.chunk_delay_ms / 1000)
+        return web.json_response({
+            'id': f"chatcmpl-stub-{state.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+            'usage': {
+                'prompt_tokens': len(prompt) // 4,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': (len(prompt) + len(content)) // 4,
+            },
+        })
+    finally:
+        state.in_flight -= 1
+
+
+async def stats(request):
+    return web.json_response(request.app['state'].stats())
+
+
+def make_app(state=None):
+    """
+    Create the stub aiohttp application
+    """
+    app = web.Application()
+    app['state'] = state or StubState()
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    app.router.add_get('/stats', stats)
+    return app
+
+
+@asynccontextmanager
+async def running_stub(state=None, host='127.0.0.1', port=0):
+    """
+    Run the stub inside the current event loop; yields (base_url, state)
+    """
+    app = make_app(state)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{bound_port}/v1", app['state']
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-ms', type=float, default=500.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--recommendations', type=int, default=5)
+    parser.add_argument('--chunk-chars', type=int, default=16)
+    parser.add_argument('--chunk-delay-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', choices=OUTPUT_FORMATS, default='prose')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='Fraction of requests answered 429')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='Answer 429 above this many in flight')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with a 429')
+    args = parser.parse_args()
+
+    state = StubState(args.latency_ms, args.jitter_ms, args.recommendations, args.chunk_chars, args.chunk_delay_ms,
+                      args.seed, args.output, args.reject_rate, args.max_concurrency, args.retry_after)
+    web.run_app(make_app(state), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark suite: pipeline microbenchmarks and HTTP load, saved as JSON for regression comparison
+
+Runs benchmarks/bench_pipeline.py at each catalog size and, unless --no-http
+is given, benchmarks/load_http.py against serve.py on a synthetic catalog
+with the local stub LLM. No API key or running server is needed. The results
+and the environment they were measured in are written to
+benchmarks/results/<timestamp>.json (or --output).
+
+With --compare, throughput, p50 latency and (for HTTP) p99 latency are
+checked against an earlier results file. Changes worse than --tolerance are
+reported as regressions, and the exit status is 1. Compare only runs made
+on the same machine with the same arguments.
+
+Usage:
+    python -m benchmarks.suite [--sizes 1k 100k] [--http-products 100k] [--seconds 10]
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json [--tolerance 0.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from benchmarks import bench_pipeline, load_http
+from benchmarks.synthetic_catalog import parse_size
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Result fields compared against a baseline: name -> True if higher is better. Microbenchmark
+# p99s are dominated by garbage collection pauses and too noisy to compare.
+COMPARED_FIELDS = {
+    'p50_us': False, 'ops_per_s': True,
+    'p50_ms': False, 'p99_ms': False, 'throughput_rps': True,
+}
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+    }
+
+
+def flatten(results, prefix=''):
+    """
+    Compared fields of nested results as {'pipeline/1000/prompt_build/p50_us': value}
+    """
+    values = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif key in COMPARED_FIELDS:
+            values[path] = value
+    return values
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the compared fields that changed by more than `tolerance`
+
+    Returns:
+    - list: Paths of the fields that got worse
+    """
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for path in sorted(current.keys() & previous.keys()):
+        before, after = previous[path], current[path]
+        if not before:
+            continue
+        change = (after - before) / before
+        higher_is_better = COMPARED_FIELDS[path.rsplit('/', 1)[1]]
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        better = change > tolerance if higher_is_better else change < -tolerance
+        if worse or better:
+            print(f"{'REGRESSION' if worse else 'improved':<12}{path:<56}{before:>12.1f} -> {after:<12.1f}"
+                  f"({change:+.0%})")
+        if worse:
+            regressions.append(path)
+    missing = sorted(previous.keys() - current.keys())
+    if missing:
+        print(f"{len(missing)} baseline fields not measured in this run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['1k', '100k'],
+                        help='Catalog sizes for the microbenchmarks (1k, 100k, 1m or counts)')
+    parser.add_argument('--iterations', type=int, default=2000, help='Calls per microbenchmark')
+    parser.add_argument('--no-http', action='store_true', help='Skip the HTTP load test')
+    parser.add_argument('--http-products', default='100k', help='Catalog size for the HTTP load test')
+    parser.add_argument('--workers', type=int, default=1, help='serve.py workers for the HTTP load test')
+    parser.add_argument('--seconds', type=float, default=10.0, help='HTTP load time per endpoint')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative change reported as a regression')
+    args = parser.parse_args()
+
+    report = {'environment': environment(args), 'results': {}}
+    print('== Pipeline microbenchmarks')
+    report['results']['pipeline'] = bench_pipeline.run([parse_size(size) for size in args.sizes], args.iterations)
+    bench_pipeline.print_results(report['results']['pipeline'])
+    if not args.no_http:
+        print('== HTTP load')
+        report['results']['http'] = load_http.run(
+            seconds=args.seconds, concurrency=args.concurrency, products=parse_size(args.http_products),
+            workers=args.workers, llm_latency_ms=args.llm_latency_ms
+        )
+        load_http.print_results(report['results']['http'])
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{report['environment']['timestamp'].replace(':', '')}.json")
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"== Compared with {args.compare} ({baseline['environment'].get('commit')}, "
+              f"tolerance {args.tolerance:.0%})")
+        regressions = compare(report['results'], baseline['results'], args.tolerance)
+        print(f"{len(regressions)} regressions")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
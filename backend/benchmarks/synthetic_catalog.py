@@ -0,0 +1,126 @@
+"""
+Synthetic product catalogs for benchmarks
+
+Usage (writes a catalog for DATA_PATH):
+    python -m benchmarks.synthetic_catalog --products 100k --output data/synthetic-100k.catalog
+    python -m benchmarks.synthetic_catalog --products 1k --output data/synthetic-1k.json
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+# Catalog sizes the benchmark suite runs at
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+CATEGORIES = ['Accessories', 'Beauty', 'Books', 'Clothing', 'Electronics', 'Footwear',
+              'Health', 'Home', 'Office', 'Pets', 'Sports', 'Toys']
+
+
+def generate_columns(count, brand_count=500, subcategories_per_category=8, seed=42):
+    """
+    Generate synthetic catalog columns without building per-product dicts
+
+    Returns a dict of numpy arrays plus vocabularies, suitable for
+    CandidateFilter(**columns). Used for catalog sizes where materializing
+    millions of dicts would dominate the benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    category_codes = rng.integers(0, len(CATEGORIES), size=count, dtype=np.int32)
+    subcategory_codes = (category_codes * subcategories_per_category
+                         + rng.integers(0, subcategories_per_category, size=count, dtype=np.int32))
+    brand_codes = rng.integers(0, brand_count, size=count, dtype=np.int32)
+    return {
+        'prices': np.round(rng.lognormal(mean=4.0, sigma=0.9, size=count), 2),
+        'ratings': np.round(rng.uniform(3.0, 5.0, size=count), 1).astype(np.float32),
+        'inventory': rng.integers(0, 200, size=count, dtype=np.int32),
+        'category_codes': category_codes,
+        'category_vocab': {name: code for code, name in enumerate(CATEGORIES)},
+        'brand_codes': brand_codes,
+        'brand_vocab': {f"Brand{code}": code for code in range(brand_count)},
+        'subcategory_codes': subcategory_codes,
+        'subcategory_vocab': {
+            f"{CATEGORIES[code // subcategories_per_category]}-{code % subcategories_per_category}": code
+            for code in range(len(CATEGORIES) * subcategories_per_category)
+        },
+    }
+
+
+def generate_products(count, brand_count=500, subcategories_per_category=8, seed=42):
+    """
+    Generate a list of synthetic product dicts in the products.json schema
+    """
+    columns = generate_columns(count, brand_count, subcategories_per_category, seed)
+    rng = np.random.default_rng(seed + 1)
+    subcategory_names = {code: name for name, code in columns['subcategory_vocab'].items()}
+    words = ['wireless', 'premium', 'organic', 'lightweight', 'portable', 'smart', 'eco',
+             'durable', 'compact', 'comfortable', 'waterproof', 'classic', 'modern', 'kids',
+             'outdoor', 'travel', 'fitness', 'home', 'office', 'gift']
+    word_choices = rng.integers(0, len(words), size=(count, 4))
+    products = []
+    for i in range(count):
+        category = CATEGORIES[columns['category_codes'][i]]
+        subcategory = subcategory_names[columns['subcategory_codes'][i]]
+        tags = sorted({words[w] for w in word_choices[i]})
+        products.append({
+            'id': f"prod{i + 1:07d}",
+            'name': f"{tags[0].title()} {subcategory} {i + 1}",
+            'category': category,
+            'subcategory': subcategory,
+            'price': float(columns['prices'][i]),
+            'brand': f"Brand{columns['brand_codes'][i]}",
+            'description': f"{' '.join(tags).capitalize()} {subcategory.lower()} for everyday use.",
+            'features': [f"{word.capitalize()} design" for word in tags[:3]],
+            'rating': float(columns['ratings'][i]),
+            'inventory': int(columns['inventory'][i]),
+            'tags': tags,
+        })
+    return products
+
+
+def parse_size(value):
+    """
+    Product count from a preset name ('1k', '100k', '1m') or a plain number
+    """
+    return SIZES.get(value.lower()) or int(value)
+
+
+def write_catalog(count, path, seed=42):
+    """
+    Write a synthetic catalog in the format implied by `path`
+
+    A path ending in .json or .jsonl gets a JSON array or one product per
+    line; anything else is written as a memory-mapped snapshot directory.
+    """
+    # Imported here so generating product dicts does not require the services package
+    from services.product_table import ProductTable
+
+    products = generate_products(count, seed=seed)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith('.jsonl'):
+        with open(path, 'w') as file:
+            for product in products:
+                file.write(json.dumps(product) + '\n')
+    elif path.endswith('.json'):
+        with open(path, 'w') as file:
+            json.dump(products, file)
+    else:
+        ProductTable.from_products(products).save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', default='100k', help=f"Count or one of {', '.join(SIZES)}")
+    parser.add_argument('--output', required=True, help='.json, .jsonl or a snapshot directory')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    count = parse_size(args.products)
+    print(f"Wrote {count} products to {write_catalog(count, args.output, args.seed)}")
+
+
+if __name__ == '__main__':
+    main()
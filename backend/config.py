@@ -9,6 +9,60 @@ config = {
     'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
     'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-3.5-turbo'),
     'MAX_TOKENS': int(os.getenv('MAX_TOKENS', 1000)),
+    'LLM_RESPONSE_FORMAT': os.getenv('LLM_RESPONSE_FORMAT', 'json').lower(),
+    'MAX_PROMPT_TOKENS': int(os.getenv('MAX_PROMPT_TOKENS', 1500)),
+    'TOKENIZER': os.getenv('TOKENIZER', 'tiktoken').lower(),
+    'TOKENIZER_PATH': os.getenv('TOKENIZER_PATH', 'data/tiktoken'),
+    'PROMPT_CANDIDATES': int(os.getenv('PROMPT_CANDIDATES', 20)),
+    'PROMPT_SECTION_ROWS': int(os.getenv('PROMPT_SECTION_ROWS', 6)),
     'TEMPERATURE': float(os.getenv('TEMPERATURE', 0.7)),
-    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json')
-}
\ No newline at end of file
+    'LLM_API_BASE': os.getenv('LLM_API_BASE', 'https://api.openai.com/v1'),
+    'LLM_MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', 32)),
+    'LLM_POOL_SIZE': int(os.getenv('LLM_POOL_SIZE', 100)),
+    'LLM_CONNECT_TIMEOUT': float(os.getenv('LLM_CONNECT_TIMEOUT', 5)),
+    'LLM_REQUEST_TIMEOUT': float(os.getenv('LLM_REQUEST_TIMEOUT', 60)),
+    'LLM_REQUESTS_PER_MINUTE': float(os.getenv('LLM_REQUESTS_PER_MINUTE', 0)),
+    'LLM_TOKENS_PER_MINUTE': float(os.getenv('LLM_TOKENS_PER_MINUTE', 0)),
+    'LLM_LATENCY_BUDGET_MS': float(os.getenv('LLM_LATENCY_BUDGET_MS', 5000)),
+    'LLM_BACKENDS': os.getenv('LLM_BACKENDS', ''),
+    'LLM_MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', 2)),
+    'LLM_RETRY_BACKOFF_MS': float(os.getenv('LLM_RETRY_BACKOFF_MS', 250)),
+    'LLM_LATENCY_TARGET_MS': float(os.getenv('LLM_LATENCY_TARGET_MS', 0)),
+    'LLM_FAILURE_THRESHOLD': int(os.getenv('LLM_FAILURE_THRESHOLD', 3)),
+    'LLM_UNHEALTHY_SECONDS': float(os.getenv('LLM_UNHEALTHY_SECONDS', 5)),
+    'ADMISSION_MAX_CONCURRENCY': int(os.getenv('ADMISSION_MAX_CONCURRENCY', 64)),
+    'ADMISSION_MAX_QUEUE': int(os.getenv('ADMISSION_MAX_QUEUE', 256)),
+    'ADMISSION_SHED_RESPONSE': os.getenv('ADMISSION_SHED_RESPONSE', '429').lower(),
+    'RECOMMENDATION_DEADLINE_MS': float(os.getenv('RECOMMENDATION_DEADLINE_MS', 10000)),
+    'SERVER_HOST': os.getenv('SERVER_HOST', '0.0.0.0'),
+    'SERVER_PORT': int(os.getenv('SERVER_PORT', 5000)),
+    'SERVER_WORKERS': int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1)),
+    'SHUTDOWN_DRAIN_SECONDS': float(os.getenv('SHUTDOWN_DRAIN_SECONDS', 30)),
+    'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING').upper(),
+    'LOG_SAMPLE_EVERY': int(os.getenv('LOG_SAMPLE_EVERY', 100)),
+    'SLOW_RECOMMENDATION_MS': float(os.getenv('SLOW_RECOMMENDATION_MS', 2000)),
+    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json'),
+    'CATALOG_WATCH_INTERVAL': float(os.getenv('CATALOG_WATCH_INTERVAL', 5)),
+    'PRODUCT_PAGE_SIZE': int(os.getenv('PRODUCT_PAGE_SIZE', 50)),
+    'PRODUCT_PAGE_MAX_LIMIT': int(os.getenv('PRODUCT_PAGE_MAX_LIMIT', 500)),
+    'PRODUCT_PAGE_CACHE_SIZE': int(os.getenv('PRODUCT_PAGE_CACHE_SIZE', 256)),
+    'RECOMMENDATION_CACHE_SIZE': int(os.getenv('RECOMMENDATION_CACHE_SIZE', 1024)),
+    'RECOMMENDATION_CACHE_TTL': float(os.getenv('RECOMMENDATION_CACHE_TTL', 300)),
+    'RECOMMENDATION_CACHE_BACKEND': os.getenv('RECOMMENDATION_CACHE_BACKEND', ''),
+    'RECOMMENDATION_CACHE_PATH': os.getenv('RECOMMENDATION_CACHE_PATH', 'data/recommendation_cache.sqlite3'),
+    'SESSION_MAX_SESSIONS': int(os.getenv('SESSION_MAX_SESSIONS', 10000)),
+    'SESSION_MAX_VIEWS': int(os.getenv('SESSION_MAX_VIEWS', 50)),
+    'SESSION_IDLE_SECONDS': float(os.getenv('SESSION_IDLE_SECONDS', 86400)),
+    'SESSION_SNAPSHOT_PATH': os.getenv('SESSION_SNAPSHOT_PATH', ''),
+    'SESSION_SNAPSHOT_INTERVAL': float(os.getenv('SESSION_SNAPSHOT_INTERVAL', 60)),
+    'SEGMENT_CACHE_PATH': os.getenv('SEGMENT_CACHE_PATH', 'data/segments.json'),
+    'SEGMENT_REFRESH': os.getenv('SEGMENT_REFRESH', 'true').lower() == 'true',
+    'BATCH_WORKERS': int(os.getenv('BATCH_WORKERS', 16)),
+    'BATCH_MAX_RETRIES': int(os.getenv('BATCH_MAX_RETRIES', 5)),
+    'RECOMMENDATION_COALESCING': os.getenv('RECOMMENDATION_COALESCING', 'true').lower() == 'true',
+    'EMBEDDING_INDEX_PATH': os.getenv('EMBEDDING_INDEX_PATH', 'data/embeddings'),
+    'EMBEDDING_DIM': int(os.getenv('EMBEDDING_DIM', 256)),
+    'EMBEDDING_NPROBE': int(os.getenv('EMBEDDING_NPROBE', 8)),
+    'SIMILARITY_TABLE_PATH': os.getenv('SIMILARITY_TABLE_PATH', 'data/similarity'),
+    'SIMILAR_PRODUCTS': int(os.getenv('SIMILAR_PRODUCTS', 20))
+}
@@ -0,0 +1,5 @@
+"""
+Command-line jobs for the recommendation backend
+
+Run from the backend directory, e.g. `python -m scripts.build_embedding_index`.
+"""
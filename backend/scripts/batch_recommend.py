@@ -0,0 +1,107 @@
+"""
+Generate recommendations for a JSONL file of requests (e.g. for email campaigns)
+
+Each input line is a /api/recommendations request body with an optional "id":
+    {"id": "user-1", "preferences": {"priceRange": "all", "categories": ["Electronics"], "brands": []},
+     "browsing_history": ["prod002"]}
+
+Results are appended to the output file as they complete, one JSON line per
+record ({"id": ..., "recommendations": [...], "count": n} or {"id": ..., "error": ...}).
+The output doubles as the checkpoint: rerunning the same command skips every
+record that already has a result and retries the ones that failed, so for an
+ID that appears more than once the last line wins.
+
+Usage:
+    python -m scripts.batch_recommend requests.jsonl results.jsonl [--workers 16] [--rpm 3500] [--tpm 90000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from config import config
+from services.batch_service import BatchService
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.rate_limiter import RateLimiter
+
+
+def load_checkpoint(path):
+    """
+    IDs of records with a successful result in an existing output file
+
+    A partially written last line (from an interrupted run) is truncated.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    valid_bytes = 0
+    with open(path, 'rb') as file:
+        for raw_line in file:
+            if not raw_line.endswith(b'\n'):
+                break
+            valid_bytes += len(raw_line)
+            try:
+                result = json.loads(raw_line)
+            except ValueError:
+                continue
+            if 'error' not in result:
+                completed.add(result['id'])
+    if valid_bytes < os.path.getsize(path):
+        with open(path, 'r+b') as file:
+            file.truncate(valid_bytes)
+    return completed
+
+
+async def run(args):
+    completed = load_checkpoint(args.output)
+    if completed:
+        print(f"Resuming: {len(completed)} records already done", file=sys.stderr)
+
+    product_service = ProductService()
+    llm_service = LLMService(product_service, latency_budget_ms=0)
+    rate_limiter = RateLimiter(args.rpm, args.tpm)
+    batch_service = BatchService(
+        llm_service, rate_limiter, workers=args.workers, max_retries=args.max_retries, fallback=args.fallback
+    )
+
+    stats = {}
+    start = time.perf_counter()
+    try:
+        with open(args.input) as lines, open(args.output, 'a') as output:
+            written = 0
+            async for result in batch_service.run(lines, skip_ids=completed, stats=stats):
+                output.write(json.dumps(result) + '\n')
+                written += 1
+                if written % 100 == 0:
+                    output.flush()
+    finally:
+        await llm_service.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {stats['records']} records in {elapsed:.1f}s: {stats['unique']} unique, "
+          f"{stats['deduplicated']} deduplicated, {stats['skipped']} skipped, {stats['invalid']} invalid, "
+          f"{stats['llm_calls']} LLM calls, {stats['retries']} retries, {stats['failed']} failed",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='JSONL file of recommendation requests')
+    parser.add_argument('output', help='JSONL file results are appended to (and resumed from)')
+    parser.add_argument('--workers', type=int, default=config['BATCH_WORKERS'], help='Concurrent LLM calls')
+    parser.add_argument('--rpm', type=float, default=config['LLM_REQUESTS_PER_MINUTE'],
+                        help='LLM requests per minute (0 for no limit)')
+    parser.add_argument('--tpm', type=float, default=config['LLM_TOKENS_PER_MINUTE'],
+                        help='LLM tokens per minute (0 for no limit)')
+    parser.add_argument('--max-retries', type=int, default=config['BATCH_MAX_RETRIES'])
+    parser.add_argument('--fallback', action='store_true',
+                        help='Write the local fallback ranking for requests the LLM fails on')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
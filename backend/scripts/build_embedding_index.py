@@ -0,0 +1,32 @@
+"""
+Build or incrementally update the product embedding index offline
+
+Usage:
+    python -m scripts.build_embedding_index [--data data/products.json] [--index data/embeddings]
+"""
+import argparse
+import time
+
+from config import config
+from services.catalog_loader import load_catalog
+from services.embedding_index import EmbeddingIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default=config['DATA_PATH'], help='Product catalog (JSON, JSONL or snapshot)')
+    parser.add_argument('--index', default=config['EMBEDDING_INDEX_PATH'], help='Index directory')
+    parser.add_argument('--dim', type=int, default=config['EMBEDDING_DIM'])
+    args = parser.parse_args()
+
+    products = load_catalog(args.data)
+
+    start = time.perf_counter()
+    index = EmbeddingIndex(args.index, dim=args.dim)
+    stats = index.build(products, source_fingerprint=products.fingerprint)
+    print(f"Indexed {len(products)} products in {time.perf_counter() - start:.2f}s "
+          f"({stats['embedded']} embedded, {stats['reused']} reused) -> {args.index}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Build or incrementally update the precomputed similar-products table offline
+
+Usage:
+    python -m scripts.build_similarity [--data data/products.json] [--path data/similarity] [--top-n 20] [--full]
+"""
+import argparse
+import os
+import time
+
+from config import config
+from services.catalog_loader import load_catalog
+from services.similarity_table import SimilarityTable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default=config['DATA_PATH'], help='Product catalog (JSON, JSONL or snapshot)')
+    parser.add_argument('--path', default=config['SIMILARITY_TABLE_PATH'], help='Table directory')
+    parser.add_argument('--top-n', type=int, default=config['SIMILAR_PRODUCTS'], help='Neighbours per product')
+    parser.add_argument('--full', action='store_true', help='Recompute every product')
+    args = parser.parse_args()
+
+    products = load_catalog(args.data)
+    previous = None
+    if not args.full and os.path.exists(args.path):
+        try:
+            previous = SimilarityTable.open(args.path)
+        except ValueError as e:
+            print(f"Rebuilding similarity table: {str(e)}")
+
+    start = time.perf_counter()
+    table = SimilarityTable.build(products, k=args.top_n, previous=previous)
+    if table is not previous:
+        table.save(args.path)
+    print(f"Similarity table for {len(products)} products in {time.perf_counter() - start:.2f}s "
+          f"({table.recomputed} recomputed, {len(table) - table.recomputed} reused, "
+          f"{table.nbytes / 2**20:.1f} MB) -> {args.path}")
+
+
+if __name__ == '__main__':
+    main()
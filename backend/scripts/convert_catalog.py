@@ -0,0 +1,51 @@
+"""
+Convert a product catalog between products.json, JSONL and the binary snapshot format
+
+The input is validated on the way. An output path ending in .jsonl gets one
+product per line (streamed on load); any other output path becomes a
+snapshot directory that the backend memory-maps at startup. Point DATA_PATH
+at the output to use it.
+
+Usage:
+    python -m scripts.convert_catalog data/products.json data/products.catalog
+    python -m scripts.convert_catalog data/products.json data/products.jsonl
+"""
+import argparse
+import json
+import os
+import time
+
+from services.catalog_loader import CatalogValidationError, load_catalog
+
+
+def write_jsonl(table, path):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        for product in table:
+            file.write(json.dumps(product) + '\n')
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='products.json, a .jsonl file or a snapshot directory')
+    parser.add_argument('output', help='Snapshot directory, or a .jsonl file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        table = load_catalog(args.input)
+    except CatalogValidationError as e:
+        parser.exit(1, f"Invalid catalog: {str(e)}\n")
+    loaded = time.perf_counter()
+
+    if args.output.endswith('.jsonl'):
+        write_jsonl(table, args.output)
+    else:
+        table.save(args.output)
+    print(f"Converted {len(table)} products in {time.perf_counter() - start:.2f}s "
+          f"(load {loaded - start:.2f}s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
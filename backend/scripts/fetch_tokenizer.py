@@ -0,0 +1,35 @@
+"""
+Download the tiktoken encoding of the configured model so the server can count tokens offline
+
+Run once at build or deploy time, on a host with network access. The
+server loads the encoding from these files and never downloads it.
+
+Usage:
+    python -m scripts.fetch_tokenizer [--model gpt-3.5-turbo] [--path data/tiktoken]
+"""
+import argparse
+
+import tiktoken
+
+from config import config
+from services.tokenizer import Tokenizer, encoding_files, encoding_name, save_encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default=config['MODEL_NAME'], help='Model whose encoding is saved')
+    parser.add_argument('--path', default=config['TOKENIZER_PATH'], help='Directory the encoding is saved to')
+    args = parser.parse_args()
+
+    encoding = tiktoken.get_encoding(encoding_name(args.model))
+    save_encoding(encoding, args.path)
+    # Check the saved files load into the same encoding
+    tokenizer = Tokenizer(args.model, 'tiktoken', args.path)
+    sample = "Wireless noise-cancelling headphones, 30h battery"
+    if tokenizer.count(sample) != len(encoding.encode(sample)):
+        raise SystemExit("saved encoding does not match tiktoken")
+    print(f"Saved {encoding.name} ({encoding.n_vocab} tokens) to {', '.join(encoding_files(args.path, encoding.name))}")
+
+
+if __name__ == '__main__':
+    main()
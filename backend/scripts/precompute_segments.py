@@ -0,0 +1,78 @@
+"""
+Precompute recommendations for the most common preference segments
+
+A segment is a set of preferences (price range, categories, brands) with no
+browsing history. The segments come from one of:
+- --requests: a log of recommendation requests (JSONL records as for
+  batch_recommend); the --top most requested history-free segments
+- --segments: a JSON array of preference objects
+- by default, every price range of the frontend selector with no category
+  or one of the catalog's categories
+
+The recommendations are saved to SEGMENT_CACHE_PATH (or --output) with the
+fingerprint of the catalog they were generated from. The server loads them
+at startup and serves them instead of calling the LLM. When the catalog
+changes, it regenerates the same segments in the background.
+
+Usage:
+    python -m scripts.precompute_segments [--requests requests.jsonl] [--top 200] [--segments segments.json]
+                                          [--output data/segments.json] [--workers 16]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from config import config
+from services.batch_service import BatchService
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.rate_limiter import RateLimiter
+from services.segment_cache import SegmentCache, default_segments, segments_from_requests
+
+
+async def run(args):
+    product_service = ProductService()
+    catalog = product_service.catalog
+    if args.requests:
+        with open(args.requests) as lines:
+            segments = segments_from_requests(lines, args.top)
+    elif args.segments:
+        with open(args.segments) as file:
+            segments = json.load(file)
+    else:
+        segments = default_segments(catalog)
+    if not segments:
+        print("No segments to precompute", file=sys.stderr)
+        return
+
+    llm_service = LLMService(product_service, latency_budget_ms=0)
+    # LLM calls are paced per backend by the router; this limiter only holds the run back after a 429
+    batch_service = BatchService(llm_service, RateLimiter(), workers=args.workers, max_retries=args.max_retries)
+    start = time.perf_counter()
+    try:
+        stats = await SegmentCache(args.output).precompute(batch_service, segments, catalog)
+    finally:
+        await llm_service.close()
+
+    print(f"Precomputed {stats['generated']} of {stats['segments']} segments for catalog "
+          f"{catalog.products.fingerprint} in {time.perf_counter() - start:.1f}s: {stats['llm_calls']} LLM calls, "
+          f"{stats['retries']} retries, {stats['failed']} failed; saved to {args.output}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--requests', help='JSONL log of recommendation requests to take the top segments from')
+    source.add_argument('--segments', help='JSON array of preference objects')
+    parser.add_argument('--top', type=int, default=200, help='Segments taken from --requests')
+    parser.add_argument('--output', default=config['SEGMENT_CACHE_PATH'])
+    parser.add_argument('--workers', type=int, default=config['BATCH_WORKERS'], help='Concurrent LLM calls')
+    parser.add_argument('--max-retries', type=int, default=config['BATCH_MAX_RETRIES'])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
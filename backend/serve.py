@@ -0,0 +1,181 @@
+"""
+Production server: pre-forked uvicorn workers sharing one preloaded app
+
+The app is imported once in the master process, so the catalog, its indexes,
+the pre-encoded product listing and the prompt sections are built once. The
+master then forks the workers, which share those pages copy-on-write (and
+the page cache for memory-mapped snapshots and tables). All workers accept
+connections on one listening socket.
+
+On SIGTERM or SIGINT, every worker stops accepting connections and reports
+not-ready on /readyz. It then finishes its open requests, waits up to
+SHUTDOWN_DRAIN_SECONDS for in-flight LLM calls, and exits. A worker that
+dies unexpectedly is replaced.
+
+A catalog reload requested through the API in one worker is passed on to
+the others through the master (SIGUSR1). The embedding index is rebuilt by
+whichever process gets to it first; the others map what it wrote.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--workers 4]
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# A worker that keeps crashing right after it starts is not restarted more often than this
+RESTART_DELAY_SECONDS = 1.0
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    uvicorn server that flags the app as draining as soon as it is asked to exit
+    """
+
+    def __init__(self, config, service_state):
+        super().__init__(config)
+        self.service_state = service_state
+
+    def handle_exit(self, sig, frame):
+        self.service_state['draining'] = True
+        super().handle_exit(sig, frame)
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(application, sock, log_level, slot):
+    """
+    Serve the preloaded app on the shared socket until told to exit (runs in a forked child)
+    """
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # A reload through the API in one worker reaches the others through the master
+    signal.signal(signal.SIGUSR1, lambda sig, frame: application.catalog_watcher.reload_soon())
+    application.service_state['master_pid'] = os.getppid()
+    application.metrics.use_slot(slot)
+    server_config = uvicorn.Config(application.app, lifespan='on', log_level=log_level)
+    server = WorkerServer(server_config, application.service_state)
+    asyncio.run(server.serve(sockets=[sock]))
+
+
+class Master:
+    """
+    Forks, supervises and stops the worker processes
+    """
+
+    def __init__(self, application, sock, workers, log_level):
+        self.application = application
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.application, self.sock, self.log_level, slot)
+            except BaseException as e:
+                logger.error("Worker %d failed: %s", os.getpid(), e)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = (time.monotonic(), slot)
+
+    def stop(self, sig, frame):
+        if not self.stopping:
+            logger.warning("Shutting down %d workers", len(self.children))
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def broadcast_reload(self, sig, frame):
+        """
+        Pass a worker's catalog reload on to every worker; the one that reloaded ignores it
+        """
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGUSR1)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, self.broadcast_reload)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        logger.info("Serving on %s with %d workers (pids %s)", self.sock.getsockname()[:2], self.workers,
+                    ', '.join(str(pid) for pid in self.children))
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            child = self.children.pop(pid, None)
+            if child is None or self.stopping:
+                continue
+            started, slot = child
+            logger.warning("Worker %d exited with status %d; restarting it", pid, os.waitstatus_to_exitcode(status))
+            time.sleep(max(0.0, RESTART_DELAY_SECONDS - (time.monotonic() - started)))
+            if not self.stopping:
+                # The replacement keeps recording into the same metrics slot, so counters carry on
+                self.spawn(slot)
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=config['SERVER_HOST'])
+    parser.add_argument('--port', type=int, default=config['SERVER_PORT'])
+    parser.add_argument('--workers', type=int, default=config['SERVER_WORKERS'])
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+
+    sock = bind_socket(args.host, args.port)
+    start = time.perf_counter()
+    import app as application
+
+    # Build everything workers would otherwise build on their own after the fork
+    application.product_pages.warm()
+    # Keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded catalog version %d (%d products) in %.2fs", application.product_service.catalog_version,
+                len(application.product_service.products), time.perf_counter() - start)
+    workers = max(1, args.workers)
+    # Each worker records metrics into its own row of shared memory; /metrics sums them
+    application.metrics.share(workers)
+    Master(application, sock, workers, args.log_level).run()
+
+
+if __name__ == '__main__':
+    main()
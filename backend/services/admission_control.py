@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import contextlib
+import math
+import time
+
+from services.metrics import MetricsRegistry
+
+# Why a request was shed: the queue was full, its projected wait would overrun
+# its deadline, or the deadline passed while it was queued
+SHED_REASONS = ('queue_full', 'deadline', 'expired')
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of admitted
+    """
+
+    def __init__(self, reason, retry_after):
+        """
+        Parameters:
+        - reason (str): One of SHED_REASONS
+        - retry_after (int): Seconds after which a retry is likely to be admitted
+        """
+        super().__init__(f"Request shed ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded concurrency and queue for recommendation requests, with deadline-aware shedding
+
+    At most `max_concurrency` requests run at once; the rest wait in a FIFO
+    queue of at most `max_queue`. The time a request holds its slot is
+    tracked as a moving average, which projects how long a newcomer would
+    wait: its queue position times the average service time, divided by
+    the number of slots. A request is rejected at once if the queue is
+    full, or if its projected wait plus one service time would overrun its
+    deadline, since by then the client has given up and the work is
+    wasted. A queued request whose deadline passes is dropped from the queue.
+    """
+
+    # Weight of the newest sample in the service time moving average
+    SMOOTHING = 0.2
+
+    def __init__(self, max_concurrency=64, max_queue=256, metrics=None):
+        """
+        Parameters:
+        - max_concurrency (int): Requests processed at once
+        - max_queue (int): Requests allowed to wait for a slot
+        - metrics (MetricsRegistry): Registry for the admission gauges and counters
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.service_time = None
+        self.admitted = 0
+        self.rejected = dict.fromkeys(SHED_REASONS, 0)
+        self._waiters = collections.deque()
+        registry = metrics if metrics is not None else MetricsRegistry()
+        self.queue_depth = registry.gauge(
+            'recommendation_queue_depth', 'Recommendation requests waiting for a processing slot'
+        )
+        self.in_progress = registry.gauge(
+            'recommendation_in_progress', 'Recommendation requests holding a processing slot'
+        )
+        self.shed = registry.counter(
+            'recommendation_shed_total', 'Recommendation requests rejected by admission control',
+            label='reason', values=SHED_REASONS
+        )
+
+    def projected_wait(self):
+        """
+        Seconds a request arriving now is expected to wait for a slot
+        """
+        if self.running < self.max_concurrency and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) * (self.service_time or 0.0) / self.max_concurrency
+
+    def _reject(self, reason, wait):
+        self.shed.inc(label_value=reason)
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, max(1, math.ceil(wait)))
+
+    async def acquire(self, deadline=None):
+        """
+        Wait for a processing slot
+
+        Parameters:
+        - deadline (float): time.monotonic() by which the response is needed; None for no deadline
+
+        Returns:
+        - float: Ticket to pass to `release`
+
+        Raises:
+        - AdmissionRejected: If the request is shed
+        """
+        if self.running < self.max_concurrency and not self._waiters:
+            self.running += 1
+        else:
+            wait = self.projected_wait()
+            if len(self._waiters) >= self.max_queue:
+                self._reject('queue_full', wait)
+            if deadline is not None and time.monotonic() + wait + (self.service_time or 0.0) > deadline:
+                self._reject('deadline', wait)
+            await self._wait(deadline, wait)
+        self.admitted += 1
+        self.in_progress.inc()
+        return time.monotonic()
+
+    def release(self, ticket):
+        """
+        Free the slot taken by `acquire` and record how long it was held
+        """
+        elapsed = time.monotonic() - ticket
+        self.service_time = elapsed if self.service_time is None else \
+            self.service_time + self.SMOOTHING * (elapsed - self.service_time)
+        self.in_progress.dec()
+        self.running -= 1
+        self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, deadline=None):
+        """
+        Hold a processing slot for the duration of the block (see `acquire`)
+        """
+        ticket = await self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    async def _wait(self, deadline, wait):
+        """
+        Queue for a slot; `running` has been incremented for us when this returns
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queue_depth.inc()
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            expired = isinstance(e, asyncio.TimeoutError)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over at the last moment
+                if expired:
+                    return
+                self.running -= 1
+                self._wake()
+                raise
+            waiter.cancel()
+            self._waiters.remove(waiter)
+            self.queue_depth.dec()
+            if expired:
+                self._reject('expired', wait)
+            raise
+
+    def _wake(self):
+        while self._waiters and self.running < self.max_concurrency:
+            waiter = self._waiters.popleft()
+            self.queue_depth.dec()
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        """
+        Counters for monitoring (this worker only; /metrics sums over workers)
+        """
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'in_progress': self.running,
+            'queue_depth': len(self._waiters),
+            'service_time_ms': round(self.service_time * 1000, 1) if self.service_time is not None else None,
+            'projected_wait_ms': round(self.projected_wait() * 1000, 1),
+            'admitted': self.admitted,
+            'shed': dict(self.rejected),
+        }
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import random
+
+import openai
+
+from services.llm_client import RETRYABLE_ERRORS, retry_after
+from services.recommendation_cache import RecommendationCache, catalog_identity, make_cache_key
+
+
+def parse_record(line, line_number):
+    """
+    Parse one JSONL batch record
+
+    A record has the body of a /api/recommendations request plus an optional
+    "id" (or "user_id") echoed in the result; records without one are
+    identified by their line number.
+
+    Returns:
+    - tuple: (record_id, user_preferences, browsing_history)
+
+    Raises:
+    - ValueError: With args (record_id, message) if the line is not a valid record
+    """
+    record_id = f"line-{line_number}"
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(record_id, f"invalid JSON: {str(e)}")
+    if not isinstance(record, dict):
+        raise ValueError(record_id, "record must be a JSON object")
+
+    record_id = str(record.get('id') or record.get('user_id') or record_id)
+    preferences = record.get('preferences') or {}
+    history = record.get('browsing_history') or []
+    if not isinstance(preferences, dict):
+        raise ValueError(record_id, "preferences must be an object")
+    if not isinstance(history, list) or not all(isinstance(p, str) for p in history):
+        raise ValueError(record_id, "browsing_history must be a list of product IDs")
+    user_preferences = {
+        'priceRange': preferences.get('priceRange', 'all'),
+        'categories': list(preferences.get('categories') or []),
+        'brands': list(preferences.get('brands') or []),
+    }
+    return record_id, user_preferences, history
+
+
+async def _aiter(lines):
+    for line in lines:
+        yield line
+
+
+class BatchService:
+    """
+    Generate recommendations for a stream of requests
+
+    Identical requests (same normalized preferences and history) are computed
+    once and the result is written for every record that asked for it. Unique
+    requests run on a bounded pool of workers; each LLM call first acquires
+    the shared rate limiter, and rate-limit or transient errors are retried
+    with backoff (here only: the LLM router does not also retry these calls).
+    Results are produced as they complete, not in input order.
+    """
+
+    def __init__(self, llm_service, rate_limiter, workers=16, max_retries=5, fallback=False,
+                 result_cache_size=100000):
+        """
+        Parameters:
+        - llm_service (LLMService): Builds prompts and calls the LLM
+        - rate_limiter (RateLimiter): Shared client-side LLM rate limits
+        - workers (int): Concurrent LLM calls per batch
+        - max_retries (int): Retries per request for retryable LLM errors
+        - fallback (bool): Use the local fallback ranking for requests that still fail
+        - result_cache_size (int): Recent results kept to answer repeated requests
+        """
+        self.llm_service = llm_service
+        self.rate_limiter = rate_limiter
+        self.workers = workers
+        self.max_retries = max_retries
+        self.fallback = fallback
+        self.result_cache_size = result_cache_size
+
+    async def run(self, lines, skip_ids=None, stats=None):
+        """
+        Process JSONL records, yielding one result per record
+
+        Parameters:
+        - lines: Iterable or async iterable of JSONL lines
+        - skip_ids (set): Record IDs already completed (for resuming a run)
+        - stats (dict): Filled with counters for the run
+
+        Yields:
+        - dict: {"id": ..., "recommendations": [...], "count": n, ...} or
+          {"id": ..., "error": "..."}
+        """
+        skip_ids = skip_ids or set()
+        catalog = self.llm_service.product_service.catalog
+        # Results of this run; it may last hours, so they do not expire
+        results = RecommendationCache(max_entries=self.result_cache_size, ttl_seconds=float('inf'))
+        pending = {}
+        jobs = asyncio.Queue(maxsize=self.workers * 4)
+        output = asyncio.Queue()
+        stats = stats if stats is not None else {}
+        stats.update({
+            'records': 0, 'skipped': 0, 'invalid': 0, 'unique': 0, 'deduplicated': 0,
+            'cached': 0, 'llm_calls': 0, 'retries': 0, 'failed': 0,
+        })
+        if not hasattr(lines, '__aiter__'):
+            lines = _aiter(lines)
+
+        async def read():
+            line_number = 0
+            async for line in lines:
+                line_number += 1
+                if not line.strip():
+                    continue
+                stats['records'] += 1
+                try:
+                    record_id, user_preferences, history = parse_record(line, line_number)
+                except ValueError as e:
+                    stats['invalid'] += 1
+                    record_id, message = e.args
+                    await output.put({"id": record_id, "error": f"Invalid record: {message}"})
+                    continue
+                if record_id in skip_ids:
+                    stats['skipped'] += 1
+                    continue
+
+                key = make_cache_key(user_preferences, history, catalog_identity(catalog))
+                if key in pending:
+                    stats['deduplicated'] += 1
+                    pending[key].append(record_id)
+                    continue
+                result = results.get(key)
+                if result is not None:
+                    stats['deduplicated'] += 1
+                    await output.put({"id": record_id, **result})
+                    continue
+                stats['unique'] += 1
+                pending[key] = [record_id]
+                await jobs.put((key, user_preferences, history))
+
+        async def work():
+            while True:
+                key, user_preferences, history = await jobs.get()
+                try:
+                    result = await self._recommend(key, user_preferences, history, catalog, stats)
+                except Exception as e:
+                    result = {"error": f"An unexpected error occurred: {str(e)}"}
+                if "error" in result:
+                    stats['failed'] += 1
+                else:
+                    results.set(key, result)
+                for record_id in pending.pop(key):
+                    await output.put({"id": record_id, **result})
+                jobs.task_done()
+
+        async def produce():
+            workers = [asyncio.ensure_future(work()) for _ in range(self.workers)]
+            try:
+                await read()
+                await jobs.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await output.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await output.get()
+                if item is None:
+                    break
+                yield item
+            await producer
+        finally:
+            producer.cancel()
+
+    async def _recommend(self, key, user_preferences, history, catalog, stats):
+        """
+        Recommendations for one unique request, with retries and rate limiting
+        """
+        cached = await self.llm_service.cache.get_async(key)
+        if cached is not None:
+            stats['cached'] += 1
+            return cached
+
+        prompt = self.llm_service.build_prompt(user_preferences, history, catalog)
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(prompt.prompt_tokens + self.llm_service.completion_limit(prompt))
+            stats['llm_calls'] += 1
+            try:
+                # Retried here, with longer backoffs and a shared pause on 429s, not also by the router
+                result = await self.llm_service.complete(prompt, catalog, max_retries=0)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    result = self.llm_service._error_response(e)
+                    break
+                stats['retries'] += 1
+                delay = self._retry_delay(e, attempt)
+                if isinstance(e, openai.error.RateLimitError):
+                    self.rate_limiter.pause(delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                result = self.llm_service._error_response(e)
+                break
+
+        if "error" not in result and result.get("recommendations"):
+            self.llm_service.cache.set(key, result)
+            return result
+        if self.fallback:
+            return self.llm_service._fallback(user_preferences, history, catalog, result.get("error", "empty"))
+        return result if "error" in result else {"error": "No valid recommendations found in LLM response."}
+
+    def _retry_delay(self, error, attempt):
+        """
+        Provider's Retry-After if given, else exponential backoff with jitter
+        """
+        delay = retry_after(error)
+        if delay is not None:
+            return delay
+        return min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
@@ -0,0 +1,282 @@
+import math
+
+import numpy as np
+
+# Named buckets used by the frontend price selector, as half-open [low, high)
+# ranges so a boundary price belongs to one bucket only ("Under $50" excludes 50)
+PRICE_BUCKETS = {
+    'low': (None, 50.0),
+    'medium': (50.0, 200.0),
+    'high': (200.0, None),
+}
+
+
+def parse_price_range(price_range):
+    """
+    Parse a `priceRange` preference into inclusive (min_price, max_price) bounds
+
+    Accepts "all", the named buckets in PRICE_BUCKETS, "min-max" and "min+".
+    Open or unparseable bounds come back as None. "min-max" includes both
+    bounds; a named bucket excludes its upper bound.
+    """
+    if not price_range:
+        return None, None
+    value = str(price_range).strip().lower().replace('$', '')
+    if value == 'all':
+        return None, None
+    if value in PRICE_BUCKETS:
+        low, high = PRICE_BUCKETS[value]
+        # Exclusive upper bound as the largest price below it
+        return low, None if high is None else math.nextafter(high, -math.inf)
+    try:
+        if value.endswith('+'):
+            return float(value[:-1]), None
+        low, high = value.split('-', 1)
+        return float(low), float(high)
+    except ValueError:
+        return None, None
+
+
+def _encode(values):
+    """
+    Dictionary-encode a sequence of strings into int32 codes plus a value->code vocabulary
+    """
+    vocab = {}
+    codes = np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32)
+    return codes, vocab
+
+
+class CandidateFilter:
+    """
+    Columnar view of the catalog for vectorized candidate filtering and ranking
+
+    Each product is a row position shared with CatalogIndex. Filters build a
+    boolean mask over the columns and the best candidates are picked with a
+    partial sort on a relevance score, so the result no longer depends on
+    where products sit in the data file.
+    """
+
+    def __init__(self, prices, ratings, inventory, category_codes, category_vocab,
+                 brand_codes, brand_vocab, subcategory_codes, subcategory_vocab):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.ratings = np.asarray(ratings, dtype=np.float32)
+        self.inventory = np.asarray(inventory, dtype=np.int32)
+        self.category_codes = np.asarray(category_codes, dtype=np.int32)
+        self.category_vocab = category_vocab
+        self.brand_codes = np.asarray(brand_codes, dtype=np.int32)
+        self.brand_vocab = brand_vocab
+        self.subcategory_codes = np.asarray(subcategory_codes, dtype=np.int32)
+        self.subcategory_vocab = subcategory_vocab
+        self._base_scores = self._compute_base_scores()
+        # Rows ordered by base score (ties by position), for history-free requests
+        self._base_order = np.lexsort((np.arange(len(self.prices)), -self._base_scores))
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Share the columns of a ProductTable (no per-product work)
+        """
+        return cls(
+            prices=table.prices,
+            ratings=table.ratings,
+            inventory=table.inventory,
+            category_codes=table.category_codes,
+            category_vocab={value: code for code, value in enumerate(table.category_vocab)},
+            brand_codes=table.brand_codes,
+            brand_vocab={value: code for code, value in enumerate(table.brand_vocab)},
+            subcategory_codes=table.subcategory_codes,
+            subcategory_vocab={value: code for code, value in enumerate(table.subcategory_vocab)},
+        )
+
+    @classmethod
+    def from_products(cls, products):
+        """
+        Build the columns from a list of product dicts
+        """
+        count = len(products)
+        category_codes, category_vocab = _encode(p.get('category') for p in products)
+        brand_codes, brand_vocab = _encode(p.get('brand') for p in products)
+        subcategory_codes, subcategory_vocab = _encode(p.get('subcategory') for p in products)
+        return cls(
+            prices=np.fromiter((float(p.get('price', 0)) for p in products), dtype=np.float64, count=count),
+            ratings=np.fromiter((float(p.get('rating', 0)) for p in products), dtype=np.float32, count=count),
+            inventory=np.fromiter((int(p.get('inventory', 0)) for p in products), dtype=np.int32, count=count),
+            category_codes=category_codes,
+            category_vocab=category_vocab,
+            brand_codes=brand_codes,
+            brand_vocab=brand_vocab,
+            subcategory_codes=subcategory_codes,
+            subcategory_vocab=subcategory_vocab,
+        )
+
+    def __len__(self):
+        return len(self.prices)
+
+    def _compute_base_scores(self):
+        """
+        Preference-independent part of the relevance score: rating plus stock depth
+        """
+        if len(self.prices) == 0:
+            return np.zeros(0, dtype=np.float32)
+        stock = np.log1p(np.maximum(self.inventory, 0)).astype(np.float32)
+        max_stock = stock.max()
+        if max_stock > 0:
+            stock /= max_stock
+        return self.ratings / np.float32(5.0) + np.float32(0.2) * stock
+
+    def _codes_mask(self, codes, vocab, values):
+        """
+        Mask of rows whose code is one of the given values (unknown values match nothing)
+        """
+        wanted = [vocab[v] for v in values if v in vocab]
+        if not wanted:
+            return np.zeros(len(codes), dtype=bool)
+        if len(wanted) == 1:
+            return codes == wanted[0]
+        table = np.zeros(len(vocab), dtype=bool)
+        table[wanted] = True
+        return table[codes]
+
+    def mask(self, categories=None, brands=None, min_price=None, max_price=None, in_stock=False):
+        """
+        Build a boolean mask of rows matching every given criterion
+
+        Parameters:
+        - categories (list): Allowed categories, empty for any
+        - brands (list): Allowed brands, empty for any
+        - min_price (float): Inclusive lower price bound
+        - max_price (float): Inclusive upper price bound
+        - in_stock (bool): Only keep products with inventory > 0
+
+        Returns:
+        - numpy.ndarray: Boolean mask aligned with catalog positions
+        """
+        mask = np.ones(len(self.prices), dtype=bool)
+        if categories:
+            mask &= self._codes_mask(self.category_codes, self.category_vocab, categories)
+        if brands:
+            mask &= self._codes_mask(self.brand_codes, self.brand_vocab, brands)
+        if min_price is not None:
+            mask &= self.prices >= min_price
+        if max_price is not None:
+            mask &= self.prices <= max_price
+        if in_stock:
+            mask &= self.inventory > 0
+        return mask
+
+    def _boost(self, codes, vocab_size, browsed, weight, rows):
+        """
+        Add `weight` to rows sharing a code with any browsed product (via a lookup table)
+        """
+        table = np.zeros(vocab_size, dtype=np.float32)
+        table[codes[browsed]] = weight
+        return table[codes[rows]]
+
+    def relevance(self, browsed_positions=(), rows=None):
+        """
+        Score rows, boosting the categories, subcategories and brands the user browsed
+
+        Parameters:
+        - browsed_positions (list): Catalog positions of browsed products
+        - rows (numpy.ndarray): Positions to score; all rows when None
+
+        Returns:
+        - numpy.ndarray: float32 scores aligned with `rows`
+        """
+        if rows is None:
+            rows = np.arange(len(self.prices))
+        scores = self._base_scores[rows]
+        if len(browsed_positions):
+            browsed = np.asarray(browsed_positions, dtype=np.int64)
+            scores += self._boost(self.category_codes, len(self.category_vocab), browsed, 0.3, rows)
+            scores += self._boost(self.subcategory_codes, len(self.subcategory_vocab), browsed, 0.5, rows)
+            scores += self._boost(self.brand_codes, len(self.brand_vocab), browsed, 0.3, rows)
+        return scores
+
+    def top_k(self, rows, scores, k):
+        """
+        Return the k highest-scoring rows, best first
+
+        Parameters:
+        - rows (numpy.ndarray): Candidate positions in ascending order
+        - scores (numpy.ndarray): Scores aligned with `rows`
+        - k (int): Number of rows to keep
+
+        Ties are broken by catalog position so results are deterministic.
+        """
+        if k <= 0:
+            return rows[:0]
+        if len(rows) > k:
+            # Keep everything above the k-th score, then the lowest positions among ties
+            kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+            above = scores > kth_score
+            ties = np.flatnonzero(scores == kth_score)[:k - int(above.sum())]
+            selected = np.concatenate((np.flatnonzero(above), ties))
+            rows = rows[selected]
+            scores = scores[selected]
+        order = np.lexsort((rows, -scores))
+        return rows[order]
+
+    def _top_k_by_base_order(self, mask, k, chunk_size=4096):
+        """
+        Take the first k masked rows in precomputed base-score order
+
+        Only valid when no history boosts apply. Returns None when the mask is
+        too sparse for the walk to pay off, so the caller can fall back to a
+        partial sort.
+        """
+        found = []
+        remaining = k
+        limit = max(len(self._base_order) // 8, chunk_size)
+        for start in range(0, min(limit, len(self._base_order)), chunk_size):
+            chunk = self._base_order[start:start + chunk_size]
+            hits = chunk[mask[chunk]]
+            found.append(hits[:remaining])
+            remaining -= len(found[-1])
+            if remaining <= 0:
+                return np.concatenate(found)
+        if limit >= len(self._base_order):
+            return np.concatenate(found) if found else self._base_order[:0]
+        return None
+
+    def candidate_mask(self, user_preferences, browsed_positions=(), in_stock=True):
+        """
+        Mask of products allowed as recommendations for a user's preferences
+
+        Browsed products are excluded; pass in_stock=False to keep sold-out items.
+        """
+        min_price, max_price = parse_price_range(user_preferences.get('priceRange'))
+        mask = self.mask(
+            categories=user_preferences.get('categories'),
+            brands=user_preferences.get('brands'),
+            min_price=min_price,
+            max_price=max_price,
+            in_stock=in_stock,
+        )
+        if len(browsed_positions):
+            mask[np.asarray(browsed_positions, dtype=np.int64)] = False
+        return mask
+
+    def select(self, user_preferences, browsed_positions=(), k=20, in_stock=True, mask=None):
+        """
+        Pick the top-k candidate positions for a user's preferences
+
+        Parameters:
+        - user_preferences (dict): priceRange, categories and brands
+        - browsed_positions (list): Catalog positions of browsed products; used for
+          scoring and excluded from the candidates
+        - k (int): Number of candidates to return
+        - in_stock (bool): Only return products with inventory > 0
+        - mask (numpy.ndarray): Precomputed `candidate_mask`, to avoid rebuilding it
+
+        Returns:
+        - numpy.ndarray: Candidate positions, best first
+        """
+        if mask is None:
+            mask = self.candidate_mask(user_preferences, browsed_positions, in_stock)
+        if not len(browsed_positions) and k > 0:
+            positions = self._top_k_by_base_order(mask, k)
+            if positions is not None:
+                return positions
+        rows = np.flatnonzero(mask)
+        return self.top_k(rows, self.relevance(browsed_positions, rows), k)
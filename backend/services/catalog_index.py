@@ -0,0 +1,358 @@
+import numpy as np
+
+from services.candidate_filter import CandidateFilter
+from services.product_table import ProductTable
+from services.search_index import SearchIndex
+
+# Sort keys accepted by `sort_order`; prefix with '-' for descending
+SORT_KEYS = ('price', 'rating', 'name')
+
+
+def _group_positions(codes, vocab):
+    """
+    Positions of every code value, as {value: int32 array of ascending positions}
+    """
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    bounds = np.searchsorted(codes[order], np.arange(len(vocab) + 1))
+    return {vocab[code]: order[bounds[code]:bounds[code + 1]] for code in range(len(vocab))}
+
+
+class CatalogIndex:
+    """
+    In-memory product catalog with a primary id index and secondary indexes
+
+    Products are held in a columnar ProductTable and indexes hold positions
+    into it, so every lookup is a hash probe (or a binary search for price
+    ranges) instead of a scan over the whole catalog. Secondary indexes are
+    derived from the table's dictionary-encoded columns with a few sorts, so
+    building them costs no per-product Python work.
+    """
+
+    def __init__(self, products, embedding_index=None, version=1, search_index=None, similarity_table=None):
+        """
+        Build all indexes for the given products
+
+        Parameters:
+        - products (ProductTable): Catalog table; a list of product dicts is converted
+        - embedding_index (EmbeddingIndex): Optional semantic index built for the same products
+        - version (int): Catalog version, bumped on every reload
+        - search_index (SearchIndex): Full-text index of the same products; built on first search if None
+        - similarity_table (SimilarityTable): Optional precomputed neighbours of the same products
+        """
+        if not isinstance(products, ProductTable):
+            products = ProductTable.from_products(products)
+        self.products = products
+        self.version = version
+        self.embedding_index = embedding_index
+        self.search_index = search_index
+        self.similarity_table = similarity_table
+        self._by_category = {}
+        self._by_subcategory = {}
+        self._by_brand = {}
+        self._by_tag = {}
+        self._price_order = None
+        self._sorted_prices = None
+        self._sort_orders = {}
+        self._build()
+        self.candidate_filter = CandidateFilter.from_table(products)
+
+    def _build(self):
+        """
+        Populate the secondary indexes (the ID index lives in the table)
+        """
+        table = self.products
+        self._by_category = _group_positions(table.category_codes, table.category_vocab)
+        self._by_subcategory = _group_positions(table.subcategory_codes, table.subcategory_vocab)
+        self._by_brand = _group_positions(table.brand_codes, table.brand_vocab)
+
+        # Invert the tag lists: (tag, position) pairs sorted by tag, duplicates dropped
+        tags = table.tags
+        positions = np.repeat(np.arange(len(table), dtype=np.int32), np.diff(tags.offsets))
+        codes = np.asarray(tags.codes)
+        order = np.lexsort((positions, codes))
+        codes, positions = codes[order], positions[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (positions[1:] != positions[:-1])
+        codes, positions = codes[keep], positions[keep]
+        bounds = np.searchsorted(codes, np.arange(len(tags.vocab) + 1))
+        self._by_tag = {
+            tag: positions[bounds[code]:bounds[code + 1]]
+            for code, tag in enumerate(tags.vocab)
+        }
+
+        self._price_order = np.argsort(table.prices, kind='stable').astype(np.int32)
+        self._sorted_prices = np.asarray(table.prices)[self._price_order]
+
+    def __len__(self):
+        return len(self.products)
+
+    def __contains__(self, product_id):
+        return self.products.position_of(product_id) is not None
+
+    def _materialize(self, positions):
+        """
+        Turn a list of positions into product dicts
+        """
+        return [self.products[position] for position in positions]
+
+    def position_of(self, product_id):
+        """
+        Return the catalog position of a product ID, or None if unknown
+        """
+        return self.products.position_of(product_id)
+
+    def positions_of(self, product_ids):
+        """
+        Return catalog positions for a list of IDs, skipping unknown IDs
+        """
+        positions = (self.products.position_of(pid) for pid in product_ids)
+        return [position for position in positions if position is not None]
+
+    def products_at(self, positions):
+        """
+        Get products for a sequence of catalog positions
+        """
+        return [self.products[int(position)] for position in positions]
+
+    def get(self, product_id):
+        """
+        Get a single product by ID
+        """
+        position = self.products.position_of(product_id)
+        if position is None:
+            return None
+        return self.products[position]
+
+    def get_many(self, product_ids):
+        """
+        Get products for a list of IDs, preserving order and skipping unknown IDs
+        """
+        return self._materialize(self.positions_of(product_ids))
+
+    def by_category(self, category):
+        return self._materialize(self._by_category.get(category, ()))
+
+    def by_subcategory(self, subcategory):
+        return self._materialize(self._by_subcategory.get(subcategory, ()))
+
+    def by_brand(self, brand):
+        return self._materialize(self._by_brand.get(brand, ()))
+
+    def by_tag(self, tag):
+        return self._materialize(self._by_tag.get(tag, ()))
+
+    def categories(self):
+        return [c for c in self._by_category if c is not None]
+
+    def subcategories(self):
+        return [s for s in self._by_subcategory if s is not None]
+
+    def brands(self):
+        return [b for b in self._by_brand if b is not None]
+
+    def tags(self):
+        return list(self._by_tag)
+
+    def tag_overlap(self, tags):
+        """
+        Count, for every catalog position, how many of the given tags it carries
+
+        Returns:
+        - numpy.ndarray: int32 counts aligned with catalog positions
+        """
+        counts = np.zeros(len(self.products), dtype=np.int32)
+        for tag in set(tags):
+            positions = self._by_tag.get(tag)
+            if positions is not None and len(positions):
+                counts[positions] += 1
+        return counts
+
+    def _price_positions(self, min_price=None, max_price=None):
+        """
+        Return positions with min_price <= price <= max_price using binary search
+        """
+        lo = 0 if min_price is None else int(np.searchsorted(self._sorted_prices, float(min_price), side='left'))
+        hi = len(self._sorted_prices) if max_price is None else int(
+            np.searchsorted(self._sorted_prices, float(max_price), side='right'))
+        return self._price_order[lo:hi]
+
+    def in_price_range(self, min_price=None, max_price=None):
+        """
+        Get products whose price falls in the inclusive range, cheapest first
+        """
+        return self._materialize(self._price_positions(min_price, max_price))
+
+    def _query_mask(self, categories=None, subcategories=None, brands=None, tags=None,
+                    min_price=None, max_price=None, in_stock=False):
+        """
+        Boolean mask over catalog positions for `query_positions`, or None when nothing filters
+        """
+        mask = None
+        for values, index in (
+            (categories, self._by_category),
+            (subcategories, self._by_subcategory),
+            (brands, self._by_brand),
+            (tags, self._by_tag),
+        ):
+            if values:
+                matched = np.zeros(len(self.products), dtype=bool)
+                for value in values:
+                    positions = index.get(value)
+                    if positions is not None:
+                        matched[positions] = True
+                mask = matched if mask is None else mask & matched
+
+        if min_price is not None or max_price is not None:
+            matched = np.zeros(len(self.products), dtype=bool)
+            matched[self._price_positions(min_price, max_price)] = True
+            mask = matched if mask is None else mask & matched
+
+        if in_stock:
+            matched = np.asarray(self.products.inventory) > 0
+            mask = matched if mask is None else mask & matched
+        return mask
+
+    def query_positions(self, categories=None, subcategories=None, brands=None, tags=None,
+                        min_price=None, max_price=None, in_stock=False):
+        """
+        Return catalog positions matching every given criterion
+
+        Each list argument matches if the product has any of the listed values;
+        empty or None arguments are ignored. Positions come back in catalog order.
+
+        Parameters:
+        - categories (list): Allowed categories
+        - subcategories (list): Allowed subcategories
+        - brands (list): Allowed brands
+        - tags (list): Product must carry at least one of these tags
+        - min_price (float): Inclusive lower price bound
+        - max_price (float): Inclusive upper price bound
+        - in_stock (bool): Only products with inventory left
+
+        Returns:
+        - list: Matching positions into `products`
+        """
+        mask = self._query_mask(categories, subcategories, brands, tags, min_price, max_price, in_stock)
+        if mask is None:
+            return list(range(len(self.products)))
+        return np.flatnonzero(mask).tolist()
+
+    def sort_order(self, key):
+        """
+        All catalog positions ordered by a sort key, built on first use and kept
+
+        Parameters:
+        - key (str): One of SORT_KEYS, with a '-' prefix for descending order
+
+        Returns:
+        - numpy.ndarray: int32 positions; ties keep catalog order
+        """
+        order = self._sort_orders.get(key)
+        if order is not None:
+            return order
+        descending = key.startswith('-')
+        field = key[1:] if descending else key
+        if field not in SORT_KEYS:
+            raise ValueError(f"unknown sort key '{key}' (use {', '.join(SORT_KEYS)}, optionally with '-')")
+        if field == 'price' and not descending:
+            order = self._price_order
+        else:
+            if field == 'name':
+                # Rank of each name in sorted order, so names sort like numbers
+                values = np.unique(np.array(list(self.products.names), dtype=object), return_inverse=True)[1]
+            else:
+                values = np.asarray(self.products.prices if field == 'price' else self.products.ratings)
+            order = np.argsort(-values if descending else values, kind='stable').astype(np.int32)
+        self._sort_orders[key] = order
+        return order
+
+    def page_positions(self, sort=None, offset=0, limit=None, **criteria):
+        """
+        Filter, sort and slice the catalog
+
+        Parameters:
+        - sort (str): Sort key (see `sort_order`); catalog order if None
+        - offset (int): Matches to skip
+        - limit (int): Maximum positions returned; all remaining if None
+        - criteria: Filters accepted by `query_positions`
+
+        Returns:
+        - tuple: (int32 positions of the page, total number of matches)
+        """
+        mask = self._query_mask(**criteria)
+        if sort:
+            order = self.sort_order(sort)
+            selected = order if mask is None else order[mask[order]]
+        else:
+            selected = np.arange(len(self.products), dtype=np.int32) if mask is None else np.flatnonzero(mask)
+        end = None if limit is None else offset + limit
+        return selected[offset:end], len(selected)
+
+    def position_filter(self, categories=None, subcategories=None, brands=None, tags=None,
+                        min_price=None, max_price=None, in_stock=False):
+        """
+        Predicate over arrays of positions for the criteria of `query_positions`
+
+        Unlike a mask over the whole catalog, the returned function only reads
+        the columns at the positions it is given, so filtering a few thousand
+        search hits does not cost a pass over every product.
+
+        Returns:
+        - callable: positions -> boolean array, or None when nothing filters
+        """
+        table = self.products
+        checks = []
+        for values, codes, vocab in (
+            (categories, table.category_codes, table.category_vocab),
+            (subcategories, table.subcategory_codes, table.subcategory_vocab),
+            (brands, table.brand_codes, table.brand_vocab),
+        ):
+            if values:
+                wanted = set(values)
+                allowed = np.fromiter((value in wanted for value in vocab), dtype=bool, count=len(vocab))
+                checks.append(lambda positions, codes=codes, allowed=allowed: allowed[codes[positions]])
+        if tags:
+            tag_mask = self._query_mask(tags=tags)
+            checks.append(lambda positions: tag_mask[positions])
+        if min_price is not None or max_price is not None:
+            low = -np.inf if min_price is None else float(min_price)
+            high = np.inf if max_price is None else float(max_price)
+
+            def in_price_range(positions):
+                prices = table.prices[positions]
+                return (prices >= low) & (prices <= high)
+            checks.append(in_price_range)
+        if in_stock:
+            checks.append(lambda positions: table.inventory[positions] > 0)
+        if not checks:
+            return None
+
+        def accept(positions):
+            keep = checks[0](positions)
+            for check in checks[1:]:
+                keep &= check(positions)
+            return keep
+        return accept
+
+    def search(self, query, limit=10, prefix=True, **criteria):
+        """
+        Full-text search, restricted to products matching the given criteria
+
+        Parameters:
+        - query (str): Free text
+        - limit (int): Maximum results
+        - prefix (bool): Typeahead matching of the last word (see SearchIndex.search)
+        - criteria: Filters accepted by `query_positions`
+
+        Returns:
+        - tuple: (catalog positions, BM25 scores), best first
+        """
+        if self.search_index is None:
+            self.search_index = SearchIndex.build(self.products)
+        return self.search_index.search(query, k=limit, accept=self.position_filter(**criteria), prefix=prefix)
+
+    def query(self, **criteria):
+        """
+        Get products matching every given criterion (see `query_positions`)
+        """
+        return self._materialize(self.query_positions(**criteria))
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from services.product_table import ProductTable, ProductTableBuilder
+
+logger = logging.getLogger(__name__)
+
+# Required product fields and the types they must have
+REQUIRED_FIELDS = {
+    'id': str,
+    'name': str,
+    'category': str,
+    'price': (int, float),
+}
+
+# Optional fields, checked only when present
+OPTIONAL_FIELDS = {
+    'subcategory': str,
+    'brand': str,
+    'description': str,
+    'features': list,
+    'tags': list,
+    'rating': (int, float),
+    'inventory': int,
+}
+
+# Problems listed in a validation error before the rest are summarized
+MAX_REPORTED_PROBLEMS = 5
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+class CatalogValidationError(ValueError):
+    """
+    Raised when a catalog file cannot be parsed or fails validation
+    """
+
+
+def product_problems(product, position, seen):
+    """
+    List what is wrong with one product
+
+    Parameters:
+    - product: Parsed catalog entry
+    - position (int): Its position in the catalog, used when it has no ID
+    - seen (set): IDs of the products before it; updated with this one
+    """
+    if not isinstance(product, dict):
+        return [f"product {position} is not an object"]
+    problems = []
+    label = product.get('id', f"#{position}")
+    for field, kind in REQUIRED_FIELDS.items():
+        value = product.get(field)
+        if value is None:
+            problems.append(f"product {label} is missing '{field}'")
+        elif not isinstance(value, kind) or isinstance(value, bool):
+            problems.append(f"product {label} has an invalid '{field}'")
+    for field, kind in OPTIONAL_FIELDS.items():
+        value = product.get(field)
+        if value is not None and (not isinstance(value, kind) or isinstance(value, bool)):
+            problems.append(f"product {label} has an invalid '{field}'")
+    price = product.get('price')
+    if isinstance(price, (int, float)) and price < 0:
+        problems.append(f"product {label} has a negative price")
+    if isinstance(label, str):
+        if label in seen:
+            problems.append(f"duplicate product id {label}")
+        seen.add(label)
+    return problems
+
+
+def _raise_problems(problems, total):
+    summary = '; '.join(problems[:MAX_REPORTED_PROBLEMS])
+    if total > MAX_REPORTED_PROBLEMS:
+        summary += f" (and {total - MAX_REPORTED_PROBLEMS} more)"
+    raise CatalogValidationError(summary)
+
+
+def add_products(builder, products):
+    """
+    Validate products one at a time and add them to a ProductTableBuilder
+
+    Every product is checked, but once one is invalid no more are added,
+    since the table will be discarded.
+
+    Raises:
+    - CatalogValidationError: Listing the first problems found
+    """
+    problems, total, seen = [], 0, set()
+    for position, product in enumerate(products):
+        found = product_problems(product, position, seen)
+        if found:
+            total += len(found)
+            problems.extend(found[:MAX_REPORTED_PROBLEMS - len(problems)])
+        elif not problems:
+            builder.add(product)
+    if problems:
+        _raise_problems(problems, total)
+
+
+def iter_json_array(text):
+    """
+    Parse a JSON array one element at a time
+
+    Makes one short decoder call per element, so a reload parsing a large
+    catalog in a background thread does not hold the GIL (and stall request
+    handling) for the whole file, and each element can be dropped as soon
+    as it is consumed.
+
+    Raises:
+    - ValueError: The text is not valid JSON
+    - CatalogValidationError: The text is valid JSON but not an array
+    """
+    decoder = json.JSONDecoder()
+    position = _WHITESPACE.match(text, 0).end()
+    if not text.startswith('[', position):
+        json.loads(text)
+        raise CatalogValidationError("catalog must be a JSON array of products")
+
+    position = _WHITESPACE.match(text, position + 1).end()
+    if text.startswith(']', position):
+        end = position + 1
+    else:
+        while True:
+            item, position = decoder.raw_decode(text, position)
+            yield item
+            position = _WHITESPACE.match(text, position).end()
+            if text.startswith(']', position):
+                end = position + 1
+                break
+            if not text.startswith(',', position):
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, position)
+            position = _WHITESPACE.match(text, position + 1).end()
+    if _WHITESPACE.match(text, end).end() != len(text):
+        raise json.JSONDecodeError("Extra data", text, end)
+
+
+def load_json(path):
+    """
+    Stream a products.json array into a ProductTable
+
+    Like JSONL, products are validated and added to the table as they are
+    parsed, so the catalog never exists as a list of dicts. Parsed products
+    are short-lived and die young instead of piling up for the cyclic
+    garbage collector to traverse on every full collection.
+
+    Raises:
+    - CatalogValidationError: The file is missing, is not valid JSON or fails validation
+    """
+    builder = ProductTableBuilder()
+    try:
+        with open(path, 'rb') as file:
+            raw = file.read()
+        add_products(builder, iter_json_array(raw.decode()))
+    except CatalogValidationError:
+        raise
+    except (OSError, ValueError) as e:
+        raise CatalogValidationError(f"cannot read {path}: {str(e)}")
+    return builder.build(hashlib.sha256(raw).hexdigest()[:16])
+
+
+def _jsonl_products(file, path, digest):
+    for line_number, raw_line in enumerate(file, 1):
+        digest.update(raw_line)
+        if not raw_line.strip():
+            continue
+        try:
+            yield json.loads(raw_line)
+        except ValueError as e:
+            raise CatalogValidationError(f"cannot read {path}: line {line_number}: {str(e)}")
+
+
+def load_jsonl(path):
+    """
+    Stream a JSONL catalog (one product per line) into a ProductTable
+
+    Products are validated and added to the table as they are read, so the
+    catalog never exists as a list of dicts.
+
+    Raises:
+    - CatalogValidationError: The file is missing, has invalid JSON or fails validation
+    """
+    builder = ProductTableBuilder()
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            add_products(builder, _jsonl_products(file, path, digest))
+    except OSError as e:
+        raise CatalogValidationError(f"cannot read {path}: {str(e)}")
+    return builder.build(digest.hexdigest()[:16])
+
+
+def load_catalog(path):
+    """
+    Load a catalog in any supported format
+
+    - a directory: binary snapshot written by scripts/convert_catalog.py (memory-mapped)
+    - *.jsonl: one product per line, streamed
+    - anything else: a products.json array
+
+    Returns:
+    - ProductTable
+
+    Raises:
+    - CatalogValidationError: The catalog cannot be read or fails validation
+    """
+    if os.path.isdir(path):
+        try:
+            return ProductTable.open(path)
+        except (OSError, ValueError) as e:
+            raise CatalogValidationError(f"cannot read {path}: {str(e)}")
+    if path.endswith('.jsonl'):
+        return load_jsonl(path)
+    return load_json(path)
+
+
+def file_signature(path):
+    """
+    (inode, mtime, size) of a file or snapshot directory, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class CatalogWatcher:
+    """
+    Background thread that reloads the catalog when its data file changes
+
+    The file is polled every `interval` seconds. A change is reloaded only
+    once the file has been stable for one poll, so a file being written is
+    not read half-way. A version that fails validation is not retried until
+    the file changes again.
+    """
+
+    def __init__(self, product_service, interval=5.0):
+        """
+        Parameters:
+        - product_service (ProductService): Service whose catalog is reloaded
+        - interval (float): Seconds between polls
+        """
+        self.product_service = product_service
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = file_signature(product_service.data_path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            signature = file_signature(self.product_service.data_path)
+            if signature is None or signature == self._seen:
+                pending = None
+                continue
+            if signature != pending:
+                # Changed since the last poll: wait for it to settle
+                pending = signature
+                continue
+            pending = None
+            self._reload(signature)
+
+    def reload(self):
+        """
+        Reload the catalog now, as on a file change (call off the event loop)
+
+        Returns:
+        - CatalogIndex: The new catalog
+
+        Raises:
+        - CatalogValidationError: The file could not be read or is invalid
+        """
+        self._seen = file_signature(self.product_service.data_path)
+        return self.product_service.reload()
+
+    def reload_soon(self):
+        """
+        Reload in a background thread, unless this process already loaded the file as it is now
+
+        Safe to call from a signal handler: serve.py calls it in every worker
+        when one of them was asked to reload through the API.
+        """
+        signature = file_signature(self.product_service.data_path)
+        if signature is not None and signature != self._seen:
+            threading.Thread(target=self._reload, args=(signature,), name='catalog-reload', daemon=True).start()
+
+    def _reload(self, signature):
+        self._seen = signature
+        start = time.perf_counter()
+        try:
+            catalog = self.product_service.reload()
+            logger.info("Catalog reloaded: version %d, %d products (%.2fs)",
+                        catalog.version, len(catalog.products), time.perf_counter() - start)
+        except CatalogValidationError as e:
+            logger.warning("Catalog reload rejected, keeping version %d: %s", self.product_service.catalog_version, e)
+        except Exception as e:
+            logger.error("Catalog reload failed, keeping version %d: %s", self.product_service.catalog_version, e)
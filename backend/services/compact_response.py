@@ -0,0 +1,186 @@
+from services.fallback_ranker import FallbackRanker
+
+
+class CompactResponseFormat:
+    """
+    Compact recommendation reply: one short line per product instead of JSON with written explanations
+
+    The model answers with lines like
+
+        p3 9 C,H
+        c12 7 P
+
+    that is, the catalog id from the prompt, an integer score from 1 to 10
+    and optional reason codes. Explanations are rendered server-side from a
+    template phrase per code, filled in from the catalog (same wording as
+    FallbackRanker). A reply costs a few tokens per recommendation instead
+    of several dozen, and generation time grows with completion tokens.
+    """
+
+    # Reason code -> (description shown to the model, explanation phrase)
+    REASONS = {
+        'C': ('preferred category', "it matches your interest in {category}"),
+        'B': ('preferred brand', "it is from {brand}, a brand you like"),
+        'P': ('fits the price range', "it is within your price range at ${price:.2f}"),
+        'H': ('similar to viewed products', "it is similar to products you viewed"),
+        'X': ('complements viewed products', "it goes well with products you viewed"),
+        'R': ('highly rated', "it is highly rated ({rating}/5)"),
+    }
+
+    # The line grammar as shown to the model (also how the stub LLM recognizes compact prompts)
+    RESPONSE_LINE = "<catalog id> <score 1-10> <reason codes>"
+
+    DEFAULT_EXPLANATION = "Recommended based on your preferences."
+
+    # Completion budget per line ("c123 10 C,B,H" and a newline is under 10 tokens)
+    TOKENS_PER_LINE = 10
+
+    def __init__(self, recommendation_count=5):
+        """
+        Parameters:
+        - recommendation_count (int): Lines requested from the model
+        """
+        self.recommendation_count = recommendation_count
+
+    def instructions(self):
+        """
+        Reply format section of the prompt
+        """
+        codes = ', '.join(f"{code}={description}" for code, (description, _) in self.REASONS.items())
+        return (
+            f"Reply with exactly {self.recommendation_count} lines, best first, and nothing else. "
+            f"Each line is:\n{self.RESPONSE_LINE}\n"
+            f"Reason codes (comma-separated, optional): {codes}\n"
+            "Example line: p3 9 C,H\n\n"
+        )
+
+    def footer(self):
+        return f"\nReply with the {self.recommendation_count} lines only."
+
+    def max_completion_tokens(self):
+        """
+        Completion token cap for a reply, with room for one stray preamble line
+        """
+        return self.TOKENS_PER_LINE * (self.recommendation_count + 1)
+
+    @classmethod
+    def parse_line(cls, line):
+        """
+        Parse one reply line
+
+        The id and score are strict: the line must start with a catalog id
+        followed by an integer score from 1 to 10. Unknown reason codes are
+        ignored.
+
+        Returns:
+        - tuple: (catalog id, score, reason codes), or None if the line does not match
+        """
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            return None
+        score = int(parts[1])
+        if not 1 <= score <= 10:
+            return None
+        codes = ''.join(code for code in parts[2] if code in cls.REASONS) if len(parts) == 3 else ''
+        return parts[0], score, codes
+
+    def parse(self, text, accept=None):
+        """
+        Parse a whole reply, up to recommendation_count valid lines
+
+        Parameters:
+        - text (str): The reply
+        - accept (callable): Optional check of each parsed line (see IncrementalLineParser)
+
+        Returns:
+        - tuple: (list of (catalog id, score, reason codes), number of non-empty lines rejected)
+        """
+        parser = IncrementalLineParser(self.recommendation_count, accept)
+        items = parser.feed(text)
+        items.extend(parser.close())
+        return items, parser.errors
+
+    @classmethod
+    def explain(cls, codes, product):
+        """
+        Render the explanation for a recommendation's reason codes (at most two, like FallbackRanker)
+
+        'R' is only rendered for ratings FallbackRanker would call high.
+        """
+        phrases = []
+        for code in dict.fromkeys(codes):
+            if code == 'R' and (product.get('rating') or 0) < FallbackRanker.HIGH_RATING:
+                continue
+            try:
+                phrases.append(cls.REASONS[code][1].format(**product))
+            except (KeyError, IndexError, ValueError):
+                continue
+        if not phrases:
+            return cls.DEFAULT_EXPLANATION
+        return "Recommended because " + " and ".join(phrases[:2]) + "."
+
+
+class IncrementalLineParser:
+    """
+    Parse compact reply lines from streamed text as soon as each line is complete
+
+    Same interface as IncrementalJSONArrayParser: `feed` returns what a chunk
+    completed and `finished` is set once `limit` valid lines have been
+    parsed. `close` parses a last line that has no trailing newline.
+    """
+
+    def __init__(self, limit, accept=None):
+        """
+        Parameters:
+        - limit (int): Lines to parse before the reply counts as finished
+        - accept (callable): Optional (catalog id, score, reason codes) -> bool; lines it
+          refuses (e.g. unknown or repeated ids) are dropped and do not count toward limit
+        """
+        self.limit = limit
+        self.accept = accept
+        self.count = 0
+        self.errors = 0
+        self._pending = ''
+        self._finished = False
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def _accept(self, lines):
+        parsed = []
+        for line in lines:
+            if self._finished:
+                break
+            if not line or line.isspace():
+                continue
+            item = CompactResponseFormat.parse_line(line)
+            if item is None or (self.accept is not None and not self.accept(item)):
+                self.errors += 1
+                continue
+            parsed.append(item)
+            self.count += 1
+            self._finished = self.count >= self.limit
+        return parsed
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text
+
+        Returns:
+        - list: (catalog id, score, reason codes) for each line completed within this chunk
+        """
+        if self._finished or '\n' not in text:
+            if not self._finished:
+                self._pending += text
+            return []
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        return self._accept(lines)
+
+    def close(self):
+        """
+        End of the stream: parse the unterminated last line, if any
+        """
+        pending, self._pending = self._pending, ''
+        return self._accept([pending])
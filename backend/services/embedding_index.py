@@ -0,0 +1,501 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Relative weight of each product field in the embedding
+FIELD_WEIGHTS = (('name', 2.0), ('description', 1.0), ('features', 1.0), ('tags', 2.0))
+
+# Catalogs up to this size are scanned exactly; larger ones use inverted lists
+EXACT_SEARCH_LIMIT = 50_000
+
+
+def product_text_fields(product):
+    """
+    Yield (text, weight) pairs for the fields that feed the embedding
+    """
+    for field, weight in FIELD_WEIGHTS:
+        value = product.get(field)
+        if not value:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ' '.join(str(v) for v in value)
+        yield str(value), weight
+
+
+def product_fingerprint(product):
+    """
+    Stable 64-bit hash of the embedded fields, used to detect changed products
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(product.get('id')).encode())
+    for text, _ in product_text_fields(product):
+        digest.update(b'\x1f')
+        digest.update(text.encode())
+    return int.from_bytes(digest.digest(), 'little')
+
+
+class EmbeddingIndex:
+    """
+    On-disk vector index over product text for semantic candidate retrieval
+
+    Products are embedded with signed feature hashing of unigrams and bigrams
+    (no model or network access needed). The stored matrix holds sublinear
+    term frequencies; IDF weights are applied at query time from persisted
+    document frequencies, so adding or changing products never requires
+    re-embedding the rest of the catalog.
+
+    All arrays are written under `path` and the vectors are opened as a
+    read-only memory map, so several worker processes share one copy in the
+    page cache. Large catalogs are clustered into inverted lists stored
+    contiguously, and a query only scans the few lists closest to it.
+
+    Builds hold an exclusive lock on the directory, so when several worker
+    processes reload the same catalog, one embeds and writes the new
+    generation and the others wait, then map what it wrote. A generation's
+    files are never rewritten once published, and the previous generation
+    is kept until the next build, for processes still serving it.
+    """
+
+    def __init__(self, path, dim=256, nprobe=8):
+        """
+        Open the index stored under `path` (created on first build)
+
+        Parameters:
+        - path (str): Directory holding the index files
+        - dim (int): Hashed embedding dimension
+        - nprobe (int): Inverted lists scanned per query on large catalogs
+        """
+        self.path = path
+        self.dim = dim
+        self.nprobe = nprobe
+        self.generation = 0
+        self.count = 0
+        self.source_fingerprint = None
+        self._ids = []
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.row_positions = np.zeros(0, dtype=np.int64)
+        self.position_rows = np.zeros(0, dtype=np.int64)
+        self.doc_freq = np.zeros(dim, dtype=np.int64)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.centroids = None
+        self.list_offsets = None
+        self._load()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def ids(self):
+        """
+        Product IDs in catalog order, read from disk on first use (only builds need them)
+        """
+        if self._ids is None:
+            with open(self._file('ids') + '.json') as file:
+                self._ids = json.load(file)
+        return self._ids
+
+    # ------------------------------------------------------------------
+    # Embedding
+    # ------------------------------------------------------------------
+
+    def _hash_features(self, text):
+        """
+        Yield (bucket, sign) for every unigram and bigram in the text
+        """
+        tokens = _TOKEN_RE.findall(text.lower())
+        previous = None
+        for token in tokens:
+            for feature in (token, f"{previous} {token}" if previous else None):
+                if feature is None:
+                    continue
+                h = zlib.crc32(feature.encode())
+                yield h % self.dim, (1.0 if h & 0x80000000 else -1.0)
+            previous = token
+
+    def embed(self, products):
+        """
+        Compute sublinear term-frequency vectors for a batch of products
+
+        Returns:
+        - numpy.ndarray: float32 matrix of shape (len(products), dim)
+        """
+        matrix = np.zeros((len(products), self.dim), dtype=np.float32)
+        for row, product in enumerate(products):
+            counts = matrix[row]
+            for text, weight in product_text_fields(product):
+                for bucket, sign in self._hash_features(text):
+                    counts[bucket] += sign * weight
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def build(self, products, batch_size=4096, source_fingerprint=None):
+        """
+        Bring the index in line with `products`, re-embedding only what changed
+
+        Rows whose id and embedded text are unchanged are copied from the
+        current index; new and modified products are embedded. The result is
+        written as a new generation and swapped in atomically.
+
+        Parameters:
+        - products (list): Full catalog in catalog order
+        - batch_size (int): Products embedded per batch
+        - source_fingerprint (str): Content hash of the catalog; when it matches
+          the one the index was built from, the per-product comparison is skipped
+
+        Returns:
+        - dict: Counts of reused and embedded products
+        """
+        if source_fingerprint and source_fingerprint == self.source_fingerprint and len(products) == self.count:
+            return {'reused': self.count, 'embedded': 0}
+        with self._build_lock():
+            # Another process may have built this catalog while this one waited for the lock
+            self._load()
+            if source_fingerprint and source_fingerprint == self.source_fingerprint and len(products) == self.count:
+                return {'reused': self.count, 'embedded': 0}
+            return self._update(products, batch_size, source_fingerprint)
+
+    def _update(self, products, batch_size, source_fingerprint):
+        old_rows = {product_id: row for row, product_id in enumerate(self.ids)}
+        ids = []
+        fingerprints = np.empty(len(products), dtype=np.uint64)
+        for position, product in enumerate(products):
+            ids.append(product['id'])
+            fingerprints[position] = product_fingerprint(product)
+
+        vectors = np.zeros((len(products), self.dim), dtype=np.float32)
+        reuse_new, reuse_old, changed = [], [], []
+        for position, product_id in enumerate(ids):
+            row = old_rows.get(product_id)
+            if row is not None and self.fingerprints[row] == fingerprints[position]:
+                reuse_new.append(position)
+                reuse_old.append(self.position_rows[row])
+            else:
+                changed.append(position)
+
+        if not changed and ids == self.ids:
+            if source_fingerprint != self.source_fingerprint:
+                self._write_meta(source_fingerprint)
+            return {'reused': len(reuse_new), 'embedded': 0}
+
+        if reuse_new:
+            vectors[reuse_new] = self.vectors[np.asarray(reuse_old)]
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            vectors[batch] = self.embed([products[p] for p in batch])
+
+        self._write_vectors(ids, vectors, fingerprints, source_fingerprint)
+        return {'reused': len(reuse_new), 'embedded': len(changed)}
+
+    def write_vectors(self, ids, vectors, fingerprints=None, source_fingerprint=None):
+        """
+        Replace the index contents with precomputed term-frequency vectors
+
+        Parameters:
+        - ids (list): Product IDs in catalog order
+        - vectors (numpy.ndarray): float32 matrix of shape (len(ids), dim)
+        - fingerprints (numpy.ndarray): Optional uint64 content hashes per product
+        - source_fingerprint (str): Optional content hash of the whole catalog
+        """
+        with self._build_lock():
+            self._write_vectors(ids, vectors, fingerprints, source_fingerprint)
+
+    def _write_vectors(self, ids, vectors, fingerprints, source_fingerprint):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if fingerprints is None:
+            fingerprints = np.zeros(len(ids), dtype=np.uint64)
+
+        doc_freq = np.count_nonzero(vectors, axis=0).astype(np.int64)
+        idf = self._idf(doc_freq, len(ids))
+        norms = self._row_norms(vectors, idf)
+
+        centroids, assignments = self._cluster(vectors, idf, norms)
+        if assignments is None:
+            row_positions = np.arange(len(ids), dtype=np.int64)
+            list_offsets = None
+        else:
+            row_positions = np.argsort(assignments, kind='stable').astype(np.int64)
+            list_offsets = np.searchsorted(assignments[row_positions], np.arange(len(centroids) + 1))
+
+        self._write_generation(ids, fingerprints, vectors[row_positions], row_positions,
+                               doc_freq, norms[row_positions], centroids, list_offsets, source_fingerprint)
+        self._load()
+
+    def _idf(self, doc_freq, count):
+        return (np.log((1.0 + count) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+
+    def _row_norms(self, vectors, idf, batch_size=65536):
+        """
+        L2 norm of each IDF-weighted row, computed in batches to bound memory
+        """
+        norms = np.empty(len(vectors), dtype=np.float32)
+        idf_sq = idf * idf
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size]
+            norms[start:start + batch_size] = np.sqrt((block * block) @ idf_sq)
+        norms[norms == 0] = 1.0
+        return norms
+
+    def _cluster(self, vectors, idf, norms, iterations=8, sample_size=65536, seed=0):
+        """
+        Spherical k-means over a sample, then assign every row to its nearest centroid
+
+        Returns (None, None) for catalogs small enough to scan exactly.
+        """
+        count = len(vectors)
+        if count <= EXACT_SEARCH_LIMIT:
+            return None, None
+
+        nlist = int(min(4096, max(16, math.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(count, size=min(sample_size, count), replace=False)
+        points = vectors[np.sort(sample)] * idf / norms[np.sort(sample), None]
+        centroids = points[rng.choice(len(points), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(points @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, points)
+            lengths = np.linalg.norm(sums, axis=1)
+            filled = lengths > 0
+            centroids[filled] = sums[filled] / lengths[filled, None]
+
+        assignments = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            block = vectors[start:start + 65536] * idf / norms[start:start + 65536, None]
+            assignments[start:start + 65536] = np.argmax(block @ centroids.T, axis=1)
+        return centroids.astype(np.float32), assignments
+
+    @contextmanager
+    def _build_lock(self):
+        """
+        Exclusive lock on the index directory across processes, held while a build runs
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'build.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _file(self, name, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{name}-{generation}")
+
+    def _write_generation(self, ids, fingerprints, vectors, row_positions, doc_freq, norms,
+                          centroids, list_offsets, source_fingerprint=None):
+        """
+        Write all arrays for a new generation, then point meta.json at it
+
+        Call with the build lock held.
+        """
+        previous = self.generation
+        generation = previous + 1
+
+        # Written aside and renamed into place: leftovers of an interrupted build may be mapped elsewhere
+        vectors_path = self._file('vectors', generation) + '.npy'
+        staging = f"{vectors_path}.tmp-{os.getpid()}"
+        # Plain file writes release the GIL; flushing a memory map does not
+        with open(staging, 'wb') as file:
+            np.save(file, np.asarray(vectors, dtype=np.float32))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(staging, vectors_path)
+
+        np.save(self._file('fingerprints', generation) + '.npy', np.asarray(fingerprints, dtype=np.uint64))
+        np.save(self._file('rows', generation) + '.npy', row_positions)
+        np.save(self._file('norms', generation) + '.npy', norms)
+        np.save(self._file('doc_freq', generation) + '.npy', doc_freq)
+        if centroids is not None:
+            np.save(self._file('centroids', generation) + '.npy', centroids)
+            np.save(self._file('lists', generation) + '.npy', list_offsets)
+        with open(self._file('ids', generation) + '.json', 'w') as file:
+            json.dump(ids, file)
+
+        self._replace_meta({
+            'generation': generation,
+            'dim': self.dim,
+            'count': len(ids),
+            'clustered': centroids is not None,
+            'source': source_fingerprint,
+        })
+
+        # Other processes may still serve the previous generation until they reload; drop the ones before it
+        for name in os.listdir(self.path):
+            stem = name.split('.', 1)[0]
+            if '-' in stem and stem.rsplit('-', 1)[1].isdigit() and int(stem.rsplit('-', 1)[1]) < previous:
+                os.remove(os.path.join(self.path, name))
+
+    def _replace_meta(self, meta):
+        meta_tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(meta_tmp, 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_tmp, os.path.join(self.path, 'meta.json'))
+
+    def _write_meta(self, source_fingerprint):
+        """
+        Record the catalog fingerprint for the current generation
+        """
+        with open(os.path.join(self.path, 'meta.json')) as file:
+            meta = json.load(file)
+        meta['source'] = source_fingerprint
+        self._replace_meta(meta)
+        self.source_fingerprint = source_fingerprint
+
+    def _load(self):
+        """
+        Load the generation referenced by meta.json, if any
+        """
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as file:
+            meta = json.load(file)
+        if meta['dim'] != self.dim:
+            logger.warning("Embedding index at %s has dim %d, expected %d; rebuilding", self.path, meta['dim'], self.dim)
+            # Keep the generation so the next build replaces (and cleans up) the old files
+            self.generation = meta['generation']
+            return
+
+        self.generation = meta['generation']
+        self.count = meta['count']
+        self.source_fingerprint = meta.get('source')
+        self._ids = None
+        self.vectors = np.load(self._file('vectors') + '.npy', mmap_mode='r')
+        self.fingerprints = np.load(self._file('fingerprints') + '.npy')
+        self.row_positions = np.load(self._file('rows') + '.npy')
+        self.position_rows = np.empty_like(self.row_positions)
+        self.position_rows[self.row_positions] = np.arange(len(self.row_positions))
+        self.norms = np.load(self._file('norms') + '.npy')
+        self.doc_freq = np.load(self._file('doc_freq') + '.npy')
+        self.idf = self._idf(self.doc_freq, meta['count'])
+        if meta['clustered']:
+            self.centroids = np.load(self._file('centroids') + '.npy')
+            self.list_offsets = np.load(self._file('lists') + '.npy')
+        else:
+            self.centroids = None
+            self.list_offsets = None
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def profile(self, positions):
+        """
+        Unit query vector for a set of catalog positions (e.g. browsed products)
+
+        Returns None when none of the positions are indexed.
+        """
+        positions = [p for p in positions if 0 <= p < len(self.position_rows)]
+        if not positions:
+            return None
+        rows = self.position_rows[np.asarray(positions)]
+        weighted = self.vectors[np.sort(rows)] * self.idf / self.norms[np.sort(rows), None]
+        query = weighted.mean(axis=0)
+        length = np.linalg.norm(query)
+        return query / length if length > 0 else None
+
+    def _scan(self, start, stop, weights):
+        """
+        Cosine scores of stored rows [start, stop) against an IDF-scaled query
+        """
+        return (self.vectors[start:stop] @ weights) / self.norms[start:stop]
+
+    def search(self, queries, k=20, mask=None):
+        """
+        Batched top-k cosine search
+
+        Parameters:
+        - queries (numpy.ndarray): Unit query vectors, shape (batch, dim) or (dim,)
+        - k (int): Results per query
+        - mask (numpy.ndarray): Optional boolean mask over catalog positions;
+          only positions where it is True are returned
+
+        Returns:
+        - list: One (positions, scores) pair per query, best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        results = []
+        if self.count == 0:
+            empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+            return [empty for _ in queries]
+
+        if self.centroids is None:
+            # Exact scan: one matrix product for the whole batch
+            scores = (self.vectors @ (queries * self.idf).T) / self.norms[:, None]
+            for column in range(len(queries)):
+                results.append(self._top(np.arange(self.count), scores[:, column], k, mask))
+            return results
+
+        for query in queries:
+            results.append(self._search_lists(query, k, mask))
+        return results
+
+    def _search_lists(self, query, k, mask):
+        """
+        Scan the inverted lists closest to the query, widening the probe if the
+        mask leaves fewer than k hits
+        """
+        weights = query * self.idf
+        list_order = np.argsort(-(self.centroids @ query))
+        nprobe = self.nprobe
+        while True:
+            rows, scores = [], []
+            for list_id in list_order[:nprobe]:
+                start, stop = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+                if stop > start:
+                    rows.append(np.arange(start, stop))
+                    scores.append(self._scan(start, stop, weights))
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+            scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+            positions, top_scores = self._top(rows, scores, k, mask)
+            if len(positions) >= k or nprobe >= len(list_order):
+                return positions, top_scores
+            nprobe *= 4
+
+    def _top(self, rows, scores, k, mask):
+        """
+        Map stored rows to catalog positions, apply the mask and keep the best k
+        """
+        positions = self.row_positions[rows]
+        if mask is not None:
+            keep = mask[positions]
+            positions, scores = positions[keep], scores[keep]
+        if len(positions) > k:
+            selected = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[selected], scores[selected]
+        order = np.lexsort((positions, -scores))
+        return positions[order], scores[order]
+
+    def similar_to(self, positions, k=20, mask=None, min_score=0.05):
+        """
+        Catalog positions most similar to a set of products, best first
+
+        Parameters:
+        - positions (list): Catalog positions to use as the query (e.g. browsed products)
+        - k (int): Number of results
+        - mask (numpy.ndarray): Optional boolean mask of allowed catalog positions
+        - min_score (float): Minimum cosine similarity to be returned
+
+        Returns:
+        - numpy.ndarray: Catalog positions
+        """
+        query = self.profile(positions)
+        if query is None:
+            return np.zeros(0, dtype=np.int64)
+        found, scores = self.search(query, k=k, mask=mask)[0]
+        # Hashing noise can give unrelated products a small score; only keep real overlap
+        return found[scores > min_score]
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class FallbackRanker:
+    """
+    Deterministic, LLM-free recommendation ranker
+
+    Used when the LLM fails or misses its latency budget. Scores every catalog
+    product in a few vectorized passes from preference match, overlap with the
+    browsed products (subcategory, category, brand, tags), rating and stock,
+    and returns the same shape as LLMService._parse_recommendation_response
+    with templated explanations.
+    """
+
+    TAG_WEIGHT = 0.15
+    MAX_TAG_OVERLAP = 4
+    # Lowest rating (out of 5) an explanation calls "highly rated"
+    HIGH_RATING = 4.5
+
+    def rank(self, user_preferences, browsed_products, catalog, k=5):
+        """
+        Rank catalog products for a user without calling the LLM
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - catalog (CatalogIndex): Catalog snapshot to rank from
+        - k (int): Number of recommendations
+
+        Returns:
+        - dict: {"recommendations": [...], "count": n}
+        """
+        candidate_filter = catalog.candidate_filter
+        browsed_positions = catalog.positions_of([p['id'] for p in browsed_products])
+        browsed_tags = [tag for product in browsed_products for tag in product.get('tags', [])]
+
+        scores = candidate_filter.relevance(browsed_positions)
+        tag_overlap = catalog.tag_overlap(browsed_tags)
+        scores += np.float32(self.TAG_WEIGHT) * np.minimum(tag_overlap, self.MAX_TAG_OVERLAP)
+
+        # Products matching every stated preference first; relax only if there are too few
+        strict = candidate_filter.candidate_mask(user_preferences, browsed_positions)
+        positions = list(candidate_filter.top_k(np.flatnonzero(strict), scores[strict], k))
+        if len(positions) < k:
+            relaxed = candidate_filter.candidate_mask({}, browsed_positions)
+            relaxed[positions] = False
+            positions.extend(candidate_filter.top_k(np.flatnonzero(relaxed), scores[relaxed], k - len(positions)))
+
+        top_score = float(scores[positions[0]]) if positions else 1.0
+        recommendations = []
+        for position in positions:
+            product = catalog.products[int(position)]
+            recommendations.append({
+                "product": product,
+                "explanation": self._explain(product, user_preferences, browsed_products, int(tag_overlap[position])),
+                "confidence_score": max(1, min(10, int(round(10 * float(scores[position]) / top_score)))) if top_score > 0 else 5
+            })
+        return {"recommendations": recommendations, "count": len(recommendations)}
+
+    def _explain(self, product, user_preferences, browsed_products, shared_tags):
+        """
+        Build a short explanation from the strongest matching signals
+        """
+        reasons = []
+        similar = next((b for b in browsed_products if b.get('subcategory') == product.get('subcategory')), None)
+        if similar:
+            reasons.append(f"it is similar to the {similar['name']} you viewed")
+        elif shared_tags:
+            reasons.append("it shares features with products you viewed")
+        if product.get('category') in (user_preferences.get('categories') or []):
+            reasons.append(f"it matches your interest in {product['category']}")
+        if product.get('brand') in (user_preferences.get('brands') or []) or any(
+                b.get('brand') == product.get('brand') for b in browsed_products):
+            reasons.append(f"it is from {product['brand']}, a brand you like")
+        if (product.get('rating') or 0) >= self.HIGH_RATING:
+            reasons.append(f"it is highly rated ({product['rating']}/5)")
+        elif not reasons:
+            reasons.append(f"it is one of the best-ranked {product['category']} products in stock")
+        return "Recommended because " + " and ".join(reasons[:2]) + "."
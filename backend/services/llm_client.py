@@ -0,0 +1,265 @@
+import asyncio
+import json
+
+import aiohttp
+import openai
+
+from config import config
+
+
+def _error_message(body):
+    """
+    Pull the provider's error message out of an error response body
+    """
+    if isinstance(body, dict):
+        error = body.get('error')
+        if isinstance(error, dict):
+            return error.get('message') or str(error)
+        if error:
+            return str(error)
+    return str(body)
+
+
+def raise_for_status(status, body, headers=None):
+    """
+    Raise the openai.error exception matching an HTTP error status
+
+    The transports speak plain HTTP but raise the same exception types as the
+    openai client, so callers keep handling a single family of errors.
+    """
+    if status < 400:
+        return
+    message = _error_message(body)
+    kwargs = {'http_status': status, 'json_body': body if isinstance(body, dict) else None, 'headers': headers}
+    if status == 429:
+        raise openai.error.RateLimitError(message, **kwargs)
+    if status == 401:
+        raise openai.error.AuthenticationError(message, **kwargs)
+    if status == 403:
+        raise openai.error.PermissionError(message, **kwargs)
+    if status in (400, 404, 409, 422):
+        raise openai.error.InvalidRequestError(message, None, **kwargs)
+    if status in (502, 503, 504):
+        raise openai.error.ServiceUnavailableError(message, **kwargs)
+    raise openai.error.APIError(message, **kwargs)
+
+
+# Errors worth retrying after a pause (or on another backend)
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+)
+
+
+def retry_after(error):
+    """
+    Seconds from the Retry-After header of an error response, or None
+    """
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+class AiohttpTransport:
+    """
+    Chat-completions transport over a shared, pooled aiohttp session
+
+    Works against any server that implements the OpenAI chat-completions API,
+    including the local stub in benchmarks/stub_llm_server.py.
+    """
+
+    def __init__(self, api_base, api_key, pool_size=100, connect_timeout=5.0, request_timeout=60.0):
+        """
+        Parameters:
+        - api_base (str): Base URL, e.g. https://api.openai.com/v1
+        - api_key (str): Bearer token sent with every request
+        - pool_size (int): Maximum open connections in the pool
+        - connect_timeout (float): Seconds allowed to establish a connection
+        - request_timeout (float): Seconds allowed for a whole request
+        """
+        self.api_base = api_base.rstrip('/')
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        self._session = None
+
+    def _get_session(self):
+        """
+        Create the pooled session on first use, inside the running event loop
+        """
+        if self._session is None or self._session.closed:
+            headers = {'Content-Type': 'application/json'}
+            if self.api_key:
+                headers['Authorization'] = f"Bearer {self.api_key}"
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                timeout=self.timeout,
+                headers=headers,
+            )
+        return self._session
+
+    async def create(self, payload):
+        """
+        POST a chat-completions request and return the decoded JSON response
+        """
+        session = self._get_session()
+        try:
+            async with session.post(f"{self.api_base}/chat/completions", json=payload) as response:
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    body = {'error': await response.text()}
+                raise_for_status(response.status, body, dict(response.headers))
+                return body
+        except asyncio.TimeoutError as e:
+            raise openai.error.Timeout(f"Request timed out: {str(e)}") from e
+        except aiohttp.ClientError as e:
+            raise openai.error.APIConnectionError(f"Error communicating with LLM API: {str(e)}") from e
+
+    async def stream(self, payload):
+        """
+        POST a streaming chat-completions request and yield content deltas
+
+        Parses the server-sent events of the response (`data: {...}` lines,
+        terminated by `data: [DONE]`).
+        """
+        session = self._get_session()
+        try:
+            async with session.post(f"{self.api_base}/chat/completions", json={**payload, 'stream': True}) as response:
+                if response.status >= 400:
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = {'error': await response.text()}
+                    raise_for_status(response.status, body, dict(response.headers))
+
+                async for raw_line in response.content:
+                    line = raw_line.strip()
+                    if not line.startswith(b'data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == b'[DONE]':
+                        break
+                    event = json.loads(data)
+                    for choice in event.get('choices', []):
+                        content = choice.get('delta', {}).get('content')
+                        if content:
+                            yield content
+        except asyncio.TimeoutError as e:
+            raise openai.error.Timeout(f"Request timed out: {str(e)}") from e
+        except aiohttp.ClientError as e:
+            raise openai.error.APIConnectionError(f"Error communicating with LLM API: {str(e)}") from e
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class LLMClient:
+    """
+    Async chat-completions client with a concurrency limit
+
+    The transport does the actual I/O; anything with `async create(payload)`,
+    an async-generator `stream(payload)` and `async close()` can be plugged in.
+    """
+
+    def __init__(self, transport, max_concurrency=32):
+        """
+        Parameters:
+        - transport: Object implementing `create(payload)`, `stream(payload)` and `close()`
+        - max_concurrency (int): Maximum in-flight LLM calls per process
+        """
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        # Calls started and not finished, including those waiting for a slot
+        self.active = 0
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build a client for the configured provider
+        """
+        transport = AiohttpTransport(
+            api_base=config['LLM_API_BASE'],
+            api_key=config['OPENAI_API_KEY'],
+            pool_size=config['LLM_POOL_SIZE'],
+            connect_timeout=config['LLM_CONNECT_TIMEOUT'],
+            request_timeout=config['LLM_REQUEST_TIMEOUT'],
+        )
+        return cls(transport, max_concurrency=config['LLM_MAX_CONCURRENCY'])
+
+    async def chat_completion(self, model, messages, max_tokens, temperature, max_retries=None, **params):
+        """
+        Run one chat completion, waiting for a free slot if the limit is reached
+
+        Errors are raised as they occur; `max_retries` is accepted for
+        compatibility with LLMRouter and ignored.
+
+        Returns:
+        - dict: Decoded chat-completions response
+        """
+        payload = self._payload(model, messages, max_tokens, temperature, params)
+        self.active += 1
+        try:
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    return await self.transport.create(payload)
+                finally:
+                    self.in_flight -= 1
+        finally:
+            self.active -= 1
+
+    async def stream_chat_completion(self, model, messages, max_tokens, temperature, **params):
+        """
+        Run one streaming chat completion, yielding content deltas as they arrive
+
+        The concurrency slot is held until the stream finishes or is closed.
+        """
+        payload = self._payload(model, messages, max_tokens, temperature, params)
+        self.active += 1
+        try:
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    async for content in self.transport.stream(payload):
+                        yield content
+                finally:
+                    self.in_flight -= 1
+        finally:
+            self.active -= 1
+
+    def _payload(self, model, messages, max_tokens, temperature, params):
+        return {
+            'model': model,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            **params,
+        }
+
+    async def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds for every started call to finish
+
+        Returns:
+        - int: Calls still unfinished when the wait ended
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.active and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        return self.active
+
+    async def close(self):
+        await self.transport.close()
@@ -0,0 +1,439 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import time
+
+import openai
+
+from config import config
+from services.llm_client import RETRYABLE_ERRORS, AiohttpTransport, retry_after
+from services.rate_limiter import RateLimiter
+from services.tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Concurrency limit adjusted AIMD-style from the outcome of each call
+
+    Every successful call below the latency target raises the limit by
+    1/limit, i.e. by one per round of `limit` calls. A rate-limited call, or
+    one slower than the target, halves it. Calls started before a decrease
+    cannot trigger another one, so a burst of 429s from the same round
+    halves the limit once rather than once per call.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, latency_target=0.0, backoff=0.5):
+        """
+        Parameters:
+        - initial (int): Starting limit
+        - minimum (int): Lowest limit
+        - maximum (int): Highest limit (defaults to `initial`)
+        - latency_target (float): Seconds; slower calls count as overload (0 disables)
+        - backoff (float): Factor applied to the limit on overload
+        """
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.limit = float(max(minimum, min(initial, self.maximum)))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.decreases = 0
+        self._epoch = 0
+        # Callers waiting for a slot, served in arrival order
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        """
+        Wait for a free slot
+
+        Returns:
+        - int: Token to pass to `release`
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return self._epoch
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(self._epoch)
+
+    def release(self, epoch, latency=None, overloaded=False):
+        """
+        Free a slot and adjust the limit
+
+        Parameters:
+        - epoch (int): Token returned by `acquire`
+        - latency (float): Seconds the call took; None if it failed for another reason
+        - overloaded (bool): The backend rejected the call for capacity (429)
+        """
+        if self.latency_target and latency is not None and latency > self.latency_target:
+            overloaded = True
+        self.in_flight -= 1
+        if overloaded:
+            if epoch == self._epoch:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._epoch += 1
+                self.decreases += 1
+        elif latency is not None:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+
+class LLMBackend:
+    """
+    One chat-completions endpoint and model, with its own rate limits, adaptive concurrency and health
+
+    After `failure_threshold` consecutive failures (timeouts, connection
+    errors, 5xx) the backend is marked unhealthy for `cooldown` seconds,
+    doubling with each further trip up to MAX_COOLDOWN. Once the cooldown
+    has passed it is tried again, and a single success makes it healthy.
+    Rate-limited calls do not count as failures: they pause the backend's
+    rate limiter for the provider's Retry-After and shrink its concurrency.
+    """
+
+    MAX_COOLDOWN = 60.0
+
+    def __init__(self, name, transport, model=None, requests_per_minute=0, tokens_per_minute=0,
+                 max_concurrency=32, latency_target_ms=0, failure_threshold=3, cooldown=5.0):
+        """
+        Parameters:
+        - name (str): Name used in logs and stats
+        - transport: Object implementing `create(payload)`, `stream(payload)` and `close()`
+        - model (str): Model sent to this backend; the caller's model when None
+        - requests_per_minute (float): Request limit; 0 for none
+        - tokens_per_minute (float): Token limit (prompt plus completion cap); 0 for none
+        - max_concurrency (int): Upper bound of the adaptive concurrency limit
+        - latency_target_ms (float): Calls slower than this shrink the concurrency limit (0 disables)
+        - failure_threshold (int): Consecutive failures that make the backend unhealthy
+        - cooldown (float): Seconds an unhealthy backend is skipped after its first trip
+        """
+        self.name = name
+        self.transport = transport
+        self.model = model
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency, latency_target=latency_target_ms / 1000)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.unhealthy_until = 0.0
+        self.rate_limited_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def available_at(self):
+        """
+        Monotonic time from which the backend is neither unhealthy nor told to back off
+        """
+        return max(self.unhealthy_until, self.rate_limited_until)
+
+    def _payload(self, payload):
+        return {**payload, 'model': self.model} if self.model else payload
+
+    async def _acquire(self, tokens):
+        await self.rate_limiter.acquire(tokens)
+        self.requests += 1
+        return await self.concurrency.acquire()
+
+    def _succeeded(self):
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.unhealthy_until = 0.0
+
+    def _failed(self, error):
+        """
+        Record a failed call
+
+        Returns:
+        - bool: True if the backend was overloaded (rate limited)
+        """
+        if isinstance(error, openai.error.RateLimitError):
+            self.rate_limited += 1
+            delay = retry_after(error) or 1.0
+            self.rate_limiter.pause(delay)
+            self.rate_limited_until = max(self.rate_limited_until, time.monotonic() + delay)
+            return True
+        self.failures += 1
+        self.consecutive_failures += 1
+        # Calls already in flight when the backend was marked unhealthy do not extend the cooldown
+        if self.consecutive_failures >= self.failure_threshold and self.healthy:
+            self.trips += 1
+            cooldown = min(self.cooldown * 2 ** (self.trips - 1), self.MAX_COOLDOWN)
+            self.unhealthy_until = time.monotonic() + cooldown
+            logger.warning("LLM backend %s unhealthy for %.0fs after %d consecutive failures: %s",
+                           self.name, cooldown, self.consecutive_failures, error)
+        return False
+
+    async def create(self, payload, tokens):
+        epoch = await self._acquire(tokens)
+        start = time.monotonic()
+        try:
+            response = await self.transport.create(self._payload(payload))
+        except RETRYABLE_ERRORS as e:
+            self.concurrency.release(epoch, overloaded=self._failed(e))
+            raise
+        except BaseException:
+            self.concurrency.release(epoch)
+            raise
+        self._succeeded()
+        self.concurrency.release(epoch, latency=time.monotonic() - start)
+        return response
+
+    async def stream(self, payload, tokens):
+        """
+        Yield content deltas; the concurrency slot is held until the stream ends
+
+        The latency fed to the concurrency limit is the time to first content.
+        """
+        epoch = await self._acquire(tokens)
+        start = time.monotonic()
+        latency = None
+        try:
+            async for content in self.transport.stream(self._payload(payload)):
+                if latency is None:
+                    latency = time.monotonic() - start
+                yield content
+        except RETRYABLE_ERRORS as e:
+            self.concurrency.release(epoch, overloaded=self._failed(e))
+            raise
+        except BaseException:
+            self.concurrency.release(epoch)
+            raise
+        self._succeeded()
+        self.concurrency.release(epoch, latency=latency if latency is not None else time.monotonic() - start)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'model': self.model,
+            'healthy': self.healthy,
+            'unhealthy_seconds': round(max(self.unhealthy_until - now, 0.0), 1),
+            'concurrency_limit': round(self.concurrency.limit, 1),
+            'in_flight': self.concurrency.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'rate_limited': self.rate_limited,
+            'rate_limiter': self.rate_limiter.stats(),
+        }
+
+
+class LLMRouter:
+    """
+    Chat-completions client that spreads calls over several backends
+
+    Backends are tried in their configured order. A call goes to the first
+    one that is healthy and not backing off after a 429, else to the one
+    that becomes available soonest. Retryable errors (429, timeouts,
+    connection errors, 5xx) are retried up to `max_retries` times: at once
+    on another backend if one is available, otherwise on the same backend
+    after an exponential backoff with full jitter (or its Retry-After). A
+    stream is only retried until its first content has been yielded.
+
+    Has the interface of LLMClient, so LLMService can use either.
+    """
+
+    MAX_BACKOFF = 8.0
+
+    def __init__(self, backends, max_retries=2, backoff=0.25, tokenizer=None):
+        """
+        Parameters:
+        - backends (list): LLMBackend instances in order of preference
+        - max_retries (int): Retries per call for retryable errors (callers may override it per call)
+        - backoff (float): Seconds of the first retry delay; doubles per retry
+        - tokenizer (Tokenizer): Counts prompt tokens for the tokens-per-minute limits;
+          the configured one (Tokenizer.from_config) when omitted
+        """
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer.from_config()
+        # Calls started and not finished, including those waiting for a slot or a retry
+        self.active = 0
+        self.retries = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_config(cls, tokenizer=None):
+        """
+        Build a router from LLM_BACKENDS, or a single backend from the LLM_* settings when it is empty
+
+        LLM_BACKENDS is a JSON list of objects with "api_base" and optionally
+        "name", "api_key" (or "api_key_env", the variable holding it), "model",
+        "requests_per_minute", "tokens_per_minute", "max_concurrency" and
+        "latency_target_ms". Omitted settings come from the LLM_* variables.
+        """
+        specs = json.loads(config['LLM_BACKENDS']) if config['LLM_BACKENDS'] else [{}]
+        backends = []
+        for index, spec in enumerate(specs):
+            api_key = spec.get('api_key')
+            if api_key is None:
+                api_key = os.getenv(spec['api_key_env']) if spec.get('api_key_env') else config['OPENAI_API_KEY']
+            transport = AiohttpTransport(
+                api_base=spec.get('api_base', config['LLM_API_BASE']),
+                api_key=api_key,
+                pool_size=config['LLM_POOL_SIZE'],
+                connect_timeout=config['LLM_CONNECT_TIMEOUT'],
+                request_timeout=config['LLM_REQUEST_TIMEOUT'],
+            )
+            backends.append(LLMBackend(
+                spec.get('name', f"backend-{index}"),
+                transport,
+                model=spec.get('model'),
+                requests_per_minute=spec.get('requests_per_minute', config['LLM_REQUESTS_PER_MINUTE']),
+                tokens_per_minute=spec.get('tokens_per_minute', config['LLM_TOKENS_PER_MINUTE']),
+                max_concurrency=spec.get('max_concurrency', config['LLM_MAX_CONCURRENCY']),
+                latency_target_ms=spec.get('latency_target_ms', config['LLM_LATENCY_TARGET_MS']),
+                failure_threshold=config['LLM_FAILURE_THRESHOLD'],
+                cooldown=config['LLM_UNHEALTHY_SECONDS'],
+            ))
+        return cls(backends, max_retries=config['LLM_MAX_RETRIES'], backoff=config['LLM_RETRY_BACKOFF_MS'] / 1000,
+                   tokenizer=tokenizer)
+
+    @property
+    def in_flight(self):
+        return sum(backend.concurrency.in_flight for backend in self.backends)
+
+    def _select(self):
+        """
+        The preferred backend that can take a call now, else the one available soonest
+        """
+        now = time.monotonic()
+        for backend in self.backends:
+            if backend.available_at() <= now:
+                return backend
+        return min(self.backends, key=LLMBackend.available_at)
+
+    def _retry_delay(self, error, attempt):
+        """
+        Full-jitter exponential backoff, but at least the provider's Retry-After
+        """
+        delay = random.uniform(0, min(self.backoff * 2 ** attempt, self.MAX_BACKOFF))
+        return max(delay, retry_after(error) or 0.0)
+
+    async def _next_backend(self, failed, error, attempt):
+        """
+        Count the retry and pick its backend, sleeping first if it is the one that just failed
+        """
+        self.retries += 1
+        backend = self._select()
+        if backend is failed:
+            await asyncio.sleep(self._retry_delay(error, attempt))
+        else:
+            self.failovers += 1
+            logger.info("LLM call failed on %s (%s); retrying on %s", failed.name, type(error).__name__, backend.name)
+        return backend
+
+    def _estimate_tokens(self, messages, max_tokens):
+        """
+        Tokens a call may consume for the tokens-per-minute limits: the counted prompt plus the completion cap
+        """
+        return self.tokenizer.count_messages(messages) + (max_tokens or 0)
+
+    async def chat_completion(self, model, messages, max_tokens, temperature, max_retries=None, **params):
+        """
+        Run one chat completion, retrying and failing over on retryable errors
+
+        Parameters:
+        - max_retries (int): Retries for this call; None for the router's own. Callers that
+          retry on their own (batch runs) pass 0
+
+        Returns:
+        - dict: Decoded chat-completions response
+        """
+        payload = {'model': model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature,
+                   **params}
+        tokens = self._estimate_tokens(messages, max_tokens)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        self.active += 1
+        try:
+            backend = self._select()
+            for attempt in range(max_retries + 1):
+                try:
+                    return await backend.create(payload, tokens)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == max_retries:
+                        raise
+                    backend = await self._next_backend(backend, e, attempt)
+        finally:
+            self.active -= 1
+
+    async def stream_chat_completion(self, model, messages, max_tokens, temperature, **params):
+        """
+        Run one streaming chat completion, yielding content deltas as they arrive
+
+        Errors before the first delta are retried like chat_completion; after
+        it they are raised, since the caller has already consumed content.
+        """
+        payload = {'model': model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature,
+                   **params}
+        tokens = self._estimate_tokens(messages, max_tokens)
+        self.active += 1
+        try:
+            backend = self._select()
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    async for content in backend.stream(payload, tokens):
+                        started = True
+                        yield content
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started or attempt == self.max_retries:
+                        raise
+                    backend = await self._next_backend(backend, e, attempt)
+        finally:
+            self.active -= 1
+
+    async def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds for every started call to finish
+
+        Returns:
+        - int: Calls still unfinished when the wait ended
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.active and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        return self.active
+
+    def stats(self):
+        """
+        Retry and failover counters and the state of each backend
+        """
+        return {
+            'active': self.active,
+            'retries': self.retries,
+            'failovers': self.failovers,
+            'backends': [backend.stats() for backend in self.backends],
+        }
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.transport.close()
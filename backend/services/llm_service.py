@@ -1,251 +1,740 @@
+import asyncio
+import json
 import openai
 from config import config
 import logging
+import time
+
+from services.admission_control import AdmissionRejected
+from services.fallback_ranker import FallbackRanker
+from services.compact_response import IncrementalLineParser
+from services.llm_router import LLMRouter
+from services.metrics import MetricsRegistry, SampledLogger, StageTimer
+from services.prompt_builder import PromptBuilder
+from services.recommendation_cache import RecommendationCache, SQLiteCacheBackend, catalog_identity, make_cache_key
+from services.single_flight import SingleFlight
+from services.stream_parser import IncrementalJSONArrayParser
+from services.tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Label values of the recommendation metrics
+STAGES = ('cache', 'history', 'candidates', 'prompt', 'llm', 'parse', 'enrich')
+SOURCES = ('precomputed', 'cache', 'llm', 'fallback', 'stale')
+FALLBACK_REASONS = ('timeout', 'error', 'empty', 'overload')
+ERROR_TYPES = ('rate_limit', 'invalid_request', 'timeout', 'authentication', 'api', 'unexpected', 'parse')
 
 class LLMService:
     """
     Service to handle interactions with the LLM API
     """
+
+    # Seconds before a request's deadline at which the LLM is given up on (time to send the response)
+    DEADLINE_MARGIN = 0.1
     
-    def __init__(self):
+    def __init__(self, product_service, llm_client=None, cache=None, coalesce=None, latency_budget_ms=None,
+                 metrics=None, admission=None, segments=None):
         """
         Initialize the LLM service with configuration
+
+        Parameters:
+        - product_service (ProductService): Catalog used to resolve product IDs
+        - llm_client (LLMRouter or LLMClient): Async LLM client; an LLMRouter built from config when omitted
+        - cache (RecommendationCache): Response cache; built from config when omitted
+        - coalesce (bool): Share one LLM call between concurrent identical requests
+          (defaults to RECOMMENDATION_COALESCING)
+        - latency_budget_ms (float): Serve the local fallback ranking if the LLM has
+          not answered within this time; 0 disables (defaults to LLM_LATENCY_BUDGET_MS)
+        - metrics (MetricsRegistry): Registry for the pipeline metrics; a private one when omitted
+        - admission (AdmissionController): Bounds the requests that miss the cache and go to
+          the LLM; shed requests get a stale cached response, the fallback ranking
+          (ADMISSION_SHED_RESPONSE=fallback) or AdmissionRejected. None admits everything
+        - segments (SegmentCache): Recommendations precomputed for common preferences,
+          served to requests without a browsing history before the cache is consulted
         """
-        openai.api_key = config['OPENAI_API_KEY']
+        self.product_service = product_service
+        self.segments = segments
+        self.admission = admission
+        self.shed_response = config['ADMISSION_SHED_RESPONSE']
         self.model_name = config['MODEL_NAME']
+        self.tokenizer = Tokenizer.from_config()
+        self.llm_client = llm_client if llm_client is not None else LLMRouter.from_config(self.tokenizer)
+        self.cache = cache if cache is not None else self._create_cache()
+        self.coalesce = config['RECOMMENDATION_COALESCING'] if coalesce is None else coalesce
+        self.single_flight = SingleFlight()
+        self.fallback_ranker = FallbackRanker()
+        self.latency_budget_ms = config['LLM_LATENCY_BUDGET_MS'] if latency_budget_ms is None else latency_budget_ms
+        # MAX_TOKENS bounds the completion (each prompt also carries a cap sized to
+        # the reply it asks for); the prompt has its own budget
         self.max_tokens = config['MAX_TOKENS']
+        self.response_format = config['LLM_RESPONSE_FORMAT']
         self.temperature = config['TEMPERATURE']
+        self.candidate_count = config['PROMPT_CANDIDATES']
+        self.prompt_builder = PromptBuilder(
+            self.tokenizer,
+            config['MAX_PROMPT_TOKENS'],
+            section_rows=config['PROMPT_SECTION_ROWS'],
+            response_format=self.response_format
+        )
+        self.prompt_builder.prepare(product_service.catalog)
+        self._create_metrics(metrics if metrics is not None else MetricsRegistry())
+        self.slow_request_ms = config['SLOW_RECOMMENDATION_MS']
+        self.log = SampledLogger(logger, config['LOG_SAMPLE_EVERY'])
 
-    def _estimate_token_count(self, prompt):
-        # Rough estimation: 1 token ≈ 4 characters
-        return len(prompt) // 4
+        # Cached responses and prompt prefixes refer to the old catalog once it is reloaded
+        product_service.add_reload_listener(self._on_reload)
 
-    
-    def generate_recommendations(self, user_preferences, browsing_history, all_products):
+    def _on_reload(self, catalog):
+        # Keys carry the catalog fingerprint, so entries of another catalog are never served; this
+        # only frees memory. The shared backend is left alone: other workers may already be filling
+        # it for the new catalog, and old entries expire there on their own.
+        self.cache.invalidate(shared=False)
+        self.prompt_builder.prepare(catalog)
+
+    def _create_metrics(self, registry):
+        """
+        Declare the recommendation pipeline metrics
+        """
+        self.metrics = registry
+        self.stages = StageTimer(registry.histogram(
+            'recommendation_stage_seconds', 'Time spent in each recommendation pipeline stage',
+            label='stage', values=STAGES
+        ))
+        self.request_seconds = registry.histogram(
+            'recommendation_request_seconds', 'Recommendation request latency by where the answer came from',
+            label='source', values=SOURCES
+        )
+        self.cache_lookups = registry.counter(
+            'recommendation_cache_lookups_total', 'Recommendation cache lookups', label='result', values=('hit', 'miss')
+        )
+        self.fallbacks = registry.counter(
+            'recommendation_fallbacks_total', 'Responses served by the fallback ranker',
+            label='reason', values=FALLBACK_REASONS
+        )
+        self.errors = registry.counter(
+            'llm_errors_total', 'Failed LLM calls and unparseable responses', label='type', values=ERROR_TYPES
+        )
+        self.tokens = registry.counter(
+            'llm_tokens_total', 'Tokens sent to and generated by the LLM', label='kind',
+            values=('prompt', 'completion')
+        )
+
+    def _create_cache(self):
+        """
+        Build the recommendation cache from config
+        """
+        backend = None
+        if config['RECOMMENDATION_CACHE_BACKEND'] == 'sqlite':
+            backend = SQLiteCacheBackend(config['RECOMMENDATION_CACHE_PATH'])
+        return RecommendationCache(
+            max_entries=config['RECOMMENDATION_CACHE_SIZE'],
+            ttl_seconds=config['RECOMMENDATION_CACHE_TTL'],
+            backend=backend
+        )
+
+    async def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds for in-flight LLM calls to finish
+
+        Includes calls still running after their request was answered from the
+        fallback ranker, whose results are cached when they arrive.
+
+        Returns:
+        - int: Calls abandoned because the timeout expired
+        """
+        return await self.llm_client.drain(timeout)
+
+    async def close(self):
+        """
+        Release pooled LLM connections
+        """
+        await self.llm_client.close()
+
+    async def generate_recommendations(self, user_preferences, browsing_history, deadline=None):
         """
         Generate personalized product recommendations based on user preferences and browsing history
         
         Parameters:
         - user_preferences (dict): User's stated preferences
         - browsing_history (list): List of product IDs the user has viewed
-        - all_products (list): Full product catalog
+        - deadline (float): time.monotonic() by which the client needs the answer; the LLM
+          latency budget is shortened to fit it
         
         Returns:
         - dict: Recommended products with explanations
+
+        Raises:
+        - AdmissionRejected: If admission control shed the request and it is not answered otherwise
         """
-        # TODO: Implement LLM-based recommendation logic
-        # This is where your prompt engineering expertise will be evaluated
-        
-        # Get browsed products details
-        browsed_products = []
-        for product_id in browsing_history:
-            for product in all_products:
-                if product["id"] == product_id:
-                    browsed_products.append(product)
-                    break
-        
-        # Create a prompt for the LLM
-        # IMPLEMENT YOUR PROMPT ENGINEERING HERE
-        prompt = self._create_recommendation_prompt(user_preferences, browsed_products, all_products)
-        
-        # Call the LLM API
+        with self.stages.trace() as trace:
+            recommendations, source = await self._recommend(user_preferences, browsing_history, deadline)
+        elapsed = trace.elapsed
+        self.request_seconds.observe(elapsed, source)
+        if elapsed * 1000 >= self.slow_request_ms:
+            self.log.warning("Slow recommendation request: %.0f ms, source %s (%s)", elapsed * 1000, source, trace)
+        return recommendations
+
+    async def _recommend(self, user_preferences, browsing_history, deadline=None):
+        """
+        Answer one request from the cache, the LLM or the fallback ranker
+
+        Returns:
+        - tuple: (recommendations dict, source: 'precomputed', 'cache', 'llm', 'fallback' or 'stale')
+        """
+        # Use one catalog reference for the whole request
+        catalog = self.product_service.catalog
+
+        # Serve repeated preference/history combinations from the cache
+        with self.stages.span('cache'):
+            precomputed = self._precomputed(user_preferences, browsing_history, catalog)
+            if precomputed is not None:
+                return precomputed, 'precomputed'
+            cache_key = make_cache_key(user_preferences, browsing_history, catalog_identity(catalog))
+            cached = await self.cache.get_async(cache_key)
+        if cached is not None:
+            self.cache_lookups.inc(label_value='hit')
+            return cached, 'cache'
+        self.cache_lookups.inc(label_value='miss')
+
+        async def generate_and_cache():
+            # Only the call that reaches the LLM takes an admission slot, not the requests
+            # coalesced onto it; the slot is held until the call ends, also when it
+            # outlives the request's budget
+            ticket = await self.admission.acquire(deadline) if self.admission is not None else None
+            try:
+                recommendations = await self._generate(user_preferences, browsing_history, catalog)
+            finally:
+                if ticket is not None:
+                    self.admission.release(ticket)
+            if "error" not in recommendations and recommendations.get("recommendations"):
+                self.cache.set(cache_key, recommendations)
+            return recommendations
+
+        # Concurrent identical requests share a single LLM call
+        if self.coalesce:
+            llm_call = asyncio.ensure_future(self.single_flight.do(cache_key, generate_and_cache))
+        else:
+            llm_call = asyncio.ensure_future(generate_and_cache())
+        # A rejection arriving after the budget expired has nobody left to handle it
+        llm_call.add_done_callback(lambda call: call.cancelled() or call.exception())
+
+        budget = self._latency_budget(deadline)
         try:
-            if self._estimate_token_count(prompt) > self.max_tokens:
-                print("Prompt too long for max_tokens. Consider filtering catalog or shortening description.")
+            if budget is not None:
+                # The shielded call keeps running after the budget expires and caches
+                # its result, so a repeat request gets the LLM ranking
+                recommendations = await asyncio.wait_for(asyncio.shield(llm_call), budget)
+            else:
+                recommendations = await llm_call
+        except asyncio.TimeoutError:
+            self.log.warning("LLM exceeded the %.0f ms latency budget; serving fallback ranking", budget * 1000)
+            return self._fallback(user_preferences, browsing_history, catalog, "timeout"), 'fallback'
+        except AdmissionRejected as e:
+            # The call was shed, so are the requests coalesced onto it
+            return self._shed(e, cache_key, user_preferences, browsing_history, catalog)
+
+        if "error" in recommendations or not recommendations.get("recommendations"):
+            reason = recommendations.get("error", "empty")
+            return self._fallback(user_preferences, browsing_history, catalog, reason), 'fallback'
+        return recommendations, 'llm'
+
+    def _latency_budget(self, deadline):
+        """
+        Seconds the LLM may take before the fallback is served, or None for no limit
+        """
+        budget = self.latency_budget_ms / 1000 if self.latency_budget_ms else None
+        if deadline is not None:
+            # Answer a little before the deadline, so the response reaches the client in time
+            remaining = max(deadline - time.monotonic() - self.DEADLINE_MARGIN, 0.0)
+            budget = remaining if budget is None else min(budget, remaining)
+        return budget
+
+    def _precomputed(self, user_preferences, browsing_history, catalog):
+        """
+        Precomputed recommendations for the request's segment, or None
+        """
+        if self.segments is None or browsing_history:
+            return None
+        return self.segments.get(user_preferences, catalog)
+
+    def _shed(self, rejection, cache_key, user_preferences, browsing_history, catalog):
+        """
+        Degraded answer for a request shed by admission control
+
+        Returns:
+        - tuple: (an expired cached response marked "degraded", 'stale'), or
+          (the fallback ranking, 'fallback') with ADMISSION_SHED_RESPONSE=fallback
+
+        Raises:
+        - AdmissionRejected: `rejection`, when neither is available
+        """
+        stale = self.cache.get_stale(cache_key)
+        if stale is not None:
+            return {**stale, "source": "stale", "degraded": True}, 'stale'
+        if self.shed_response == 'fallback':
+            return self._fallback(user_preferences, browsing_history, catalog, "overload"), 'fallback'
+        raise rejection
+
+    def _fallback(self, user_preferences, browsing_history, catalog, reason):
+        """
+        Rank locally instead of with the LLM, marking the response as a fallback
+        """
+        self.fallbacks.inc(label_value=reason if reason in FALLBACK_REASONS else 'error')
+        recommendations = self.fallback_ranker.rank(user_preferences, catalog.get_many(browsing_history), catalog)
+        recommendations["source"] = "fallback"
+        recommendations["fallback_reason"] = reason
+        return recommendations
+
+    async def _generate(self, user_preferences, browsing_history, catalog):
+        """
+        Run the full prompt -> LLM -> parse pipeline for one request
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - catalog (CatalogIndex): Catalog snapshot used for the whole request
+
+        Returns:
+        - dict: Recommended products with explanations, or an error
+        """
+        try:
+            return await self.complete(self.build_prompt(user_preferences, browsing_history, catalog), catalog)
+        except Exception as e:
+            return self._error_response(e)
+
+    def build_prompt(self, user_preferences, browsing_history, catalog):
+        """
+        Build the recommendation prompt for one request
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - catalog (CatalogIndex): Catalog snapshot used for the whole request
+
+        Returns:
+        - RecommendationPrompt
+        """
+        with self.stages.span('history'):
+            browsed_products = catalog.get_many(browsing_history)
+        return self._create_recommendation_prompt(user_preferences, browsed_products, catalog)
+
+    def completion_limit(self, prompt):
+        """
+        max_tokens for a prompt: its reply-sized cap, never above MAX_TOKENS
+        """
+        return min(self.max_tokens, prompt.max_completion_tokens or self.max_tokens)
+
+    async def complete(self, prompt, catalog, max_retries=None):
+        """
+        Send a built prompt to the LLM and parse the answer
+
+        Unlike generate_recommendations, errors from the LLM call are raised
+        (as openai.error exceptions) so callers can retry them.
 
-            response = openai.ChatCompletion.create(
+        Parameters:
+        - prompt (RecommendationPrompt): Prompt from build_prompt
+        - catalog (CatalogIndex): Catalog snapshot the prompt was built from
+        - max_retries (int): Retries by the LLM router for this call; None for LLM_MAX_RETRIES
+
+        Returns:
+        - dict: Recommended products with explanations and token usage
+        """
+        with self.stages.span('llm'):
+            response = await self.llm_client.chat_completion(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful eCommerce product recommendation assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
+                messages=self._build_messages(prompt),
+                max_tokens=self.completion_limit(prompt),
+                temperature=self.temperature,
+                max_retries=max_retries
+            )
+        content = response["choices"][0]["message"]["content"]
+        logger.debug("Raw LLM response: %s", content)
+
+        # Parse the LLM response to extract recommendations
+        if prompt.response_format == 'compact':
+            recommendations = self._parse_compact_response(content, catalog, prompt.id_map)
+        else:
+            recommendations = self._parse_recommendation_response(content, catalog, prompt.id_map)
+        recommendations["usage"] = self._usage(prompt, response.get("usage"))
+        return recommendations
+
+    async def stream_recommendations(self, user_preferences, browsing_history, deadline=None):
+        """
+        Generate recommendations, yielding each one as soon as it has been parsed
+
+        The LLM call is streamed and its output fed through an incremental parser
+        (JSON array or compact lines, per LLM_RESPONSE_FORMAT); every completed
+        recommendation is enriched with catalog data and yielded immediately.
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - deadline (float): time.monotonic() by which the client needs the answer; used for
+          admission and, with the LLM latency budget, to bound the wait for the first delta
+
+        Yields:
+        - tuple: ("recommendation", dict) for each recommendation, then
+          ("done", {"count": n}) or ("error", {"error": message}). If the LLM
+          fails, or sends nothing within the latency budget, before producing
+          anything, the fallback ranking is streamed instead and the "done"
+          payload carries "source": "fallback".
+
+        Raises:
+        - AdmissionRejected: Before anything is yielded, if admission control shed the request
+        """
+        catalog = self.product_service.catalog
+        with self.stages.span('cache'):
+            precomputed = self._precomputed(user_preferences, browsing_history, catalog)
+            cache_key = make_cache_key(user_preferences, browsing_history, catalog_identity(catalog))
+            cached = await self.cache.get_async(cache_key) if precomputed is None else None
+        if precomputed is not None:
+            for recommendation in precomputed["recommendations"]:
+                yield "recommendation", recommendation
+            yield "done", {"count": precomputed["count"]}
+            return
+        if cached is not None:
+            self.cache_lookups.inc(label_value='hit')
+            for recommendation in cached["recommendations"]:
+                yield "recommendation", recommendation
+            yield "done", {"count": cached["count"]}
+            return
+        self.cache_lookups.inc(label_value='miss')
+
+        if self.admission is None:
+            async for event in self._stream_uncached(user_preferences, browsing_history, catalog, cache_key, deadline):
+                yield event
+            return
+        try:
+            async with self.admission.slot(deadline):
+                async for event in self._stream_uncached(
+                    user_preferences, browsing_history, catalog, cache_key, deadline
+                ):
+                    yield event
+        except AdmissionRejected as e:
+            shed, source = self._shed(e, cache_key, user_preferences, browsing_history, catalog)
+            for recommendation in shed["recommendations"]:
+                yield "recommendation", recommendation
+            yield "done", {"count": shed["count"], "source": source}
+
+    async def _stream_uncached(self, user_preferences, browsing_history, catalog, cache_key, deadline=None):
+        """
+        Stream a cache miss from the LLM, or the fallback ranking if it fails (see stream_recommendations)
+
+        The latency budget applies to the first delta only: once the LLM has
+        started answering, recommendations reach the client as they complete.
+        """
+        recommendations = []
+        seen = set()
+        budget = self._latency_budget(deadline)
+        try:
+            prompt = self.build_prompt(user_preferences, browsing_history, catalog)
+            if prompt.response_format == 'compact':
+                parser = IncrementalLineParser(self.prompt_builder.recommendation_count,
+                                               self._compact_filter(catalog, prompt.id_map))
+                enrich = self._enrich_compact
+            else:
+                parser = IncrementalJSONArrayParser()
+                enrich = self._enrich_recommendation
+            stream = self.llm_client.stream_chat_completion(
+                model=self.model_name,
+                messages=self._build_messages(prompt),
+                max_tokens=self.completion_limit(prompt),
                 temperature=self.temperature
             )
-            print("Raw LLM Response:", response.choices[0].message.content)
+            # The llm stage of a streamed request runs until the reply is complete,
+            # including the incremental parsing of each chunk
+            with self.stages.span('llm'):
+                stream = aiter(stream)
+                # Bounded like a non-streamed call; cancelling the first read ends the LLM call
+                first = anext(stream, None)
+                first = await (asyncio.wait_for(first, budget) if budget is not None else first)
+                async for content in self._prepend(first, stream):
+                    for rec in parser.feed(content):
+                        recommendation = enrich(rec, catalog, prompt.id_map)
+                        if recommendation and recommendation["product"]["id"] not in seen:
+                            seen.add(recommendation["product"]["id"])
+                            recommendations.append(recommendation)
+                            yield "recommendation", recommendation
+                    if parser.finished:
+                        break
+                else:
+                    # The stream ended without a complete reply: a last compact line may lack its newline
+                    for rec in parser.close():
+                        recommendation = enrich(rec, catalog, prompt.id_map)
+                        if recommendation and recommendation["product"]["id"] not in seen:
+                            seen.add(recommendation["product"]["id"])
+                            recommendations.append(recommendation)
+                            yield "recommendation", recommendation
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) and budget is not None and not recommendations:
+                self.log.warning("LLM stream sent nothing within the %.0f ms latency budget; serving fallback ranking",
+                                 budget * 1000)
+                reason = "timeout"
+            else:
+                error = self._error_response(e)
+                if recommendations:
+                    yield "error", error
+                    return
+                reason = error["error"]
+            fallback = self._fallback(user_preferences, browsing_history, catalog, reason)
+            for recommendation in fallback["recommendations"]:
+                yield "recommendation", recommendation
+            yield "done", {"count": fallback["count"], "source": "fallback"}
+            return
 
-            # Parse the LLM response to extract recommendations
-            # IMPLEMENT YOUR RESPONSE PARSING LOGIC HERE
-            recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
-            
-            return recommendations
-        
-        except openai.error.RateLimitError as e:
-            print(f"API rate limit exceeded: {str(e)}")
+        usage = self._usage(prompt)
+        if recommendations:
+            self.cache.set(cache_key, {"recommendations": recommendations, "count": len(recommendations), "usage": usage})
+        else:
+            fallback = self._fallback(user_preferences, browsing_history, catalog, "empty")
+            for recommendation in fallback["recommendations"]:
+                yield "recommendation", recommendation
+            yield "done", {"count": fallback["count"], "source": "fallback"}
+            return
+        yield "done", {"count": len(recommendations), "usage": usage}
+
+    @staticmethod
+    async def _prepend(first, rest):
+        if first is not None:
+            yield first
+        async for item in rest:
+            yield item
+
+    SYSTEM_MESSAGE = "You are a helpful eCommerce product recommendation assistant."
+
+    def _build_messages(self, prompt):
+        """
+        Build the chat messages for a recommendation prompt
+        """
+        return [
+            {"role": "system", "content": self.SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt.text}
+        ]
+
+    def _usage(self, prompt, reported=None):
+        """
+        Token usage for one request: the local prompt count plus whatever the provider reported
+        """
+        usage = {"prompt_tokens": self.tokenizer.count_messages(self._build_messages(prompt)), **prompt.usage()}
+        if reported:
+            usage["reported_prompt_tokens"] = reported.get("prompt_tokens")
+            usage["completion_tokens"] = reported.get("completion_tokens")
+        self.tokens.inc(usage.get("reported_prompt_tokens") or usage["prompt_tokens"], 'prompt')
+        self.tokens.inc(usage.get("completion_tokens") or 0, 'completion')
+        logger.debug(
+            "Recommendation prompt: %d tokens (%s), %d candidates, %d dropped, %d abbreviated",
+            usage["prompt_tokens"], self.tokenizer.name, prompt.candidates, prompt.dropped, prompt.abbreviated
+        )
+        return usage
+
+    def _error_response(self, error):
+        """
+        Map an exception from the LLM call to an error response
+        """
+        if isinstance(error, openai.error.RateLimitError):
+            self.errors.inc(label_value='rate_limit')
+            self.log.warning("API rate limit exceeded: %s", error)
             return {"error": "API rate limit exceeded. Please try again later."}
-    
-        except openai.error.InvalidRequestError as e:
-            print(f"Invalid request: {str(e)}")
+        if isinstance(error, openai.error.InvalidRequestError):
+            self.errors.inc(label_value='invalid_request')
+            self.log.error("Invalid request: %s", error)
             return {"error": "The request to the API was invalid. Please check the input parameters."}
-    
-        except openai.error.AuthenticationError as e:
-            print(f"Authentication error: {str(e)}")
+        if isinstance(error, openai.error.Timeout):
+            self.errors.inc(label_value='timeout')
+            self.log.warning("LLM request timed out: %s", error)
+            return {"error": "The recommendation service timed out. Please try again later."}
+        if isinstance(error, openai.error.AuthenticationError):
+            self.errors.inc(label_value='authentication')
+            self.log.error("Authentication error: %s", error)
             return {"error": "Authentication failed. Please check your API key."}
-    
-        except openai.error.OpenAIError as e:
-            print(f"OpenAI API error: {str(e)}")
-            return {"error": f"An error occurred with the OpenAI API: {str(e)}"}
+        if isinstance(error, openai.error.OpenAIError):
+            self.errors.inc(label_value='api')
+            self.log.error("OpenAI API error: %s", error)
+            return {"error": f"An error occurred with the OpenAI API: {str(error)}"}
+        self.errors.inc(label_value='unexpected')
+        self.log.error("Unexpected error: %s", error)
+        return {"error": f"An unexpected error occurred: {str(error)}"}
 
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            return {"error": f"An unexpected error occurred: {str(e)}"}
-            
-        # except Exception as e:
-        #     # Handle any errors from the LLM API
-        #     print(f"Error calling LLM API: {str(e)}")
-        #     raise Exception(f"Failed to generate recommendations: {str(e)}")
-    
-    def _create_recommendation_prompt(self, user_preferences, browsed_products, all_products):
+    def _create_recommendation_prompt(self, user_preferences, browsed_products, catalog):
         """
         Create a prompt for the LLM to generate recommendations
-        
-        This is where you should implement your prompt engineering strategy.
+
+        The candidates are encoded as a compact table with short ids and fitted
+        to MAX_PROMPT_TOKENS by the prompt builder, after the shared prefix for
+        the user's categories and price range.
         
         Parameters:
         - user_preferences (dict): User's stated preferences
         - browsed_products (list): Products the user has viewed
-        - all_products (list): Full product catalog
+        - catalog (CatalogIndex): Indexed product catalog
         
         Returns:
-        - str: Prompt for the LLM
+        - RecommendationPrompt: Prompt text, short id mapping and token counts
         """
-        # TODO: Implement your prompt engineering strategy
-        # THIS FUNCTION MUST BE IMPLEMENTED BY THE CANDIDATE
+        with self.stages.span('candidates'):
+            candidates = catalog.products_at(
+                self._select_candidates(user_preferences, browsed_products, catalog, k=self.candidate_count)
+            )
+        with self.stages.span('prompt'):
+            return self.prompt_builder.build(user_preferences, browsed_products, candidates, catalog)
 
-        prompt = (
-        "You are an expert product recommendation engine for an eCommerce platform.\n"
-        "Your task is to recommend 5 personalized products based on:\n"
-        "1. User's preferences\n"
-        "2. Products they recently browsed\n"
-        "3. The product catalog\n\n"
-        )
+    def _select_candidates(self, user_preferences, browsed_products, catalog, k=20):
+        """
+        Choose the catalog positions to show the LLM
+
+        Products related to the browsing history come first: the merged
+        precomputed neighbour lists of the browsed products, then semantic
+        retrieval, both restricted to the user's preferences. The rest of the
+        slots are filled by the relevance-ranked preference filter.
+
+        Returns:
+        - list: Up to k catalog positions
+        """
+        candidate_filter = catalog.candidate_filter
+        browsed_positions = catalog.positions_of([p['id'] for p in browsed_products])
+        mask = candidate_filter.candidate_mask(user_preferences, browsed_positions)
 
-        # Add user preferences to the prompt
-        prompt += "User Preferences:\n"
-        for key, value in user_preferences.items():
-            prompt += f"- {key.capitalize()}: {value}\n"
-
-        # Add browsing history to the prompt
-        prompt += "\nBrowsing History:\n"
-        if browsed_products:
-            for product in browsed_products:
-                features_str = ", ".join(product.get("features", []))
-                tags_str = ", ".join(product.get("tags", []))
-                prompt += (
-                    f"- Name: {product['name']}\n"
-                    f"  Brand: {product['brand']}\n"
-                    f"  Category: {product['category']} > {product.get('subcategory', '')}\n"
-                    f"  Price: ${product['price']}\n"
-                    f"  Description: {product['description']}\n"
-                    f"  Features: {features_str}\n"
-                    f"  Tags: {tags_str}\n"
-                    f"  Rating: {product['rating']}\n\n"
+        candidates = []
+        if browsed_positions and catalog.similarity_table is not None:
+            candidates = [int(p) for p in catalog.similarity_table.related(browsed_positions, k=k, mask=mask)]
+        if browsed_positions and len(candidates) < k and catalog.embedding_index is not None:
+            mask[candidates] = False
+            candidates.extend(
+                int(p) for p in catalog.embedding_index.similar_to(browsed_positions, k=k - len(candidates), mask=mask)
+            )
+        if len(candidates) < k:
+            mask[candidates] = False
+            candidates.extend(
+                int(p) for p in candidate_filter.select(
+                    user_preferences, browsed_positions, k=k - len(candidates), mask=mask
                 )
-        else:
-            prompt += "- None\n"
-
-        # Filter catalog down to 20 relevant products
-        filtered_products = []
-        for p in all_products:
-            if user_preferences.get("categories") and p["category"] not in user_preferences["categories"]:
-                continue
-            if user_preferences.get("brands") and p["brand"] not in user_preferences["brands"]:
-                continue
-            if user_preferences.get("priceRange") and user_preferences["priceRange"] != "all":
-                try:
-                    min_price, max_price = map(float, user_preferences["priceRange"].split("-"))
-                    if not (min_price <= float(p["price"]) <= max_price):
-                        continue
-                except Exception:
-                    pass  # Ignore malformed price range
-            filtered_products.append(p)
-            if len(filtered_products) >= 20:
-                break
-
-
-        prompt += "Product Catalog (Sample of 20):\n"
-        for product in filtered_products:
-            prompt += (
-                f"- ID: {product['id']}, Name: {product['name']}, Category: {product['category']}, "
-                f"Brand: {product['brand']}, Price: ${product['price']}\n"
             )
+        return candidates
 
-        prompt += (
-            "\nPlease recommend 5 products from the catalog that align well with the user's preferences and interests.\n"
-            "Each recommendation must include:\n"
-            "- product_id (from catalog)\n"
-            "- explanation (why it suits the user)\n"
-            "- score (confidence score out of 10)\n\n"
-            "Respond in the following JSON format:\n"
-            "[\n"
-            "  {\n"
-            "    \"product_id\": \"prod001\",\n"
-            "    \"explanation\": \"This product matches the user's interest in lightweight athletic footwear.\",\n"
-            "    \"score\": 9\n"
-            "  },\n"
-            "  ...\n"
-            "]"
-        )
+    def _enrich_recommendation(self, rec, catalog, id_map=None):
+        """
+        Attach full product details to one parsed recommendation
 
-        # You would likely want to include the product catalog in the prompt
-        # But be careful about token limits!
-        # For a real implementation, you might need to filter the catalog to relevant products first
-        return prompt
-    
-        
-    def _parse_recommendation_response(self, llm_response, all_products):
+        Short prompt ids are translated through `id_map`; full product IDs are
+        accepted as well. Returns None if the object is not a recommendation
+        for a catalog product.
+        """
+        if not isinstance(rec, dict):
+            return None
+
+        # Find the full product details
+        product_id = rec.get('product_id')
+        if id_map and product_id in id_map:
+            product_id = id_map[product_id]
+        product_details = catalog.get(product_id)
+        if not product_details:
+            return None
+        return {
+            "product": product_details,
+            "explanation": rec.get('explanation', ''),
+            "confidence_score": rec.get('score', 5)
+        }
+
+    def _enrich_compact(self, item, catalog, id_map=None):
+        """
+        Attach product details and a templated explanation to one parsed compact reply line
+
+        Returns None if the id is not a catalog product.
+        """
+        short_id, score, codes = item
+        product_details = catalog.get(id_map.get(short_id, short_id) if id_map else short_id)
+        if not product_details:
+            return None
+        return {
+            "product": product_details,
+            "explanation": self.prompt_builder.compact.explain(codes, product_details),
+            "confidence_score": score
+        }
+
+    @staticmethod
+    def _compact_filter(catalog, id_map=None):
+        """
+        Check for compact reply lines: the id must be a catalog product not already recommended
+        """
+        seen = set()
+
+        def accept(item):
+            product_id = id_map.get(item[0], item[0]) if id_map else item[0]
+            if product_id in seen or product_id not in catalog:
+                return False
+            seen.add(product_id)
+            return True
+        return accept
+
+    def _parse_compact_response(self, llm_response, catalog, id_map=None):
+        """
+        Parse a compact reply ("<id> <score> <reason codes>" per line)
+
+        Lines that do not match the format, unknown ids and repeated products
+        are skipped.
+
+        Returns:
+        - dict: Structured recommendations, or an error if no line was usable
+        """
+        with self.stages.span('parse'):
+            items, rejected = self.prompt_builder.compact.parse(llm_response, self._compact_filter(catalog, id_map))
+        with self.stages.span('enrich'):
+            recommendations = []
+            seen = set()
+            for item in items:
+                recommendation = self._enrich_compact(item, catalog, id_map)
+                if recommendation and recommendation["product"]["id"] not in seen:
+                    seen.add(recommendation["product"]["id"])
+                    recommendations.append(recommendation)
+        if not recommendations:
+            self.errors.inc(label_value='parse')
+            self.log.warning("No usable lines in compact LLM response (%d rejected)", rejected)
+            return {"recommendations": [], "error": "No valid recommendations found in LLM response."}
+        return {"recommendations": recommendations, "count": len(recommendations)}
+
+    def _parse_recommendation_response(self, llm_response, catalog, id_map=None):
         """
         Parse the LLM response to extract product recommendations
         
         Parameters:
         - llm_response (str): Raw response from the LLM
-        - all_products (list): Full product catalog to match IDs with full product info
+        - catalog (CatalogIndex): Indexed catalog to match IDs with full product info
+        - id_map (dict): Short prompt ids -> product IDs
         
         Returns:
         - dict: Structured recommendations
         """
-        # TODO: Implement response parsing logic
-        # THIS FUNCTION MUST BE IMPLEMENTED BY THE CANDIDATE
-
         try:
-            import json
-            # Find JSON content in the response
-            start_idx = llm_response.find('[')
-            end_idx = llm_response.rfind(']') + 1
-        
-            if start_idx == -1 or end_idx == 0:
-                return {"recommendations": [], "error": "No valid recommendations found in LLM response."}
+            with self.stages.span('parse'):
+                # Find JSON content in the response
+                start_idx = llm_response.find('[')
+                end_idx = llm_response.rfind(']') + 1
 
-            json_str = llm_response[start_idx:end_idx]
-            rec_data = json.loads(json_str)
+                if start_idx == -1 or end_idx == 0:
+                    self.errors.inc(label_value='parse')
+                    return {"recommendations": [], "error": "No valid recommendations found in LLM response."}
 
-            # Enrich recommendations with full product details
-            recommendations = []
-            for rec in rec_data:
-                product_id = rec.get('product_id')
-                product_details = None
-
-                # Find the full product details
-                for product in all_products:
-                    if product['id'] == product_id:
-                        product_details = product
-                        break
+                json_str = llm_response[start_idx:end_idx]
+                rec_data = json.loads(json_str)
 
-                if product_details:
-                    recommendations.append({
-                        "product": product_details,
-                        "explanation": rec.get('explanation', ''),
-                        "confidence_score": rec.get('score', 5)
-                    })
+            # Enrich recommendations with full product details
+            with self.stages.span('enrich'):
+                recommendations = []
+                for rec in rec_data:
+                    recommendation = self._enrich_recommendation(rec, catalog, id_map)
+                    if recommendation:
+                        recommendations.append(recommendation)
 
             return {"recommendations": recommendations, "count": len(recommendations)}
 
         except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {str(e)}")
+            self.errors.inc(label_value='parse')
+            self.log.warning("Error parsing JSON response: %s", e)
             return {"recommendations": [], "error": "Error parsing the LLM response. Invalid JSON format."}
     
         except Exception as e:
-            print(f"Error parsing LLM response: {str(e)}")
+            self.errors.inc(label_value='parse')
+            self.log.warning("Error parsing LLM response: %s", e)
             return {"recommendations": [], "error": f"Failed to parse recommendations: {str(e)}"}
         
 
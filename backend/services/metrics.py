@@ -0,0 +1,364 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import mmap
+import time
+
+import numpy as np
+
+# Upper bounds (seconds) of the default latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar('recommendation_trace', default=None)
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class _Metric:
+    """
+    A named metric with at most one label, whose values are fixed up front
+
+    Every (label value, series) pair owns a column of the registry's value
+    array, so recording is an add into a preallocated float64 cell.
+    """
+    kind = None
+
+    def __init__(self, registry, name, help, label, values, width):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = tuple(values) if label else (None,)
+        self.width = width
+        self.offset = registry._allocate(width * len(self.values))
+        self._columns = {value: self.offset + i * width for i, value in enumerate(self.values)}
+
+    def _column(self, label_value):
+        try:
+            return self._columns[label_value]
+        except KeyError:
+            raise KeyError(f"{self.name}: unknown {self.label} '{label_value}'") from None
+
+    def _labels(self, value, extra=None):
+        pairs = []
+        if self.label:
+            pairs.append(f'{self.label}="{value}"')
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter
+    """
+    kind = 'counter'
+
+    def __init__(self, registry, name, help, label=None, values=()):
+        super().__init__(registry, name, help, label, values, 1)
+
+    def inc(self, amount=1, label_value=None):
+        self.registry.row[self._column(label_value)] += amount
+
+    def get(self, label_value=None):
+        """
+        Current value summed over all worker slots
+        """
+        return float(self.registry.values[:, self._column(label_value)].sum())
+
+    def render(self, totals):
+        for value in self.values:
+            yield f"{self.name}{self._labels(value)} {_format_value(totals[self._column(value)])}"
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, e.g. a queue depth
+
+    Each worker sets its own slot and /metrics reports the sum over workers.
+    A worker's gauges are reset when its slot is taken over (see `use_slot`).
+    """
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, label=None, values=()):
+        super().__init__(registry, name, help, label, values, 1)
+
+    def set(self, value, label_value=None):
+        self.registry.row[self._column(label_value)] = value
+
+    def inc(self, amount=1, label_value=None):
+        self.registry.row[self._column(label_value)] += amount
+
+    def dec(self, amount=1, label_value=None):
+        self.registry.row[self._column(label_value)] -= amount
+
+    def get(self, label_value=None):
+        """
+        Current value summed over all worker slots
+        """
+        return float(self.registry.values[:, self._column(label_value)].sum())
+
+    def render(self, totals):
+        for value in self.values:
+            yield f"{self.name}{self._labels(value)} {_format_value(totals[self._column(value)])}"
+
+
+class Histogram(_Metric):
+    """
+    Histogram with fixed bucket bounds, stored as per-bucket counts plus sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, buckets=LATENCY_BUCKETS, label=None, values=()):
+        self.bounds = tuple(sorted(buckets))
+        # One column per bucket (the last is +Inf), then the sum and the count
+        super().__init__(registry, name, help, label, values, len(self.bounds) + 3)
+
+    def observe(self, amount, label_value=None):
+        row = self.registry.row
+        column = self._column(label_value)
+        row[column + bisect.bisect_left(self.bounds, amount)] += 1
+        row[column + self.width - 2] += amount
+        row[column + self.width - 1] += 1
+
+    def render(self, totals):
+        bounds = self.bounds + (float('inf'),)
+        for value in self.values:
+            column = self._column(value)
+            cumulative = np.cumsum(totals[column:column + len(bounds)])
+            for bound, count in zip(bounds, cumulative):
+                le = 'le="' + _format_bound(bound) + '"'
+                yield f"{self.name}_bucket{self._labels(value, le)} {_format_value(count)}"
+            yield f"{self.name}_sum{self._labels(value)} {_format_value(totals[column + self.width - 2])}"
+            yield f"{self.name}_count{self._labels(value)} {_format_value(totals[column + self.width - 1])}"
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms exported in the Prometheus text format
+
+    Values live in one float64 array with a row per worker slot, and metrics
+    record through a memoryview of the current slot's row (cheaper to update
+    one element of than the array itself). In a single
+    process there is one row. Before serve.py forks its workers it calls
+    `share`, which moves the array into shared memory with one row per
+    worker; each worker then records into its own row (`use_slot`), so no
+    locking is needed, and `render` in any worker sums all rows. Metrics must
+    be created before `share`.
+    """
+
+    def __init__(self):
+        self.values = np.zeros((1, 0))
+        self.slot = 0
+        self.row = memoryview(self.values[0])
+        self.metrics = []
+        self._buffer = None
+
+    def _allocate(self, width):
+        if self._buffer is not None:
+            raise RuntimeError('metrics must be created before the registry is shared')
+        offset = self.values.shape[1]
+        self.values = np.hstack([self.values, np.zeros((1, width))])
+        self.row = memoryview(self.values[0])
+        return offset
+
+    def counter(self, name, help, label=None, values=()):
+        """
+        Create a counter
+
+        Parameters:
+        - name (str): Metric name, conventionally ending in _total
+        - help (str): One-line description
+        - label (str): Optional label name
+        - values (iterable): Every value the label can take
+
+        Returns:
+        - Counter
+        """
+        metric = Counter(self, name, help, label, values)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, label=None, values=()):
+        """
+        Create a gauge
+
+        Parameters:
+        - name (str): Metric name
+        - help (str): One-line description
+        - label (str): Optional label name
+        - values (iterable): Every value the label can take
+
+        Returns:
+        - Gauge
+        """
+        metric = Gauge(self, name, help, label, values)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, label=None, values=()):
+        """
+        Create a histogram
+
+        Parameters:
+        - name (str): Metric name
+        - help (str): One-line description
+        - buckets (iterable): Bucket upper bounds (+Inf is added)
+        - label (str): Optional label name
+        - values (iterable): Every value the label can take
+
+        Returns:
+        - Histogram
+        """
+        metric = Histogram(self, name, help, buckets, label, values)
+        self.metrics.append(metric)
+        return metric
+
+    def share(self, slots):
+        """
+        Move the values into anonymous shared memory with `slots` rows (call before forking)
+
+        The current values are kept in row 0.
+        """
+        buffer = mmap.mmap(-1, max(1, slots * self.values.shape[1] * 8))
+        values = np.frombuffer(buffer, dtype=np.float64, count=slots * self.values.shape[1])
+        values = values.reshape(slots, self.values.shape[1])
+        values[0] = self.values[0]
+        self._buffer = buffer
+        self.values = values
+        self.use_slot(0)
+
+    def use_slot(self, slot):
+        """
+        Record into row `slot` from now on (called in each forked worker)
+
+        Gauges in the row are zeroed: a restarted worker takes over the slot
+        of the one that died, whose in-flight state is gone.
+        """
+        self.slot = slot
+        self.row = memoryview(self.values[slot])
+        for metric in self.metrics:
+            if metric.kind == 'gauge':
+                for column in metric._columns.values():
+                    self.row[column] = 0.0
+
+    def render(self):
+        """
+        Returns:
+        - str: All metrics in the Prometheus text exposition format, summed over worker slots
+        """
+        totals = self.values.sum(axis=0)
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(totals))
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTrace:
+    """
+    Time spent in each stage of one request; formatted only when it is logged
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def __str__(self):
+        return ', '.join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in self.stages.items())
+
+
+class _Span:
+    __slots__ = ('histogram', 'stage', 'start')
+
+    def __init__(self, histogram, stage):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed, self.stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages[self.stage] = trace.stages.get(self.stage, 0.0) + elapsed
+
+
+class StageTimer:
+    """
+    Times named pipeline stages into a histogram labelled by stage
+
+    Spans also add their time to the RequestTrace of the enclosing `trace()`
+    block, if any. The trace is found through a context variable, so it
+    follows the request into tasks it starts.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def span(self, stage):
+        """
+        Context manager timing one stage
+        """
+        return _Span(self.histogram, stage)
+
+    @contextlib.contextmanager
+    def trace(self):
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+
+class SampledLogger:
+    """
+    Logs the first and then every `every`-th occurrence of each message
+
+    Occurrences are keyed by the unformatted message template, and arguments
+    are only formatted for the messages actually emitted, so a message
+    repeated on every request (an upstream outage, a slow LLM) costs a dict
+    update rather than a formatted line per request.
+    """
+
+    def __init__(self, logger, every=100):
+        """
+        Parameters:
+        - logger (logging.Logger): Destination logger
+        - every (int): Emit one of this many occurrences of a message; 1 logs all
+        """
+        self.logger = logger
+        self.every = max(1, every)
+        self.counts = {}
+
+    def log(self, level, msg, *args):
+        count = self.counts.get(msg, 0)
+        self.counts[msg] = count + 1
+        if count % self.every or not self.logger.isEnabledFor(level):
+            return
+        if count:
+            self.logger.log(level, msg + " (%d similar messages not logged)", *args, self.every - 1)
+        else:
+            self.logger.log(level, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
@@ -0,0 +1,220 @@
+import base64
+import hashlib
+import json
+import logging
+import threading
+
+from services.catalog_index import SORT_KEYS
+from services.recommendation_cache import RecommendationCache, catalog_identity
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_page_query(categories=None, brands=None, tags=None, min_price=None, max_price=None,
+                         in_stock=False, sort=None):
+    """
+    Canonical form of product listing filters: sorted unique lists, floats for prices
+
+    Raises:
+    - ValueError: Unknown sort key or an inverted price range
+    """
+    if sort and (sort[1:] if sort.startswith('-') else sort) not in SORT_KEYS:
+        raise ValueError(f"unknown sort key '{sort}' (use {', '.join(SORT_KEYS)}, optionally with '-')")
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError("min_price is greater than max_price")
+    return {
+        'categories': sorted({c.strip() for c in categories or [] if c and c.strip()}),
+        'brands': sorted({b.strip() for b in brands or [] if b and b.strip()}),
+        'tags': sorted({t.strip() for t in tags or [] if t and t.strip()}),
+        'min_price': None if min_price is None else float(min_price),
+        'max_price': None if max_price is None else float(max_price),
+        'in_stock': bool(in_stock),
+        'sort': sort or None,
+    }
+
+
+def encode_cursor(identity, offset):
+    raw = json.dumps({'c': identity, 'o': offset}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, identity):
+    """
+    Offset stored in a cursor
+
+    Raises:
+    - ValueError: The cursor is malformed or belongs to another catalog version
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        offset = int(data['o'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+    if data.get('c') != identity:
+        raise ValueError("cursor is from a previous catalog version; start again from the first page")
+    if offset < 0:
+        raise ValueError("invalid cursor")
+    return offset
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header value matches an ETag (weak comparison)
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+class ProductListing:
+    """
+    One /api/products request pinned to a catalog snapshot, with its cache key and ETag
+    """
+
+    def __init__(self, catalog, query=None, offset=0, limit=None):
+        self.catalog = catalog
+        self.query = query
+        self.offset = offset
+        self.limit = limit
+        self.identity = catalog_identity(catalog)
+        self.key = json.dumps(
+            {'catalog': self.identity, 'query': query, 'offset': offset, 'limit': limit},
+            sort_keys=True,
+            separators=(',', ':'),
+        )
+        self.etag = f'"{hashlib.sha256(self.key.encode()).hexdigest()[:32]}"'
+
+    @property
+    def paged(self):
+        return self.query is not None
+
+
+class ProductPages:
+    """
+    Pre-encoded /api/products responses with ETags
+
+    Responses are kept as encoded JSON bytes in an LRU keyed by catalog
+    contents and normalized query, so a repeat request costs a dictionary
+    lookup and a conditional request whose ETag matches costs nothing at all.
+    The full catalog and the first unfiltered page are encoded ahead of time
+    for every catalog version.
+    """
+
+    def __init__(self, product_service, page_size=50, max_limit=500, max_entries=256):
+        """
+        Parameters:
+        - product_service (ProductService): Source of catalog snapshots
+        - page_size (int): Page length when the request has no limit
+        - max_limit (int): Largest accepted limit
+        - max_entries (int): Encoded responses kept (least recently used evicted)
+        """
+        self.product_service = product_service
+        self.page_size = page_size
+        self.max_limit = max_limit
+        self.cache = RecommendationCache(max_entries=max_entries, ttl_seconds=float('inf'))
+        self._lock = threading.Lock()
+        self._building = {}
+        self.renders = 0
+        self.not_modified = 0
+        product_service.add_reload_listener(self._on_reload)
+
+    def listing(self, query=None, offset=0, limit=None, cursor=None):
+        """
+        Resolve a request against the current catalog snapshot
+
+        Parameters:
+        - query (dict): Output of normalize_page_query; None for the full, unpaged catalog
+        - offset (int): Matches to skip
+        - limit (int): Page length (page_size if None)
+        - cursor (str): next_cursor of a previous page; overrides offset
+
+        Returns:
+        - ProductListing
+
+        Raises:
+        - ValueError: Invalid cursor or limit
+        """
+        catalog = self.product_service.catalog
+        if query is None:
+            return ProductListing(catalog)
+        limit = self.page_size if limit is None else limit
+        if not 1 <= limit <= self.max_limit:
+            raise ValueError(f"limit must be between 1 and {self.max_limit}")
+        if cursor:
+            offset = decode_cursor(cursor, catalog_identity(catalog))
+        return ProductListing(catalog, query, offset, limit)
+
+    def cached_body(self, listing):
+        """
+        Encoded response for a listing if it is cached, else None
+        """
+        return self.cache.get(listing.key)
+
+    def body(self, listing):
+        """
+        Encoded response for a listing, rendering and caching it on a miss
+
+        Concurrent misses for the same listing render it once. Rendering the
+        full catalog takes a while, so call this off the event loop.
+        """
+        with self._lock:
+            lock = self._building.setdefault(listing.key, threading.Lock())
+        try:
+            with lock:
+                body = self.cache.get(listing.key)
+                if body is None:
+                    body = self._render(listing)
+                    self.cache.set(listing.key, body)
+                    self.renders += 1
+                return body
+        finally:
+            with self._lock:
+                self._building.pop(listing.key, None)
+
+    def _render(self, listing):
+        products = listing.catalog.products
+        if not listing.paged:
+            return products.to_json()
+        query = listing.query
+        positions, total = listing.catalog.page_positions(
+            sort=query['sort'],
+            offset=listing.offset,
+            limit=listing.limit,
+            categories=query['categories'],
+            brands=query['brands'],
+            tags=query['tags'],
+            min_price=query['min_price'],
+            max_price=query['max_price'],
+            in_stock=query['in_stock'],
+        )
+        next_offset = listing.offset + len(positions)
+        next_cursor = encode_cursor(listing.identity, next_offset) if next_offset < total else None
+        tail = (f',"total":{total},"offset":{listing.offset},"limit":{listing.limit},'
+                f'"next_cursor":{json.dumps(next_cursor)}}}')
+        return b'{"products":' + products.to_json(positions) + tail.encode()
+
+    def warm(self):
+        """
+        Encode the full catalog and the first unfiltered page of the current catalog
+        """
+        try:
+            self.body(self.listing())
+            self.body(self.listing(normalize_page_query()))
+        except Exception as e:
+            logger.error("Error pre-encoding product listings: %s", e)
+
+    def _on_reload(self, catalog):
+        self.cache.invalidate()
+        self.warm()
+
+    def stats(self):
+        """
+        Counters for monitoring
+        """
+        return {
+            'entries': len(self.cache),
+            'hits': self.cache.hits,
+            'renders': self.renders,
+            'not_modified': self.not_modified,
+        }
@@ -1,46 +1,284 @@
-import json
+import logging
+import os
+import threading
+import time
+
 from config import config
+from services.catalog_index import CatalogIndex
+from services.catalog_loader import CatalogValidationError, load_catalog
+from services.embedding_index import EmbeddingIndex
+from services.product_table import ProductTable
+from services.search_index import SearchIndex
+from services.similarity_table import SimilarityTable
+
+logger = logging.getLogger(__name__)
 
 class ProductService:
     """
     Service to handle product data operations
     """
-    
+
     def __init__(self):
         """
         Initialize the product service with data path from config
         """
         self.data_path = config['DATA_PATH']
-        self.products = self._load_products()
-    
+        self._reload_listeners = []
+        self._reload_lock = threading.Lock()
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_reload_error = None
+        products = self._load_products()
+        self.catalog = CatalogIndex(
+            products,
+            self._build_embedding_index(products),
+            search_index=SearchIndex.build(products),
+            similarity_table=self._build_similarity_table(products)
+        )
+
+    @property
+    def catalog_version(self):
+        return self.catalog.version
+
+    def add_reload_listener(self, callback):
+        """
+        Register `callback(catalog)` to run after every catalog reload
+        """
+        self._reload_listeners.append(callback)
+
+    def reload(self):
+        """
+        Re-read the data file and replace the catalog with a new version
+
+        The new catalog is parsed, validated and fully indexed before a single
+        reference assignment swaps it in, so in-flight requests keep the
+        snapshot they started with and are never paused. If the file fails
+        validation the current catalog stays in service. Concurrent reloads
+        are serialized and versions only ever increase.
+
+        Meant to run off the event loop (the file watcher's thread, or a
+        thread pool for the reload endpoint).
+
+        Returns:
+        - CatalogIndex: The new catalog
+
+        Raises:
+        - CatalogValidationError: The file could not be read or is invalid
+        """
+        with self._reload_lock:
+            try:
+                products = load_catalog(self.data_path)
+                if not len(products) and len(self.catalog.products):
+                    raise CatalogValidationError("refusing to replace a non-empty catalog with an empty one")
+                catalog = CatalogIndex(
+                    products,
+                    self._build_embedding_index(products),
+                    version=self.catalog.version + 1,
+                    search_index=SearchIndex.build(products, previous=self.catalog.search_index),
+                    similarity_table=self._build_similarity_table(products, self.catalog.similarity_table)
+                )
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_reload_error = str(e)
+                raise
+
+            self.catalog = catalog
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_reload_error = None
+
+        for callback in self._reload_listeners:
+            callback(catalog)
+        return catalog
+
+    def status(self):
+        """
+        Current catalog version and reload counters
+        """
+        return {
+            'version': self.catalog.version,
+            'products': len(self.catalog.products),
+            'data_path': self.data_path,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_reload_error': self.last_reload_error,
+        }
+
+    @property
+    def products(self):
+        return self.catalog.products
+
     def _load_products(self):
         """
-        Load products from the JSON data file
+        Load the catalog at startup (products.json, JSONL or a binary snapshot)
+
+        With no previous catalog to fall back to, an unreadable or invalid
+        file starts the service with an empty catalog; fix the file and
+        reload to bring it back.
+        """
+        try:
+            return load_catalog(self.data_path)
+        except CatalogValidationError as e:
+            logger.error("Error loading product data, starting with an empty catalog: %s", e)
+            self.last_reload_error = str(e)
+            return ProductTable.from_products([])
+
+    def _build_embedding_index(self, products):
+        """
+        Open the persisted embedding index and bring it up to date with the catalog
+
+        Only new or changed products are embedded. Returns None if the index
+        cannot be built, in which case recommendations skip semantic retrieval.
+        """
+        try:
+            index = EmbeddingIndex(
+                config['EMBEDDING_INDEX_PATH'],
+                dim=config['EMBEDDING_DIM'],
+                nprobe=config['EMBEDDING_NPROBE']
+            )
+            index.build(products, source_fingerprint=products.fingerprint)
+            return index
+        except Exception as e:
+            logger.error("Error building embedding index: %s", e)
+            return None
+
+    def _build_similarity_table(self, products, previous=None):
+        """
+        Bring the persisted similar-products table up to date with the catalog
+
+        At startup the saved table is reused when it was built from the same
+        catalog file; otherwise, and on reloads, only the products affected by
+        changes are recomputed. The result is saved and served memory-mapped.
+        Returns None if the table cannot be built, in which case
+        recommendations skip precomputed neighbours.
         """
+        path = config['SIMILARITY_TABLE_PATH']
         try:
-            with open(self.data_path, 'r') as file:
-                return json.load(file)
+            if previous is None and os.path.exists(path):
+                try:
+                    previous = SimilarityTable.open(path)
+                except ValueError as e:
+                    logger.warning("Rebuilding similarity table: %s", e)
+            table = SimilarityTable.build(products, k=config['SIMILAR_PRODUCTS'], previous=previous)
+            if table is not previous:
+                try:
+                    table.save(path)
+                    table = SimilarityTable.open(path)
+                except OSError as e:
+                    # e.g. another worker process saving the same update; serve this copy from memory
+                    logger.warning("Could not save similarity table, keeping it in memory: %s", e)
+            return table
         except Exception as e:
-            print(f"Error loading product data: {str(e)}")
-            return []
-    
+            logger.error("Error building similarity table: %s", e)
+            return None
+
     def get_all_products(self):
         """
         Return all products
         """
-        return self.products
-    
+        return list(self.catalog.products)
+
     def get_product_by_id(self, product_id):
         """
         Get a specific product by ID
         """
-        for product in self.products:
-            if product['id'] == product_id:
-                return product
-        return None
-    
+        return self.catalog.get(product_id)
+
+    def get_all_products_json(self):
+        """
+        Return the whole catalog as JSON bytes, encoded straight from the table
+        """
+        return self.catalog.products.to_json()
+
+    def get_product_json(self, product_id):
+        """
+        Return one product as JSON bytes, or None if the ID is unknown
+        """
+        catalog = self.catalog
+        position = catalog.position_of(product_id)
+        if position is None:
+            return None
+        return catalog.products.to_json([position])[1:-1]
+
+    def get_products_by_ids(self, product_ids):
+        """
+        Get products for a list of IDs, preserving order and skipping unknown IDs
+        """
+        return self.catalog.get_many(product_ids)
+
     def get_products_by_category(self, category):
         """
         Get products filtered by category
         """
-        return [p for p in self.products if p['category'] == category]
\ No newline at end of file
+        return self.catalog.by_category(category)
+
+    def get_products_by_subcategory(self, subcategory):
+        """
+        Get products filtered by subcategory
+        """
+        return self.catalog.by_subcategory(subcategory)
+
+    def get_products_by_brand(self, brand):
+        """
+        Get products filtered by brand
+        """
+        return self.catalog.by_brand(brand)
+
+    def get_products_by_tag(self, tag):
+        """
+        Get products carrying a tag
+        """
+        return self.catalog.by_tag(tag)
+
+    def get_products_in_price_range(self, min_price=None, max_price=None):
+        """
+        Get products within an inclusive price range, cheapest first
+        """
+        return self.catalog.in_price_range(min_price, max_price)
+
+    def query_products(self, categories=None, subcategories=None, brands=None, tags=None,
+                       min_price=None, max_price=None, in_stock=False):
+        """
+        Get products matching all of the given filters
+        """
+        return self.catalog.query(
+            categories=categories,
+            subcategories=subcategories,
+            brands=brands,
+            tags=tags,
+            min_price=min_price,
+            max_price=max_price,
+            in_stock=in_stock
+        )
+
+    def search_products(self, query, limit=10, prefix=True, categories=None, brands=None,
+                        min_price=None, max_price=None, in_stock=False):
+        """
+        Full-text search over product name, description, features and tags
+
+        Parameters:
+        - query (str): Free text; with `prefix`, the last word also matches longer terms
+        - limit (int): Maximum results
+        - prefix (bool): Typeahead matching
+        - categories, brands, min_price, max_price, in_stock: Filters, as in `query_products`
+
+        Returns:
+        - list: Product dicts with a BM25 `score`, best first
+        """
+        catalog = self.catalog
+        positions, scores = catalog.search(
+            query,
+            limit=limit,
+            prefix=prefix,
+            categories=categories,
+            brands=brands,
+            min_price=min_price,
+            max_price=max_price,
+            in_stock=in_stock
+        )
+        return [
+            {**product, 'score': round(float(score), 4)}
+            for product, score in zip(catalog.products_at(positions), scores)
+        ]
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+# Bump when the snapshot layout changes; older snapshots must be regenerated
+SNAPSHOT_FORMAT = 1
+
+# Field order of materialized products (the products.json schema)
+PRODUCT_FIELDS = ('id', 'name', 'category', 'subcategory', 'price', 'brand', 'description',
+                  'features', 'rating', 'inventory', 'tags')
+
+
+def id_hash(product_id):
+    """
+    Stable 64-bit hash of a product ID, used for the sorted ID lookup table
+    """
+    return int.from_bytes(hashlib.blake2b(product_id.encode(), digest_size=8).digest(), 'little')
+
+
+class StringColumn:
+    """
+    Variable-length strings stored as one UTF-8 buffer plus int64 offsets
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        data = bytearray()
+        offsets = array('q', [0])
+        for value in strings:
+            data += value.encode()
+            offsets.append(len(data))
+        return cls(np.frombuffer(bytes(data), dtype=np.uint8), np.frombuffer(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return bytes(self.data[self.offsets[position]:self.offsets[position + 1]]).decode()
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+    def save(self, prefix):
+        np.save(f"{prefix}.data.npy", self.data)
+        np.save(f"{prefix}.offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        return cls(np.load(f"{prefix}.data.npy", mmap_mode=mmap_mode),
+                   np.load(f"{prefix}.offsets.npy", mmap_mode=mmap_mode))
+
+
+class ListColumn:
+    """
+    Per-product string lists, dictionary-encoded: int32 codes into a shared
+    vocabulary plus int64 offsets delimiting each product's list
+    """
+
+    def __init__(self, offsets, codes, vocab):
+        self.offsets = offsets
+        self.codes = codes
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        vocab = self.vocab
+        return [vocab[int(code)] for code in self.codes[self.offsets[position]:self.offsets[position + 1]]]
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.codes.nbytes + self.vocab.nbytes
+
+    def save(self, prefix):
+        np.save(f"{prefix}.offsets.npy", self.offsets)
+        np.save(f"{prefix}.codes.npy", self.codes)
+        self.vocab.save(f"{prefix}.vocab")
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        return cls(np.load(f"{prefix}.offsets.npy", mmap_mode=mmap_mode),
+                   np.load(f"{prefix}.codes.npy", mmap_mode=mmap_mode),
+                   StringColumn.load(f"{prefix}.vocab", mmap_mode))
+
+
+class ProductTableBuilder:
+    """
+    Accumulate products one at a time into the columns of a ProductTable
+
+    Used for streaming ingest, so a large catalog never exists as a list of
+    dicts. Missing optional fields get schema defaults (empty strings and
+    lists, rating and inventory 0).
+    """
+
+    def __init__(self):
+        self._strings = {name: (bytearray(), array('q', [0])) for name in ('id', 'name', 'description')}
+        self._vocabs = {name: {} for name in ('category', 'subcategory', 'brand')}
+        self._codes = {name: array('i') for name in ('category', 'subcategory', 'brand')}
+        self._lists = {name: (array('q', [0]), array('i'), {}) for name in ('features', 'tags')}
+        self._prices = array('d')
+        self._ratings = array('d')
+        self._inventory = array('i')
+
+    def add(self, product):
+        for name, (data, offsets) in self._strings.items():
+            data += str(product.get(name) or '').encode()
+            offsets.append(len(data))
+        for name, vocab in self._vocabs.items():
+            self._codes[name].append(vocab.setdefault(product.get(name), len(vocab)))
+        for name, (offsets, codes, vocab) in self._lists.items():
+            for value in product.get(name) or ():
+                codes.append(vocab.setdefault(str(value), len(vocab)))
+            offsets.append(len(codes))
+        self._prices.append(float(product.get('price', 0)))
+        self._ratings.append(float(product.get('rating', 0)))
+        self._inventory.append(int(product.get('inventory', 0)))
+
+    def build(self, fingerprint=None):
+        """
+        Returns:
+        - ProductTable: In-memory table of everything added
+        """
+        strings = {
+            name: StringColumn(np.frombuffer(bytes(data), dtype=np.uint8), np.frombuffer(offsets, dtype=np.int64))
+            for name, (data, offsets) in self._strings.items()
+        }
+        lists = {
+            name: ListColumn(np.frombuffer(offsets, dtype=np.int64), np.frombuffer(codes, dtype=np.int32),
+                             StringColumn.from_strings(vocab))
+            for name, (offsets, codes, vocab) in self._lists.items()
+        }
+        ids = strings['id']
+        hashes = np.fromiter((id_hash(product_id) for product_id in ids), dtype=np.uint64, count=len(ids))
+        id_order = np.argsort(hashes, kind='stable').astype(np.int32)
+        return ProductTable(
+            ids=ids,
+            names=strings['name'],
+            descriptions=strings['description'],
+            category_codes=np.frombuffer(self._codes['category'], dtype=np.int32),
+            category_vocab=list(self._vocabs['category']),
+            subcategory_codes=np.frombuffer(self._codes['subcategory'], dtype=np.int32),
+            subcategory_vocab=list(self._vocabs['subcategory']),
+            brand_codes=np.frombuffer(self._codes['brand'], dtype=np.int32),
+            brand_vocab=list(self._vocabs['brand']),
+            prices=np.frombuffer(self._prices, dtype=np.float64),
+            ratings=np.frombuffer(self._ratings, dtype=np.float64),
+            inventory=np.frombuffer(self._inventory, dtype=np.int32),
+            features=lists['features'],
+            tags=lists['tags'],
+            id_hashes=hashes[id_order],
+            id_order=id_order,
+            fingerprint=fingerprint,
+        )
+
+
+class ProductTable:
+    """
+    Columnar product catalog (struct of arrays)
+
+    Category, subcategory and brand are dictionary-encoded int32 codes; tags
+    and features are code lists into shared vocabularies; names, IDs and
+    descriptions live in UTF-8 buffers. The table behaves as a read-only
+    sequence of product dicts, materializing a dict only when a product is
+    accessed.
+
+    A table can be saved as a snapshot directory of .npy files and reopened
+    as read-only memory maps: startup does no parsing, and worker processes
+    on one host share the same pages through the OS page cache.
+    """
+
+    def __init__(self, ids, names, descriptions, category_codes, category_vocab, subcategory_codes,
+                 subcategory_vocab, brand_codes, brand_vocab, prices, ratings, inventory, features, tags,
+                 id_hashes, id_order, fingerprint=None):
+        self.ids = ids
+        self.names = names
+        self.descriptions = descriptions
+        self.category_codes = category_codes
+        self.category_vocab = category_vocab
+        self.subcategory_codes = subcategory_codes
+        self.subcategory_vocab = subcategory_vocab
+        self.brand_codes = brand_codes
+        self.brand_vocab = brand_vocab
+        self.prices = prices
+        self.ratings = ratings
+        self.inventory = inventory
+        self.features = features
+        self.tags = tags
+        self.id_hashes = id_hashes
+        self.id_order = id_order
+        self.fingerprint = fingerprint
+        self._json_vocabs = None
+
+    @classmethod
+    def from_products(cls, products, fingerprint=None):
+        """
+        Build an in-memory table from an iterable of product dicts
+        """
+        builder = ProductTableBuilder()
+        for product in products:
+            builder.add(product)
+        return builder.build(fingerprint)
+
+    # ------------------------------------------------------------------
+    # Sequence of product dicts
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        position = int(position)
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('product position out of range')
+        return {
+            'id': self.ids[position],
+            'name': self.names[position],
+            'category': self.category_vocab[self.category_codes[position]],
+            'subcategory': self.subcategory_vocab[self.subcategory_codes[position]],
+            'price': float(self.prices[position]),
+            'brand': self.brand_vocab[self.brand_codes[position]],
+            'description': self.descriptions[position],
+            'features': self.features[position],
+            'rating': float(self.ratings[position]),
+            'inventory': int(self.inventory[position]),
+            'tags': self.tags[position],
+        }
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def position_of(self, product_id):
+        """
+        Position of a product ID, or None if unknown (binary search over ID hashes)
+        """
+        if not isinstance(product_id, str):
+            return None
+        target = np.uint64(id_hash(product_id))
+        slot = int(np.searchsorted(self.id_hashes, target))
+        while slot < len(self.id_hashes) and self.id_hashes[slot] == target:
+            position = int(self.id_order[slot])
+            if self.ids[position] == product_id:
+                return position
+            slot += 1
+        return None
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the column arrays (mapped or in memory)
+        """
+        arrays = (self.category_codes, self.subcategory_codes, self.brand_codes, self.prices,
+                  self.ratings, self.inventory, self.id_hashes, self.id_order)
+        columns = (self.ids, self.names, self.descriptions, self.features, self.tags)
+        return sum(a.nbytes for a in arrays) + sum(c.nbytes for c in columns)
+
+    # ------------------------------------------------------------------
+    # JSON encoding
+    # ------------------------------------------------------------------
+
+    def _encoded_vocabs(self):
+        """
+        JSON-encoded vocabulary values, computed once per table
+        """
+        if self._json_vocabs is None:
+            self._json_vocabs = {
+                name: [json.dumps(value, ensure_ascii=False) for value in vocab]
+                for name, vocab in (('category', self.category_vocab), ('subcategory', self.subcategory_vocab),
+                                    ('brand', self.brand_vocab), ('features', self.features.vocab),
+                                    ('tags', self.tags.vocab))
+            }
+        return self._json_vocabs
+
+    def to_json(self, positions=None):
+        """
+        Encode products as a JSON array directly from the columns
+
+        No product dicts are built: dictionary-encoded values are encoded once
+        per table and reused. The output matches FastAPI's JSONResponse for
+        the same products (compact separators, UTF-8, field order of
+        products.json).
+
+        Parameters:
+        - positions (sequence): Positions to encode, in order; all products if None
+
+        Returns:
+        - bytes: UTF-8 JSON array
+        """
+        if positions is None:
+            positions = range(len(self))
+        positions = np.asarray(positions, dtype=np.int64)
+        vocabs = self._encoded_vocabs()
+        encode = json.encoder.encode_basestring
+        list_offsets = {name: getattr(self, name).offsets for name in self._LISTS}
+        list_codes = {name: getattr(self, name).codes for name in self._LISTS}
+
+        def encode_list(name, position):
+            vocab = vocabs[name]
+            offsets = list_offsets[name]
+            codes = list_codes[name][offsets[position]:offsets[position + 1]].tolist()
+            return '[' + ','.join([vocab[code] for code in codes]) + ']'
+
+        categories = self.category_codes[positions].tolist()
+        subcategories = self.subcategory_codes[positions].tolist()
+        brands = self.brand_codes[positions].tolist()
+        prices = self.prices[positions].tolist()
+        ratings = self.ratings[positions].tolist()
+        inventory = self.inventory[positions].tolist()
+        rows = []
+        for row, position in enumerate(positions.tolist()):
+            rows.append(
+                f'{{"id":{encode(self.ids[position])},"name":{encode(self.names[position])},'
+                f'"category":{vocabs["category"][categories[row]]},'
+                f'"subcategory":{vocabs["subcategory"][subcategories[row]]},'
+                f'"price":{prices[row]!r},"brand":{vocabs["brand"][brands[row]]},'
+                f'"description":{encode(self.descriptions[position])},'
+                f'"features":{encode_list("features", position)},"rating":{ratings[row]!r},'
+                f'"inventory":{inventory[row]},"tags":{encode_list("tags", position)}}}'
+            )
+        return ('[' + ','.join(rows) + ']').encode()
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    _ARRAYS = ('category_codes', 'subcategory_codes', 'brand_codes', 'prices', 'ratings', 'inventory',
+               'id_hashes', 'id_order')
+    _STRINGS = ('ids', 'names', 'descriptions')
+    _LISTS = ('features', 'tags')
+
+    def save(self, path):
+        """
+        Write the table as a snapshot directory, replacing any existing one
+
+        The snapshot is written next to `path` and renamed into place, so a
+        reader never sees a half-written directory.
+        """
+        staging = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in self._ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+        for name in self._STRINGS + self._LISTS:
+            getattr(self, name).save(os.path.join(staging, name))
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'count': len(self),
+            'fingerprint': self.fingerprint,
+            'category_vocab': self.category_vocab,
+            'subcategory_vocab': self.subcategory_vocab,
+            'brand_vocab': self.brand_vocab,
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+        previous = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        # Open memory maps keep the old files alive until they are released
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a snapshot directory with every column memory-mapped read-only
+
+        Raises:
+        - ValueError: The directory is not a complete snapshot of a supported format
+        """
+        try:
+            with open(os.path.join(path, 'meta.json')) as file:
+                meta = json.load(file)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"not a catalog snapshot: {str(e)}")
+        if meta.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"snapshot format {meta.get('format')} is not supported (expected {SNAPSHOT_FORMAT})")
+
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in cls._ARRAYS}
+        columns.update({name: StringColumn.load(os.path.join(path, name)) for name in cls._STRINGS})
+        columns.update({name: ListColumn.load(os.path.join(path, name)) for name in cls._LISTS})
+        table = cls(
+            category_vocab=meta['category_vocab'],
+            subcategory_vocab=meta['subcategory_vocab'],
+            brand_vocab=meta['brand_vocab'],
+            fingerprint=meta.get('fingerprint'),
+            **columns,
+        )
+        lengths = {len(columns[name]) for name in cls._ARRAYS + cls._STRINGS + cls._LISTS}
+        if lengths != {meta['count']}:
+            raise ValueError(f"snapshot columns do not match its product count {meta['count']}")
+        return table
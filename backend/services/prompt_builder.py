@@ -0,0 +1,453 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from services.candidate_filter import PRICE_BUCKETS, parse_price_range
+from services.compact_response import CompactResponseFormat
+from services.recommendation_cache import RecommendationCache, normalize_preferences
+
+# Price ranges whose catalog sections are rendered as soon as a catalog is loaded
+PRESET_PRICE_RANGES = ('all',) + tuple(PRICE_BUCKETS)
+
+# Sections for other price ranges kept per catalog snapshot (least recently used evicted)
+MAX_CUSTOM_SECTIONS = 256
+
+# Reply formats the model can be asked for: a JSON array with written explanations, or compact lines
+RESPONSE_FORMATS = ('json', 'compact')
+
+
+class RecommendationPrompt:
+    """
+    A built prompt plus what is needed to interpret the answer
+    """
+
+    def __init__(self, text, id_map, prompt_tokens, candidates, dropped, abbreviated, prefix_tokens=0,
+                 prefix_version=None, response_format='json', max_completion_tokens=None):
+        """
+        Parameters:
+        - text (str): Prompt sent as the user message
+        - id_map (dict): Short catalog id used in the prompt -> product ID
+        - prompt_tokens (int): Tokens in `text`
+        - candidates (int): Catalog rows included
+        - dropped (int): Candidates left out to fit the budget
+        - abbreviated (int): Rows and history entries shortened to fit the budget
+        - prefix_tokens (int): Tokens in the shared prefix `text` starts with
+        - prefix_version (str): Content hash of that prefix
+        - response_format (str): Reply format the prompt asks for ('json' or 'compact')
+        - max_completion_tokens (int): Completion cap sized to the requested reply
+        """
+        self.text = text
+        self.id_map = id_map
+        self.prompt_tokens = prompt_tokens
+        self.candidates = candidates
+        self.dropped = dropped
+        self.abbreviated = abbreviated
+        self.prefix_tokens = prefix_tokens
+        self.prefix_version = prefix_version
+        self.response_format = response_format
+        self.max_completion_tokens = max_completion_tokens
+
+    def usage(self):
+        return {
+            'candidates': self.candidates,
+            'candidates_dropped': self.dropped,
+            'abbreviated': self.abbreviated,
+            'prefix_tokens': self.prefix_tokens,
+            'max_completion_tokens': self.max_completion_tokens,
+        }
+
+
+class PromptPrefix:
+    """
+    The request-independent start of a prompt: instructions, reply format and
+    catalog sections, rendered once and reused verbatim
+    """
+
+    def __init__(self, text, tokens, id_map):
+        self.text = text
+        self.tokens = tokens
+        self.id_map = id_map
+        self.nbytes = len(text.encode())
+        self.version = hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def _price(value):
+    return f"{float(value):.2f}".rstrip('0').rstrip('.')
+
+
+def _truncate(text, length):
+    return text if len(text) <= length else text[:length - 1].rstrip() + '~'
+
+
+class _CatalogSections:
+    """
+    Pre-rendered catalog rows of the top products per (category, price range) for one catalog snapshot
+
+    Section rows use short ids (c1, c2, ...) that are stable for the snapshot,
+    so a product shared by two sections keeps one id. Preset price ranges
+    are all kept; other ranges are kept in a bounded LRU, keyed by their
+    parsed bounds so that spellings of the same range share a section.
+    """
+
+    def __init__(self, catalog, render_row, rows_per_section, max_custom=MAX_CUSTOM_SECTIONS):
+        self.catalog = catalog
+        self.render_row = render_row
+        self.rows_per_section = rows_per_section
+        self._short_ids = {}
+        self._sections = {}
+        self._custom = OrderedDict()
+        self.max_custom = max_custom
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sections) + len(self._custom)
+
+    def get(self, category, price_range):
+        """
+        (rows text, [(short id, product ID)]) for the top products of a category
+        (None for the whole catalog) within a price range
+        """
+        if category is not None and category not in self.catalog.products.category_vocab:
+            return '', []
+        key = (category, parse_price_range(price_range))
+        if price_range in PRESET_PRICE_RANGES:
+            section = self._sections.get(key)
+            if section is None:
+                with self._lock:
+                    section = self._sections.get(key) or self._render(category, price_range)
+                    self._sections[key] = section
+            return section
+        with self._lock:
+            section = self._custom.get(key)
+            if section is None:
+                section = self._custom[key] = self._render(category, price_range)
+                while len(self._custom) > self.max_custom:
+                    self._custom.popitem(last=False)
+            self._custom.move_to_end(key)
+        return section
+
+    def _render(self, category, price_range):
+        preferences = {'priceRange': price_range, 'categories': [category] if category else [], 'brands': []}
+        positions = self.catalog.candidate_filter.select(preferences, k=self.rows_per_section)
+        rows, ids = [], []
+        for position in positions.tolist():
+            short_id = self._short_ids.setdefault(position, f"c{len(self._short_ids) + 1}")
+            product = self.catalog.products[position]
+            rows.append(self.render_row(short_id, product))
+            ids.append((short_id, product['id']))
+        return ''.join(rows), ids
+
+    def render_presets(self):
+        for category in [None] + list(self.catalog.products.category_vocab):
+            for price_range in PRESET_PRICE_RANGES:
+                self.get(category, price_range)
+
+
+class PromptBuilder:
+    """
+    Assemble recommendation prompts within an input token budget
+
+    A prompt is a shared prefix followed by a short per-user suffix. The
+    prefix holds the instructions, the reply format and catalog sections with
+    the top products of the user's categories and price range. Sections are
+    rendered when a catalog is loaded, and whole prefixes are cached, so
+    users with the same categories and price range send byte-identical
+    prompt starts. That is what provider-side prompt caching matches on, and
+    it skips rendering them again. The suffix holds the personalized
+    candidates (continuing the same catalog table), the preferences and the
+    browsing history.
+
+    The catalog is encoded as a compact pipe-separated table keyed by short
+    ids instead of verbose key/value lines. Candidates arrive best first;
+    when the prompt is over budget, the lowest-ranked rows are abbreviated
+    first and then dropped, followed by the oldest history entries.
+    """
+
+    CATALOG_HEADER = "Catalog (id|name|category>subcategory|brand|price|rating):\n"
+
+    # Completion budget of a JSON reply: per object (explanation of up to 25 words) and for the array
+    JSON_TOKENS_PER_RECOMMENDATION = 64
+    JSON_TOKENS_OVERHEAD = 48
+
+    def __init__(self, tokenizer, max_prompt_tokens, recommendation_count=5, max_history=10,
+                 min_candidates=None, section_rows=6, max_prefixes=1024, response_format='json'):
+        """
+        Parameters:
+        - tokenizer (Tokenizer): Token counter
+        - max_prompt_tokens (int): Input token budget for the user message
+        - recommendation_count (int): Recommendations requested from the model
+        - max_history (int): Most recent browsed products included
+        - min_candidates (int): Never drop below this many catalog rows
+          (defaults to recommendation_count)
+        - section_rows (int): Products per catalog section in the shared prefix (0 disables sections)
+        - max_prefixes (int): Rendered prefixes kept (least recently used evicted)
+        - response_format (str): 'json' for a JSON array with written explanations,
+          'compact' for one "<id> <score> <reason codes>" line per product
+        """
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(f"response_format must be one of {', '.join(RESPONSE_FORMATS)}")
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.recommendation_count = recommendation_count
+        self.max_history = max_history
+        self.min_candidates = min_candidates or recommendation_count
+        self.section_rows = section_rows
+        self.response_format = response_format
+        self.compact = CompactResponseFormat(recommendation_count)
+        self._prefixes = RecommendationCache(max_entries=max_prefixes, ttl_seconds=float('inf'))
+        self._prefix_version = None
+        self._version_lock = threading.Lock()
+        self._sections = None
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.bytes_reused = 0
+        self.bytes_rendered = 0
+
+    # ------------------------------------------------------------------
+    # Sections
+    # ------------------------------------------------------------------
+
+    def _instructions(self):
+        task = (
+            "You are an expert product recommendation engine for an eCommerce platform.\n"
+            f"Recommend {self.recommendation_count} products from the catalog below for the user described "
+            "after it, using their preferences and recently viewed products. Do not recommend products "
+            "they have already viewed.\n"
+        )
+        if self.response_format == 'compact':
+            return task + self.compact.instructions()
+        return task + (
+            f"Reply with only a JSON array of {self.recommendation_count} objects, best first, "
+            "using catalog ids:\n"
+            '[{"product_id": "p1", "explanation": "<why it suits the user, max 25 words>", "score": <1-10>}]\n\n'
+        )
+
+    def _preferences(self, user_preferences):
+        price_range = user_preferences.get('priceRange') or 'all'
+        categories = ', '.join(user_preferences.get('categories') or []) or 'any'
+        brands = ', '.join(user_preferences.get('brands') or []) or 'any'
+        return f"User preferences: price range {price_range}; categories {categories}; brands {brands}\n"
+
+    def _history_line(self, product, abbreviated=False):
+        if abbreviated:
+            return f"- {_truncate(product['name'], 32)} ({product.get('category', '')})\n"
+        tags = ', '.join(product.get('tags', [])[:5])
+        return (
+            f"- {product['name']} | {product.get('category', '')}>{product.get('subcategory', '')} | "
+            f"{product.get('brand', '')} | ${_price(product.get('price', 0))} | tags: {tags}\n"
+        )
+
+    def _catalog_row(self, short_id, product, abbreviated=False):
+        if abbreviated:
+            return (
+                f"{short_id}|{_truncate(product['name'], 24)}|{product.get('category', '')}|"
+                f"{product.get('brand', '')}|{_price(product.get('price', 0))}|\n"
+            )
+        return (
+            f"{short_id}|{product['name']}|{product.get('category', '')}>{product.get('subcategory', '')}|"
+            f"{product.get('brand', '')}|{_price(product.get('price', 0))}|{product.get('rating', '')}\n"
+        )
+
+    def _footer(self):
+        if self.response_format == 'compact':
+            return self.compact.footer()
+        return "\nReply with the JSON array only."
+
+    def max_completion_tokens(self):
+        """
+        Completion tokens a complete reply in the configured format needs
+        """
+        if self.response_format == 'compact':
+            return self.compact.max_completion_tokens()
+        return self.JSON_TOKENS_PER_RECOMMENDATION * self.recommendation_count + self.JSON_TOKENS_OVERHEAD
+
+    # ------------------------------------------------------------------
+    # Shared prefixes
+    # ------------------------------------------------------------------
+
+    def prepare(self, catalog):
+        """
+        Render the catalog sections of a newly loaded catalog and drop prefixes of the previous one
+
+        Sections for every category (and the whole catalog) in each preset
+        price range are rendered up front; anything else on first use.
+        """
+        sections = _CatalogSections(catalog, self._catalog_row, self.section_rows)
+        if self.section_rows:
+            sections.render_presets()
+        self._sections = sections
+        with self._version_lock:
+            self._prefix_version = catalog.version
+            self._prefixes.invalidate()
+
+    def _cache_prefix(self, key, version, prefix):
+        """
+        Cache a prefix unless it is for an older catalog version than the newest seen
+
+        Seeing a newer version drops the prefixes of earlier ones, so requests
+        still on a replaced snapshot neither keep nor add entries for it.
+        """
+        with self._version_lock:
+            if version is not None and version != self._prefix_version:
+                if self._prefix_version is not None and version < self._prefix_version:
+                    return
+                self._prefix_version = version
+                self._prefixes.invalidate()
+            self._prefixes.set(key, prefix)
+
+    def _catalog_sections(self, catalog):
+        sections = self._sections
+        if sections is None or sections.catalog is not catalog:
+            # A request still on a previous snapshot (or no prepare yet): render on demand
+            sections = _CatalogSections(catalog, self._catalog_row, self.section_rows)
+            if self._sections is None:
+                self._sections = sections
+        return sections
+
+    def prefix(self, user_preferences, catalog=None):
+        """
+        Shared prompt prefix for a user's preferences, from the cache when possible
+
+        Users with the same categories and price range (and no brand
+        restriction, which the sections do not apply) share a prefix.
+
+        Returns:
+        - tuple: (PromptPrefix, whether it was cached)
+        """
+        preferences = normalize_preferences(user_preferences)
+        sectioned = catalog is not None and self.section_rows and not preferences['brands']
+        categories = (preferences['categories'] or [None]) if sectioned else []
+        version = catalog.version if catalog is not None else None
+        key = '\x1f'.join([str(version if version is not None else ''), preferences['priceRange']]
+                          + [str(category) for category in categories])
+        prefix = self._prefixes.get(key)
+        if prefix is not None:
+            return prefix, True
+
+        count = self.tokenizer.count
+        parts = [self._instructions(), self.CATALOG_HEADER]
+        tokens = sum(count(part) for part in parts)
+        id_map = {}
+        if categories:
+            sections = self._catalog_sections(catalog)
+            # Sections may use at most half of the budget; the rest is for the user's own candidates
+            for category in categories:
+                rows, ids = sections.get(category, preferences['priceRange'])
+                rows_tokens = count(rows)
+                if not rows or tokens + rows_tokens > self.max_prompt_tokens // 2:
+                    continue
+                parts.append(rows)
+                tokens += rows_tokens
+                id_map.update(ids)
+        prefix = PromptPrefix(''.join(parts), tokens, id_map)
+        self._cache_prefix(key, version, prefix)
+        return prefix, False
+
+    def stats(self):
+        """
+        Prefix cache counters and how many prompt bytes were reused vs freshly rendered
+        """
+        total = self.bytes_reused + self.bytes_rendered
+        return {
+            'prefixes': len(self._prefixes),
+            'catalog_sections': len(self._sections) if self._sections is not None else 0,
+            'prefix_hits': self.prefix_hits,
+            'prefix_misses': self.prefix_misses,
+            'bytes_reused': self.bytes_reused,
+            'bytes_rendered': self.bytes_rendered,
+            'reuse_ratio': self.bytes_reused / total if total else 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Assembly
+    # ------------------------------------------------------------------
+
+    def build(self, user_preferences, browsed_products, candidates, catalog=None):
+        """
+        Build a prompt that fits the token budget
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed, oldest first
+        - candidates (list): Candidate products, best first
+        - catalog (CatalogIndex): Catalog the candidates come from; enables
+          catalog sections in the shared prefix
+
+        Returns:
+        - RecommendationPrompt
+        """
+        count = self.tokenizer.count
+        prefix, cached = self.prefix(user_preferences, catalog)
+        listed = set(prefix.id_map.values())
+        candidates = [p for p in candidates if p['id'] not in listed]
+
+        fixed = "\n" + self._preferences(user_preferences)
+        footer = self._footer()
+        budget = self.max_prompt_tokens - prefix.tokens - count(fixed) - count(footer) - count("Recently viewed:\n")
+
+        history = list(browsed_products)[-self.max_history:]
+        history_lines = [self._history_line(p) for p in history]
+        history_tokens = [count(line) for line in history_lines]
+
+        short_ids = [f"p{i + 1}" for i in range(len(candidates))]
+        rows = [self._catalog_row(sid, p) for sid, p in zip(short_ids, candidates)]
+        row_tokens = [count(row) for row in rows]
+
+        total = sum(history_tokens) + sum(row_tokens)
+        abbreviated = 0
+
+        # 1. Shorten history entries, oldest first
+        for i in range(len(history)):
+            if total <= budget:
+                break
+            line = self._history_line(history[i], abbreviated=True)
+            total += count(line) - history_tokens[i]
+            history_lines[i], history_tokens[i] = line, count(line)
+            abbreviated += 1
+
+        # 2. Shorten catalog rows, lowest ranked first
+        for i in reversed(range(len(rows))):
+            if total <= budget:
+                break
+            row = self._catalog_row(short_ids[i], candidates[i], abbreviated=True)
+            total += count(row) - row_tokens[i]
+            rows[i], row_tokens[i] = row, count(row)
+            abbreviated += 1
+
+        # 3. Drop catalog rows, lowest ranked first
+        keep = len(rows)
+        min_rows = max(self.min_candidates - len(prefix.id_map), 0)
+        while total > budget and keep > min_rows:
+            keep -= 1
+            total -= row_tokens[keep]
+
+        # 4. Drop history entries, oldest first
+        first_history = 0
+        while total > budget and first_history < len(history_lines):
+            total -= history_tokens[first_history]
+            first_history += 1
+
+        history_block = "Recently viewed:\n" + (''.join(history_lines[first_history:]) or "- None\n")
+        suffix = ''.join((''.join(rows[:keep]), fixed, history_block, footer))
+        if cached:
+            self.prefix_hits += 1
+            self.bytes_reused += prefix.nbytes
+        else:
+            self.prefix_misses += 1
+            self.bytes_rendered += prefix.nbytes
+        self.bytes_rendered += len(suffix.encode())
+
+        id_map = dict(prefix.id_map)
+        id_map.update(zip(short_ids[:keep], (p['id'] for p in candidates[:keep])))
+        return RecommendationPrompt(
+            text=prefix.text + suffix,
+            id_map=id_map,
+            prompt_tokens=prefix.tokens + count(suffix),
+            candidates=len(prefix.id_map) + keep,
+            dropped=len(rows) - keep,
+            abbreviated=abbreviated,
+            prefix_tokens=prefix.tokens,
+            prefix_version=prefix.version,
+            response_format=self.response_format,
+            max_completion_tokens=self.max_completion_tokens(),
+        )
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a fixed rate
+
+    Requests larger than the bucket capacity are clamped to it, so a single
+    oversized request waits for a full bucket instead of forever.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Parameters:
+        - rate_per_minute (float): Tokens added per minute
+        - capacity (float): Maximum burst (defaults to one minute's worth)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """
+        Seconds until `amount` tokens are available (0 if they are now)
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute limits for LLM calls
+
+    Callers `acquire` before each call with the tokens it may consume (prompt
+    plus completion limit). A limit of 0 disables that bucket. After a 429,
+    `pause` holds every caller back for the provider's Retry-After.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        """
+        Parameters:
+        - requests_per_minute (float): Request limit; 0 for none
+        - tokens_per_minute (float): Token limit; 0 for none
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+        self.pauses = 0
+
+    async def acquire(self, tokens=0):
+        """
+        Wait until one request using `tokens` tokens fits within the limits
+        """
+        start = time.monotonic()
+        # Callers are served in arrival order, so large requests are not starved
+        async with self._lock:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+        self.acquired += 1
+        self.waited_seconds += time.monotonic() - start
+
+    def pause(self, seconds):
+        """
+        Hold back all callers for `seconds`, e.g. after the provider returned 429
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.pauses += 1
+
+    def stats(self):
+        """
+        Counters for monitoring
+        """
+        return {
+            'acquired': self.acquired,
+            'waited_seconds': round(self.waited_seconds, 3),
+            'pauses': self.pauses,
+        }
@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_preferences(user_preferences):
+    """
+    Canonical form of a preferences dict: trimmed price range, sorted unique lists
+    """
+    price_range = str(user_preferences.get('priceRange') or 'all').strip().lower()
+    return {
+        'priceRange': price_range or 'all',
+        'categories': sorted({c.strip() for c in user_preferences.get('categories') or [] if c and c.strip()}),
+        'brands': sorted({b.strip() for b in user_preferences.get('brands') or [] if b and b.strip()}),
+    }
+
+
+def catalog_identity(catalog):
+    """
+    Identifies catalog contents: the data file fingerprint, else the catalog version
+
+    The fingerprint is the same in every worker and across restarts; the
+    version is only meaningful within one process.
+    """
+    return catalog.products.fingerprint or f"v{catalog.version}"
+
+
+def make_cache_key(user_preferences, browsing_history, catalog):
+    """
+    Stable hash of normalized preferences, order-insensitive history and catalog contents
+
+    Parameters:
+    - catalog (str): Catalog identity (see `catalog_identity`)
+    """
+    canonical = json.dumps(
+        {
+            'preferences': normalize_preferences(user_preferences),
+            'history': sorted(browsing_history or []),
+            'catalog': catalog,
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CacheBackend:
+    """
+    Interface for a shared cache store behind the in-process LRU
+
+    Values are JSON-serializable dicts; `expires_at` is a Unix timestamp.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache store in a local SQLite file, shareable by processes on one host
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connect()
+        # A SQLite connection must not be used across fork(); worker processes open their own
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS recommendation_cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM recommendation_cache WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            return None
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO recommendation_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM recommendation_cache')
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM recommendation_cache WHERE expires_at <= ?', (time.time(),))
+
+
+class RecommendationCache:
+    """
+    In-process LRU cache of recommendation responses with TTL expiry
+
+    An optional shared backend is consulted on local misses and written on
+    every `set`, so several workers can reuse each other's results. Backend
+    I/O blocks, so it runs on a dedicated thread: `get_async` awaits the
+    lookup there, and writes and clears are queued to it (write-behind) in
+    the order they were made. Expired entries stay in process until they are
+    replaced or evicted, so `get_stale` can still serve them when the
+    service is overloaded.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300, backend=None):
+        """
+        Parameters:
+        - max_entries (int): Maximum entries kept in process (least recently used evicted)
+        - ttl_seconds (float): Lifetime of an entry
+        - backend (CacheBackend): Optional shared store
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+
+    def _reset_executor(self):
+        self._executor = None
+
+    def _backend_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommendation-cache')
+                # Threads do not survive fork(); worker processes start their own
+                os.register_at_fork(after_in_child=self._reset_executor)
+            return self._executor
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self.expirations += 1
+        return None
+
+    def _get_backend(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.error("Recommendation cache backend error: %s", e)
+            return None
+
+    def _found(self, key, found):
+        if found is not None:
+            value, expires_at = found
+            with self._lock:
+                self._store(key, value, expires_at)
+                self.hits += 1
+                self.backend_hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key):
+        """
+        Return the cached value for `key`, or None on a miss
+
+        Waits for the shared backend after a local miss; use `get_async` on the event loop.
+        """
+        value = self._get_local(key, time.time())
+        if value is not None:
+            return value
+        found = None
+        if self.backend is not None:
+            # Through the I/O thread, so the lookup sees this cache's queued writes
+            found = self._backend_executor().submit(self._get_backend, key).result()
+        return self._found(key, found)
+
+    async def get_async(self, key):
+        """
+        Same as `get`, with the backend lookup run off the event loop
+        """
+        value = self._get_local(key, time.time())
+        if value is not None:
+            return value
+        found = None
+        if self.backend is not None:
+            found = await asyncio.get_running_loop().run_in_executor(self._backend_executor(), self._get_backend, key)
+        return self._found(key, found)
+
+    def get_stale(self, key):
+        """
+        Return the in-process value for `key` even if it has expired, or None
+
+        For degraded responses when a fresh one cannot be computed in time.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.stale_hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """
+        Cache `value` under `key` for the configured TTL
+        """
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            self._backend_executor().submit(self._backend_call, self.backend.set, key, value, expires_at)
+
+    def _backend_call(self, method, *args):
+        try:
+            method(*args)
+        except Exception as e:
+            logger.error("Recommendation cache backend error: %s", e)
+
+    def flush(self):
+        """
+        Wait until queued backend writes and clears are done
+        """
+        if self._executor is not None:
+            self._executor.submit(lambda: None).result()
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, shared=True):
+        """
+        Drop every entry in process and, with `shared`, in the shared backend
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        if shared and self.backend is not None:
+            self._backend_executor().submit(self._backend_call, self.backend.clear)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Counters for monitoring
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'backend_hits': self.backend_hits,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'stale_hits': self.stale_hits,
+        }
@@ -0,0 +1,332 @@
+import bisect
+import hashlib
+import re
+
+import numpy as np
+
+from services.embedding_index import FIELD_WEIGHTS
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Byte translation for bulk tokenizing: ASCII letters lowercased, digits kept,
+# everything else (punctuation, whitespace, non-ASCII bytes) becomes a space
+_TOKEN_BYTES = bytes(
+    c + 32 if 65 <= c <= 90 else c if 97 <= c <= 122 or 48 <= c <= 57 else 32
+    for c in range(256)
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Most terms a typeahead prefix expands to (the most frequent ones win)
+PREFIX_EXPANSIONS = 16
+
+# Postings read per term for typeahead queries; lists are impact-ordered,
+# so this is the head of each list
+TYPEAHEAD_DEPTH = 2048
+
+# Postings a filtered typeahead query may scan, shared by its terms (but at
+# least TYPEAHEAD_MIN_SCAN each), while looking for TYPEAHEAD_DEPTH matches per term
+TYPEAHEAD_SCAN_BUDGET = 16384
+TYPEAHEAD_MIN_SCAN = 1024
+
+# Strings tokenized, or products expanded, per step of an index build (see _tokenize_strings)
+BUILD_CHUNK = 2048
+
+# Below this many gathered postings scores are summed sparsely, above it densely
+SPARSE_LIMIT = 32768
+
+
+def tokenize(text):
+    """
+    Lowercase alphanumeric tokens, as the index splits product text
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _tokenize_strings(data, offsets, vocab):
+    """
+    Tokenize every string of a StringColumn buffer, adding new terms to vocab
+
+    Strings are processed BUILD_CHUNK at a time. Splitting and term
+    lookups are single C calls that hold the GIL throughout, so on a large
+    catalog one pass over the whole buffer would stall request threads for
+    hundreds of milliseconds; between chunks the interpreter can switch.
+
+    Returns:
+    - tuple: (int32 string index of every token, int32 term id of every token)
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    count = len(offsets) - 1
+    owners, terms = [], []
+    for first in range(0, count, BUILD_CHUNK):
+        last = min(first + BUILD_CHUNK, count)
+        text = bytes(data[offsets[first]:offsets[last]]).translate(_TOKEN_BYTES)
+        # A space in front of every string, so tokens never run across strings
+        string_offsets = offsets[first:last] - offsets[first]
+        spaced = np.insert(np.frombuffer(text, dtype=np.uint8), string_offsets, 32)
+        word = spaced != 32
+        starts = np.flatnonzero(word[1:] & ~word[:-1]) + 1
+        string_starts = string_offsets + np.arange(last - first)
+        owners.append((np.searchsorted(string_starts, starts, side='right') - 1 + first).astype(np.int32))
+        terms.append(SearchIndex._term_ids(spaced.tobytes().split(), vocab))
+    if not owners:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    return np.concatenate(owners), np.concatenate(terms)
+
+
+def _column_signature(*arrays):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).view(np.uint8).data)
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class SearchIndex:
+    """
+    In-process inverted index over product text with BM25 ranking
+
+    Indexed fields and their weights are the ones the embedding index uses
+    (name, description, features, tags). Postings are stored as one CSR
+    structure: per term, catalog positions and precomputed BM25 impacts,
+    ordered by impact, so a query only sums impacts and a typeahead query
+    can stop after the head of each list. The last word of a typeahead
+    query matches as a prefix, expanded through the sorted vocabulary.
+
+    The index is built from the table's columns with bulk NumPy operations
+    rather than per-product Python work.
+    """
+
+    def __init__(self, count, vocab, term_offsets, docs, impacts, signatures):
+        self.count = count
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.docs = docs
+        self.impacts = impacts
+        self.signatures = signatures
+        self.doc_freq = np.diff(term_offsets)
+        # Live terms in byte order, for prefix ranges
+        live = sorted(term for term, term_id in vocab.items() if self.doc_freq[term_id])
+        self._sorted_terms = live
+        self._sorted_ids = np.fromiter((vocab[term] for term in live), dtype=np.int64, count=len(live))
+
+    @staticmethod
+    def field_signatures(table):
+        """
+        Content signature of each indexed column, used to reuse an index across reloads
+        """
+        return {
+            'name': _column_signature(table.names.data, table.names.offsets),
+            'description': _column_signature(table.descriptions.data, table.descriptions.offsets),
+            'features': _column_signature(table.features.offsets, table.features.codes,
+                                          table.features.vocab.data, table.features.vocab.offsets),
+            'tags': _column_signature(table.tags.offsets, table.tags.codes,
+                                      table.tags.vocab.data, table.tags.vocab.offsets),
+        }
+
+    @classmethod
+    def build(cls, table, previous=None):
+        """
+        Index a ProductTable
+
+        Parameters:
+        - table (ProductTable): Catalog to index
+        - previous (SearchIndex): Index of the catalog being replaced; returned
+          as is when no indexed text changed (e.g. a reload that only touched
+          prices or inventory)
+
+        Returns:
+        - SearchIndex
+        """
+        signatures = cls.field_signatures(table)
+        if previous is not None and previous.signatures == signatures and previous.count == len(table):
+            return previous
+
+        count = len(table)
+        vocab = {}
+        keys, weights = [], []
+        columns = {'name': table.names, 'description': table.descriptions,
+                   'features': table.features, 'tags': table.tags}
+        for field, weight in FIELD_WEIGHTS:
+            docs, terms = cls._field_terms(columns[field], vocab)
+            keys.append(terms.astype(np.int64) * max(count, 1) + docs)
+            weights.append(np.full(len(docs), weight, dtype=np.float32))
+        keys = np.concatenate(keys)
+        weights = np.concatenate(weights)
+
+        # Sum field-weighted term frequencies per (term, product)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        tf = np.add.reduceat(weights[order], starts) if len(starts) else np.zeros(0, dtype=np.float32)
+        keys = keys[starts]
+        terms = keys // max(count, 1)
+        docs = (keys % max(count, 1)).astype(np.int32)
+
+        # BM25 impact of every posting
+        doc_freq = np.bincount(terms, minlength=len(vocab))
+        idf = np.log1p((count - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        lengths = np.bincount(docs, weights=tf, minlength=count).astype(np.float32)
+        average = float(lengths.mean()) if count else 1.0
+        norm = K1 * (1 - B + B * lengths / (average or 1.0))
+        impacts = (idf[terms] * tf * (K1 + 1) / (tf + norm[docs])).astype(np.float32)
+
+        # Order each term's postings by impact, best first
+        rank = np.iinfo(np.uint32).max - impacts.view(np.uint32).astype(np.uint64)
+        order = np.argsort((terms.astype(np.uint64) << np.uint64(32)) | rank, kind='stable')
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=term_offsets[1:])
+        return cls(count, vocab, term_offsets, docs[order], impacts[order], signatures)
+
+    @staticmethod
+    def _field_terms(column, vocab):
+        """
+        (product position, term id) of every token in one column, adding new terms to vocab
+        """
+        if hasattr(column, 'codes'):
+            # List column: tokenize the vocabulary once, then expand each product's codes
+            owners, entry_terms = _tokenize_strings(column.vocab.data, column.vocab.offsets, vocab)
+            entry_offsets = np.searchsorted(owners, np.arange(len(column.vocab) + 1))
+            entry_lengths = np.diff(entry_offsets)
+            offsets = np.asarray(column.offsets, dtype=np.int64)
+            codes = np.asarray(column.codes)
+            docs, terms = [np.zeros(0, dtype=np.int32)], [np.zeros(0, dtype=np.int32)]
+            for first in range(0, len(column), BUILD_CHUNK):
+                last = min(first + BUILD_CHUNK, len(column))
+                chunk_codes = codes[offsets[first]:offsets[last]]
+                code_docs = np.repeat(np.arange(first, last, dtype=np.int32), np.diff(offsets[first:last + 1]))
+                lengths = entry_lengths[chunk_codes]
+                ends = np.cumsum(lengths)
+                total = int(ends[-1]) if len(ends) else 0
+                index = np.repeat(entry_offsets[chunk_codes] - (ends - lengths), lengths) + np.arange(total)
+                docs.append(np.repeat(code_docs, lengths))
+                terms.append(entry_terms[index])
+            return np.concatenate(docs), np.concatenate(terms)
+        return _tokenize_strings(column.data, column.offsets, vocab)
+
+    @staticmethod
+    def _term_ids(tokens, vocab):
+        for token in dict.fromkeys(tokens):
+            if token not in vocab:
+                vocab[token] = len(vocab)
+        return np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int32, count=len(tokens))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def terms(self):
+        return len(self._sorted_terms)
+
+    @property
+    def nbytes(self):
+        return self.term_offsets.nbytes + self.docs.nbytes + self.impacts.nbytes
+
+    def expand_prefix(self, prefix, limit=PREFIX_EXPANSIONS):
+        """
+        Term ids of the most frequent indexed terms starting with `prefix`
+        """
+        prefix = prefix.encode()
+        lo = bisect.bisect_left(self._sorted_terms, prefix)
+        hi = bisect.bisect_left(self._sorted_terms, prefix + b'\xff', lo)
+        ids = self._sorted_ids[lo:hi]
+        if len(ids) > limit:
+            ids = ids[np.argpartition(-self.doc_freq[ids], limit - 1)[:limit]]
+        return ids.tolist()
+
+    def _postings(self, term_id, depth, accept, scan_limit=None):
+        """
+        Head of a term's impact-ordered postings, optionally restricted by a filter
+
+        With a filter and a depth, the list is read in growing chunks until
+        `depth` postings pass or `scan_limit` postings have been read.
+        """
+        start, stop = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+        if accept is None:
+            if depth is not None:
+                stop = min(stop, start + depth)
+            return self.docs[start:stop], self.impacts[start:stop]
+        if depth is None:
+            docs = self.docs[start:stop]
+            keep = accept(docs)
+            return docs[keep], self.impacts[start:stop][keep]
+        if scan_limit is not None:
+            stop = min(stop, start + scan_limit)
+        found_docs, found_impacts, found = [], [], 0
+        chunk = min(depth, TYPEAHEAD_MIN_SCAN)
+        while start < stop and found < depth:
+            end = min(start + chunk, stop)
+            docs = self.docs[start:end]
+            keep = accept(docs)
+            found_docs.append(docs[keep])
+            found_impacts.append(self.impacts[start:end][keep])
+            found += len(found_docs[-1])
+            start += chunk
+            chunk *= 4
+        if not found_docs:
+            return self.docs[:0], self.impacts[:0]
+        return np.concatenate(found_docs)[:depth], np.concatenate(found_impacts)[:depth]
+
+    def search(self, query, k=10, accept=None, prefix=True):
+        """
+        Top-k products for a text query, by BM25 score
+
+        Parameters:
+        - query (str): Free text
+        - k (int): Number of results
+        - accept (callable): Optional filter, positions -> boolean array of the ones allowed
+          (see CatalogIndex.position_filter)
+        - prefix (bool): Typeahead mode: unless the query ends with whitespace,
+          its last word also matches longer terms, and only the head of each
+          postings list is read
+
+        Returns:
+        - tuple: (catalog positions, scores), best first
+        """
+        words = tokenize(query)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if not words or not self.count:
+            return empty
+        typeahead = prefix and not query[-1].isspace()
+        term_ids = [self.vocab[word.encode()] for word in (words[:-1] if typeahead else words)
+                    if word.encode() in self.vocab]
+        if typeahead:
+            term_ids.extend(self.expand_prefix(words[-1]))
+        depth = TYPEAHEAD_DEPTH if typeahead else None
+
+        term_ids = list(dict.fromkeys(term_ids))
+        if len(term_ids) == 1 and depth is None:
+            # One impact-ordered list: its head is the answer
+            depth = k
+        scan_limit = None
+        if typeahead and accept is not None:
+            scan_limit = max(TYPEAHEAD_MIN_SCAN, TYPEAHEAD_SCAN_BUDGET // max(len(term_ids), 1))
+        lists = [self._postings(term_id, depth, accept, scan_limit) for term_id in term_ids]
+        lists = [(docs, impacts) for docs, impacts in lists if len(docs)]
+        if not lists:
+            return empty
+        if len(lists) == 1:
+            positions, scores = lists[0]
+        elif sum(len(docs) for docs, _ in lists) <= SPARSE_LIMIT:
+            positions, inverse = np.unique(np.concatenate([docs for docs, _ in lists]), return_inverse=True)
+            # Rounded to float32 so ties rank the same as on the dense path
+            scores = np.bincount(inverse, weights=np.concatenate([impacts for _, impacts in lists])).astype(np.float32)
+        else:
+            dense = np.zeros(self.count, dtype=np.float32)
+            for docs, impacts in lists:
+                dense[docs] += impacts
+            positions = np.flatnonzero(dense)
+            scores = dense[positions]
+
+        if len(positions) > k:
+            # Everything above the k-th score, then ties at it by position
+            threshold = -np.partition(-scores, k - 1)[k - 1]
+            above = np.flatnonzero(scores > threshold)
+            ties = np.flatnonzero(scores == threshold)
+            ties = ties[np.argsort(positions[ties], kind='stable')[:k - len(above)]]
+            selected = np.concatenate([above, ties])
+            positions, scores = positions[selected], scores[selected]
+        order = np.lexsort((positions, -scores))
+        return positions[order].astype(np.int64), scores[order].astype(np.float32)
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import fcntl
+import json
+import logging
+import os
+import time
+
+from services.batch_service import parse_record
+from services.candidate_filter import PRICE_BUCKETS
+from services.recommendation_cache import normalize_preferences
+
+logger = logging.getLogger(__name__)
+
+
+def segment_key(user_preferences):
+    """
+    Canonical JSON of normalized preferences, identifying a segment
+    """
+    return json.dumps(normalize_preferences(user_preferences), sort_keys=True, separators=(',', ':'))
+
+
+def default_segments(catalog):
+    """
+    Segments the frontend can produce with at most one category and no brands
+
+    Every price range of the frontend selector ("all" and PRICE_BUCKETS),
+    with no category or one of the catalog's categories. Combinations
+    without an in-stock product are left out.
+    """
+    categories = [[]] + [[category] for category in sorted(catalog.categories())]
+    segments = [
+        {'priceRange': price_range, 'categories': chosen, 'brands': []}
+        for price_range in ('all', *PRICE_BUCKETS)
+        for chosen in categories
+    ]
+    return [p for p in segments if catalog.candidate_filter.candidate_mask(p).any()]
+
+
+def segments_from_requests(lines, top=200):
+    """
+    The most common preference segments among logged recommendation requests
+
+    Parameters:
+    - lines: JSONL lines in the /api/recommendations/batch record format;
+      invalid records and records with a browsing history are ignored
+    - top (int): Segments returned
+
+    Returns:
+    - list: Normalized preference dicts, most requested first
+    """
+    counts = collections.Counter()
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            _, user_preferences, history = parse_record(line, line_number)
+        except ValueError:
+            continue
+        if not history:
+            counts[segment_key(user_preferences)] += 1
+    return [json.loads(key) for key, _ in counts.most_common(top)]
+
+
+class SegmentCache:
+    """
+    Recommendations precomputed for common preference segments
+
+    A segment is a normalized set of preferences with no browsing history.
+    Its recommendations are generated ahead of time (scripts/precompute_segments.py)
+    and saved to a JSON file with the fingerprint of the catalog they were
+    generated from. They are only served while that catalog is the one in
+    service. They do not expire or get evicted like the response cache.
+
+    When the catalog changes, `refresh` regenerates them. Worker processes
+    share the file: one regenerates while the others wait on its lock and
+    then load what it wrote.
+    """
+
+    # Seconds between checks of a lock held by another process
+    LOCK_POLL_INTERVAL = 1.0
+
+    def __init__(self, path=None):
+        """
+        Parameters:
+        - path (str): JSON file the segments are saved to; None keeps them in memory only
+        """
+        self.path = path
+        self.segments = []
+        self._responses = {}
+        self.fingerprint = None
+        self.catalog_version = None
+        self.generated_at = None
+        self.hits = 0
+        self.refreshes = 0
+        self.last_refresh_error = None
+        self._task = None
+
+    def get(self, user_preferences, catalog):
+        """
+        Precomputed recommendations for a segment, or None
+
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - catalog (CatalogIndex): Catalog the request is served from
+        """
+        if catalog.version != self.catalog_version:
+            return None
+        response = self._responses.get(segment_key(user_preferences))
+        if response is not None:
+            self.hits += 1
+        return response
+
+    def _install(self, segments, responses, fingerprint, catalog, generated_at):
+        self.segments = segments
+        # One dict assignment, so concurrent lookups see the old or the new set, never a mix
+        self._responses = responses
+        self.fingerprint = fingerprint
+        self.catalog_version = catalog.version
+        self.generated_at = generated_at
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read precomputed segments %s: %s", self.path, e)
+            return None
+
+    def load(self, catalog):
+        """
+        Serve the saved segments if they were generated from `catalog`
+
+        Segments of another catalog are remembered (so `refresh` regenerates
+        them) but not served.
+
+        Returns:
+        - bool: True if the saved recommendations are current
+        """
+        saved = self._read()
+        if saved is None:
+            return False
+        self.segments = [entry['preferences'] for entry in saved['segments']]
+        if not catalog.products.fingerprint or saved['catalog_fingerprint'] != catalog.products.fingerprint:
+            self._responses = {}
+            self.catalog_version = None
+            return False
+        responses = {
+            segment_key(entry['preferences']): entry['response']
+            for entry in saved['segments'] if entry.get('response')
+        }
+        self._install(self.segments, responses, saved['catalog_fingerprint'], catalog, saved['generated_at'])
+        return True
+
+    def _save(self, results, fingerprint, generated_at):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        staging = f"{self.path}.tmp-{os.getpid()}"
+        with open(staging, 'w') as file:
+            file.write(json.dumps({
+                'catalog_fingerprint': fingerprint,
+                'generated_at': generated_at,
+                'segments': [{'preferences': p, 'response': r} for p, r in results],
+            }, separators=(',', ':')))
+        os.replace(staging, self.path)
+
+    async def precompute(self, batch_service, segments, catalog):
+        """
+        Generate recommendations for `segments` from `catalog`, serve them and save them
+
+        Requests go through the batch service (rate limits, retries). A
+        segment the LLM fails on is saved without a response and retried on
+        the next run.
+
+        Returns:
+        - dict: Counters for the run: segments, generated, failed, llm_calls, retries
+        """
+        segments = [normalize_preferences(p) for p in segments]
+        lines = [json.dumps({'id': str(i), 'preferences': p}) for i, p in enumerate(segments)]
+        responses = {}
+        stats = {}
+        async for result in batch_service.run(lines, stats=stats):
+            if 'error' not in result:
+                responses[int(result.pop('id'))] = result
+        generated_at = time.time()
+        results = [(p, responses.get(i)) for i, p in enumerate(segments)]
+        self._install(
+            segments, {segment_key(p): r for p, r in results if r is not None},
+            catalog.products.fingerprint, catalog, generated_at
+        )
+        if self.path:
+            self._save(results, catalog.products.fingerprint, generated_at)
+        return {
+            'segments': len(segments), 'generated': len(responses), 'failed': len(segments) - len(responses),
+            'llm_calls': stats.get('llm_calls', 0), 'retries': stats.get('retries', 0),
+        }
+
+    async def refresh(self, batch_service, product_service):
+        """
+        Bring the segments up to date with the catalog in service
+
+        Holds an exclusive lock on the segments file while regenerating, so
+        only one worker process calls the LLM. The others wait for the lock
+        and then load the file it wrote.
+        """
+        if not self.segments and not (self.path and os.path.exists(self.path)):
+            return
+        lock = open(self.path + '.lock', 'w') if self.path else None
+        try:
+            while lock is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+            # Go again if the catalog was reloaded while the LLM calls were running
+            while True:
+                catalog = product_service.catalog
+                if self.catalog_version == catalog.version or self.load(catalog) or not self.segments:
+                    break
+                stats = await self.precompute(batch_service, self.segments, catalog)
+                self.refreshes += 1
+                self.last_refresh_error = None
+                logger.info("Precomputed segments refreshed for catalog version %d: %d/%d generated",
+                            catalog.version, stats['generated'], stats['segments'])
+        except Exception as e:
+            self.last_refresh_error = str(e)
+            logger.error("Precomputed segment refresh failed: %s", e)
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def start(self, batch_service, product_service):
+        """
+        Refresh in the background now if the segments are stale, and after every catalog reload
+
+        Must be called from the event loop the refreshes should run on.
+        """
+        loop = asyncio.get_running_loop()
+
+        def schedule():
+            if self._task is None or self._task.done():
+                self._task = loop.create_task(self.refresh(batch_service, product_service))
+
+        def on_reload(catalog):
+            # An unchanged file keeps its recommendations; `get` stops serving them otherwise
+            if catalog.products.fingerprint and catalog.products.fingerprint == self.fingerprint:
+                self.catalog_version = catalog.version
+            else:
+                loop.call_soon_threadsafe(schedule)
+
+        product_service.add_reload_listener(on_reload)
+        if self.segments and self.catalog_version != product_service.catalog.version:
+            schedule()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self):
+        """
+        Counters for monitoring (this worker only)
+        """
+        return {
+            'segments': len(self.segments),
+            'precomputed': len(self._responses),
+            'catalog_fingerprint': self.fingerprint,
+            'catalog_version': self.catalog_version,
+            'generated_at': self.generated_at,
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'last_refresh_error': self.last_refresh_error,
+        }
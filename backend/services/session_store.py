@@ -0,0 +1,416 @@
+import fcntl
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from services.candidate_filter import PRICE_BUCKETS
+from services.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def price_band(price):
+    """
+    Name of the PRICE_BUCKETS bucket a price falls in
+    """
+    for name, (low, high) in PRICE_BUCKETS.items():
+        if (low is None or price >= low) and (high is None or price < high):
+            return name
+    return None
+
+
+def _encode_snapshot(sessions):
+    """
+    JSON-serializable form of {session_id: (updated_at, views)}
+
+    Views repeat across sessions, so each distinct view is written once to a
+    table and sessions list indexes into it.
+    """
+    table = {}
+    encoded = {
+        session_id: [updated_at, [table.setdefault(view, len(table)) for view in views]]
+        for session_id, (updated_at, views) in sessions.items()
+    }
+    return {
+        'views': [[product_id, category, brand, list(tags), price] for product_id, category, brand, tags, price in table],
+        'sessions': encoded,
+    }
+
+
+def _decode_snapshot(saved):
+    """
+    Inverse of _encode_snapshot; restored views share their tuples and interned strings
+    """
+    views = [
+        (sys.intern(product_id), sys.intern(category), sys.intern(brand),
+         tuple(sys.intern(tag) for tag in tags), float(price))
+        for product_id, category, brand, tags, price in saved['views']
+    ]
+    return {
+        session_id: (updated_at, [views[i] for i in indexes])
+        for session_id, (updated_at, indexes) in saved['sessions'].items()
+    }
+
+
+def _drop(counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class SessionProfile:
+    """
+    A user's most recently viewed products and the affinities they add up to
+
+    Views are kept in a ring buffer of at most `max_views`. Each view stores
+    the product's category, brand, tags and price as they were when it was
+    viewed, so the affinity counts and price total can be updated in place
+    when a view is added or falls out of the buffer, without looking the
+    product up again (it may have changed or left the catalog since).
+    """
+
+    def __init__(self, session_id, max_views=50):
+        """
+        Parameters:
+        - session_id (str): Client-chosen session identifier
+        - max_views (int): Views kept (oldest dropped first)
+        """
+        self.session_id = session_id
+        self.views = deque(maxlen=max_views)
+        self.categories = Counter()
+        self.brands = Counter()
+        self.tags = Counter()
+        self.price_total = 0.0
+        self.updated_at = time.time()
+
+    def record(self, product):
+        """
+        Append a viewed product, forgetting the oldest view if the buffer is full
+        """
+        if len(self.views) == self.views.maxlen:
+            self._forget(self.views[0])
+        # Catalog strings repeat across millions of views; interning keeps one copy of each
+        view = (
+            sys.intern(product['id']),
+            sys.intern(product.get('category') or ''),
+            sys.intern(product.get('brand') or ''),
+            tuple(sys.intern(tag) for tag in product.get('tags') or ()),
+            float(product.get('price') or 0.0),
+        )
+        self._add(view)
+        self.updated_at = time.time()
+
+    def _add(self, view):
+        _, category, brand, tags, price = view
+        self.views.append(view)
+        if category:
+            self.categories[category] += 1
+        if brand:
+            self.brands[brand] += 1
+        self.tags.update(tags)
+        self.price_total += price
+
+    def _forget(self, view):
+        _, category, brand, tags, price = view
+        if category:
+            _drop(self.categories, category)
+        if brand:
+            _drop(self.brands, brand)
+        for tag in tags:
+            _drop(self.tags, tag)
+        self.price_total -= price
+
+    def history(self):
+        """
+        Viewed product IDs, oldest first
+        """
+        return [view[0] for view in self.views]
+
+    def average_price(self):
+        return self.price_total / len(self.views) if self.views else None
+
+    def to_dict(self, top=5):
+        """
+        JSON-serializable summary with the `top` strongest affinities of each kind
+        """
+        average = self.average_price()
+        return {
+            'session_id': self.session_id,
+            'views': len(self.views),
+            'history': self.history(),
+            'categories': dict(self.categories.most_common(top)),
+            'brands': dict(self.brands.most_common(top)),
+            'tags': dict(self.tags.most_common(top)),
+            'average_price': round(average, 2) if average is not None else None,
+            'price_band': price_band(average) if average is not None else None,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def restore(cls, session_id, updated_at, views, max_views):
+        """
+        Rebuild a profile from saved view tuples, replaying the affinity counts
+        """
+        profile = cls(session_id, max_views)
+        for view in views[-max_views:]:
+            profile._add(view)
+        profile.updated_at = updated_at
+        return profile
+
+
+class SessionStore:
+    """
+    Server-side browsing sessions, so recommendation requests can send a session id instead of the full history
+
+    Sessions live in process, in least recently used order: past
+    `max_sessions` the idlest is evicted, and sessions idle for longer than
+    `idle_seconds` are dropped when next touched or snapshotted. With a
+    `snapshot_path`, sessions are written to a JSON file periodically (see
+    `start`) and on shutdown, and read back on startup.
+    Workers merge their sessions into the file, keeping the most recently
+    updated copy of each.
+    """
+
+    def __init__(self, max_sessions=10000, max_views=50, idle_seconds=86400, snapshot_path=None, metrics=None):
+        """
+        Parameters:
+        - max_sessions (int): Sessions kept in process (least recently used evicted)
+        - max_views (int): Views kept per session
+        - idle_seconds (float): Sessions idle for longer are dropped (0 keeps them until evicted)
+        - snapshot_path (str): JSON file sessions are persisted to; None disables persistence
+        - metrics (MetricsRegistry): Registry for the session gauge and counters
+        """
+        self.max_sessions = max_sessions
+        self.max_views = max_views
+        self.idle_seconds = idle_seconds
+        self.snapshot_path = snapshot_path
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.views = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.snapshots = 0
+        registry = metrics if metrics is not None else MetricsRegistry()
+        self.active = registry.gauge('sessions_active', 'Browsing sessions held in memory')
+        self.view_events = registry.counter('session_views_total', 'Product views recorded in sessions')
+        self.evicted = registry.counter(
+            'session_evictions_total', 'Sessions dropped from memory',
+            label='reason', values=('lru', 'idle')
+        )
+
+    def _expired(self, profile, now):
+        return self.idle_seconds > 0 and now - profile.updated_at > self.idle_seconds
+
+    def _lookup(self, session_id):
+        """
+        Live session for `session_id`, marked most recently used; call with the lock held
+        """
+        profile = self._sessions.get(session_id)
+        if profile is None:
+            return None
+        if self._expired(profile, time.time()):
+            self._remove(session_id, 'idle')
+            return None
+        self._sessions.move_to_end(session_id)
+        return profile
+
+    def _remove(self, session_id, reason):
+        del self._sessions[session_id]
+        self.active.dec()
+        self.evicted.inc(label_value=reason)
+        if reason == 'idle':
+            self.expirations += 1
+        else:
+            self.evictions += 1
+
+    def record_view(self, session_id, product):
+        """
+        Add a viewed product to a session, creating the session if needed
+
+        Parameters:
+        - session_id (str): Session identifier
+        - product (dict): Catalog product that was viewed
+
+        Returns:
+        - int: Views now held for the session
+        """
+        with self._lock:
+            profile = self._lookup(session_id)
+            if profile is None:
+                profile = self._sessions[session_id] = SessionProfile(session_id, self.max_views)
+                self.active.inc()
+                while len(self._sessions) > self.max_sessions:
+                    self._remove(next(iter(self._sessions)), 'lru')
+            profile.record(product)
+            self.views += 1
+            self.view_events.inc()
+            return len(profile.views)
+
+    def history(self, session_id):
+        """
+        Viewed product IDs of a session, oldest first (empty for an unknown session)
+        """
+        with self._lock:
+            profile = self._lookup(session_id)
+            return profile.history() if profile is not None else []
+
+    def profile(self, session_id):
+        """
+        Summary of a session (see SessionProfile.to_dict), or None for an unknown session
+        """
+        with self._lock:
+            profile = self._lookup(session_id)
+            return profile.to_dict() if profile is not None else None
+
+    def forget(self, session_id):
+        """
+        Delete a session; returns False if there was none
+        """
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                return False
+            self.active.dec()
+            return True
+
+    def purge_idle(self):
+        """
+        Drop every session idle for longer than `idle_seconds`
+        """
+        if self.idle_seconds <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            # Least recently used first, so stop at the first live one
+            while self._sessions:
+                session_id, profile = next(iter(self._sessions.items()))
+                if not self._expired(profile, now):
+                    break
+                self._remove(session_id, 'idle')
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """
+        Read sessions back from the snapshot file, if there is one
+
+        Returns:
+        - int: Sessions restored
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path) as file:
+                saved = _decode_snapshot(json.load(file))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Could not read session snapshot %s: %s", self.snapshot_path, e)
+            return 0
+        now = time.time()
+        # Oldest first, so the most recently updated end up most recently used
+        ordered = sorted(saved.items(), key=lambda item: item[1][0])[-self.max_sessions:]
+        with self._lock:
+            for session_id, (updated_at, views) in ordered:
+                profile = SessionProfile.restore(session_id, updated_at, views, self.max_views)
+                if self._expired(profile, now):
+                    continue
+                if session_id not in self._sessions:
+                    self.active.inc()
+                self._sessions[session_id] = profile
+                self._sessions.move_to_end(session_id)
+        return len(self._sessions)
+
+    def snapshot(self):
+        """
+        Merge the sessions of this process into the snapshot file
+
+        The file is rewritten atomically under an exclusive lock, so workers
+        snapshotting at the same time do not lose each other's sessions. A
+        session present in both keeps its most recently updated copy.
+        """
+        if not self.snapshot_path:
+            return
+        self.purge_idle()
+        with self._lock:
+            sessions = {
+                session_id: (profile.updated_at, list(profile.views)) for session_id, profile in self._sessions.items()
+            }
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.snapshot_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.snapshot_path) as file:
+                    merged = _decode_snapshot(json.load(file))
+            except (OSError, ValueError, KeyError):
+                merged = {}
+            now = time.time()
+            for session_id, saved in sessions.items():
+                if session_id not in merged or merged[session_id][0] < saved[0]:
+                    merged[session_id] = saved
+            live = [
+                item for item in merged.items()
+                if self.idle_seconds <= 0 or now - item[1][0] <= self.idle_seconds
+            ]
+            live.sort(key=lambda item: item[1][0])
+            encoded = json.dumps(_encode_snapshot(dict(live[-self.max_sessions:])), separators=(',', ':'))
+            staging = f"{self.snapshot_path}.tmp-{os.getpid()}"
+            with open(staging, 'w') as file:
+                file.write(encoded)
+            os.replace(staging, self.snapshot_path)
+        self.snapshots += 1
+
+    def start(self, interval):
+        """
+        Snapshot every `interval` seconds from a background thread
+        """
+        if self.snapshot_path and interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='session-snapshot', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the snapshot thread and take a final snapshot
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.snapshot()
+        except Exception as e:
+            logger.error("Session snapshot failed: %s", e)
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error("Session snapshot failed: %s", e)
+
+    def stats(self):
+        """
+        Counters for monitoring (this worker only)
+        """
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'max_views': self.max_views,
+            'idle_seconds': self.idle_seconds,
+            'views': self.views,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'snapshots': self.snapshots,
+            'snapshot_path': self.snapshot_path,
+        }
@@ -0,0 +1,468 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# Bump when the stored layout or the scoring changes; older tables are rebuilt
+TABLE_FORMAT = 1
+
+# Contribution of each signal to a neighbour's score (they sum to 1)
+WEIGHTS = {'subcategory': 0.35, 'category': 0.15, 'brand': 0.10, 'tags': 0.25, 'price': 0.15}
+
+# Price proximity is exp(-|ln(price_a / price_b)| / PRICE_SCALE): 0.37 at a 1.65x price gap
+PRICE_SCALE = 0.5
+
+# Candidates scored per product: the products nearest in price within the
+# same subcategory and within the same category (window widths, in products)
+SUBCATEGORY_WINDOW = 64
+CATEGORY_WINDOW = 32
+
+# An update that would recompute more than this fraction of the table rebuilds it instead
+REBUILD_FRACTION = 0.5
+
+# Products scored per batch during a build
+ROWS_PER_CHUNK = 8192
+
+# Tag sets are compared through 128-bit hashed signatures
+_TAG_BITS = 128
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def _string_hashes(values):
+    """
+    Stable 64-bit hashes of vocabulary strings, as a uint64 array
+    """
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'little')
+         for value in values],
+        dtype=np.uint64,
+    )
+
+
+def _mix(values):
+    """
+    splitmix64 finalizer over a uint64 array (wrapping arithmetic)
+    """
+    x = values ^ (values >> np.uint64(30))
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _popcount(values):
+    """
+    Set bits of every element of a uint64 array (SWAR; numpy < 2 has no bitwise_count)
+    """
+    x = values - ((values >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+def _shared_bits(ours, theirs):
+    """
+    Set bits of `ours & theirs` summed over the last axis of 2 words
+    """
+    x = ours[..., 0] & theirs[..., 0]
+    y = ours[..., 1] & theirs[..., 1]
+    x = x - ((x >> np.uint64(1)) & _M1)
+    y = y - ((y >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2) + (y & _M2) + ((y >> np.uint64(2)) & _M2)
+    x = (x & _M4) + ((x >> np.uint64(4)) & _M4)
+    return ((x * _H01) >> np.uint64(56)).astype(np.float32)
+
+
+class _Attributes:
+    """
+    Per-product inputs to the similarity score, hashed so they compare across catalog versions
+
+    Also holds the price-sorted orders that define every product's candidate windows.
+    """
+
+    def __init__(self, table):
+        count = len(table)
+        self.count = count
+        self.category = _string_hashes(table.category_vocab)[np.asarray(table.category_codes)]
+        # Subcategory names are only unique within a category
+        self.subcategory = _mix(self.category ^ _mix(
+            _string_hashes(table.subcategory_vocab)[np.asarray(table.subcategory_codes)]))
+        self.brand = _string_hashes(table.brand_vocab)[np.asarray(table.brand_codes)]
+        self.prices = np.ascontiguousarray(table.prices, dtype=np.float64)
+        self.log_prices = np.log(np.maximum(self.prices, 0.01)).astype(np.float32)
+        # Dense int32 group numbers for scoring (cheaper to gather and compare than hashes)
+        self.category_ids = np.unique(self.category, return_inverse=True)[1].astype(np.int32).ravel()
+        self.subcategory_ids = np.unique(self.subcategory, return_inverse=True)[1].astype(np.int32).ravel()
+        self.brand_ids = np.asarray(table.brand_codes, dtype=np.int32)
+
+        tags = table.tags
+        self.tag_signatures = np.zeros((count, _TAG_BITS // 64), dtype=np.uint64)
+        if len(tags.codes):
+            bits = _string_hashes(tags.vocab) % np.uint64(_TAG_BITS)
+            entry_bits = bits[np.asarray(tags.codes)]
+            owners = np.repeat(np.arange(count), np.diff(tags.offsets))
+            np.bitwise_or.at(self.tag_signatures, (owners, (entry_bits >> np.uint64(6)).astype(np.int64)),
+                             np.uint64(1) << (entry_bits & np.uint64(63)))
+        self.tag_counts = _popcount(self.tag_signatures).sum(axis=1).astype(np.float32)
+
+        row_hashes = np.empty(count, dtype=np.uint64)
+        row_hashes[np.asarray(table.id_order)] = table.id_hashes
+        self.id_hashes = row_hashes
+        self.fingerprints = _mix(self.subcategory ^ _mix(self.brand ^ _mix(
+            self.prices.view(np.uint64) ^ _mix(self.tag_signatures[:, 0] ^ _mix(self.tag_signatures[:, 1])))))
+
+        self.windows = [
+            _Window(self.subcategory, self.prices, SUBCATEGORY_WINDOW),
+            _Window(self.category, self.prices, CATEGORY_WINDOW),
+        ]
+
+
+class _Window:
+    """
+    Products sorted by (group, price); a product's candidates are the `width`
+    products around it in this order, within its group
+    """
+
+    def __init__(self, keys, prices, width):
+        self.keys = keys
+        self.width = width
+        self.order = np.lexsort((prices, keys))
+        self.sorted_keys = keys[self.order]
+        self.sorted_prices = prices[self.order]
+        self.rank = np.empty(len(keys), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(keys))
+
+    def _bounds(self, keys):
+        return (np.searchsorted(self.sorted_keys, keys, 'left'),
+                np.searchsorted(self.sorted_keys, keys, 'right'))
+
+    def _start(self, ranks, lo, hi):
+        # Centre the window on the row, shifted to stay inside the group
+        return np.maximum(np.minimum(ranks - self.width // 2, hi - self.width - 1), lo)
+
+    def candidates(self, rows):
+        """
+        Positions in each row's window (-1 for empty slots), shape (len(rows), width + 1)
+        """
+        lo, hi = self._bounds(self.keys[rows])
+        slots = self._start(self.rank[rows], lo, hi)[:, None] + np.arange(self.width + 1)
+        return np.where(slots < hi[:, None], self.order[np.minimum(slots, len(self.order) - 1)], -1)
+
+    def covering(self, rows):
+        """
+        Positions whose window contains any of the given rows
+        """
+        lo, hi = self._bounds(self.keys[rows])
+        ranks = self.rank[rows]
+        return self._covering(ranks, ranks, lo, hi)
+
+    def covering_gap(self, keys, prices):
+        """
+        Positions whose window reaches where products with these group keys and
+        prices would sort (used for products that left the group)
+        """
+        lo, hi = self._bounds(keys)
+        # Rank in (group, price) order, via an exact integer key: group number * (prices + 1) + price rank
+        groups = np.unique(self.sorted_keys)
+        price_values = np.unique(self.sorted_prices)
+        stride = len(price_values) + 1
+        sorted_composite = (np.searchsorted(groups, self.sorted_keys) * stride
+                            + np.searchsorted(price_values, self.sorted_prices))
+        composite = np.searchsorted(groups, keys) * stride + np.searchsorted(price_values, prices)
+        # The gap lies between the products sorting just before and just after it
+        first = np.searchsorted(sorted_composite, composite, 'left') - 1
+        last = np.searchsorted(sorted_composite, composite, 'right')
+        return self._covering(first, last, lo, hi)
+
+    def _covering(self, first, last, lo, hi):
+        """
+        Positions whose window intersects the rank range [first, last] of their group
+        """
+        band_start = np.maximum(first - self.width, lo)
+        lengths = np.maximum(np.minimum(last + self.width + 1, hi) - band_start, 0)
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+        owner = np.repeat(np.arange(len(lengths)), lengths)
+        slots = band_start[owner] + np.arange(total) - np.r_[0, np.cumsum(lengths)[:-1]][owner]
+        start = self._start(slots, lo[owner], hi[owner])
+        reaches = (start <= last[owner]) & (start + self.width >= first[owner])
+        return self.order[slots[reaches]]
+
+
+def _score_rows(attributes, rows, k):
+    """
+    Top-k neighbours of the given rows
+
+    Returns:
+    - tuple: (int32 neighbours, float16 scores), each of shape (len(rows), k); empty slots are -1 / 0
+    """
+    candidates = np.concatenate([window.candidates(rows) for window in attributes.windows], axis=1)
+    candidates[candidates == rows[:, None]] = -1
+    candidates.sort(axis=1)
+    duplicate = np.zeros(candidates.shape, dtype=bool)
+    duplicate[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+    candidates[duplicate] = -1
+    valid = candidates >= 0
+    other = np.where(valid, candidates, 0)
+    row = rows[:, None]
+
+    a = attributes
+    scores = (a.subcategory_ids[other] == a.subcategory_ids[row]).astype(np.float32) * WEIGHTS['subcategory']
+    scores += (a.category_ids[other] == a.category_ids[row]) * np.float32(WEIGHTS['category'])
+    scores += (a.brand_ids[other] == a.brand_ids[row]) * np.float32(WEIGHTS['brand'])
+    shared = _shared_bits(a.tag_signatures[row], a.tag_signatures[other])
+    union = a.tag_counts[other] + a.tag_counts[row] - shared
+    scores += np.float32(WEIGHTS['tags']) * shared / np.maximum(union, 1)
+    distance = np.abs(a.log_prices[other] - a.log_prices[row])
+    scores += np.float32(WEIGHTS['price']) * np.exp(distance * np.float32(-1 / PRICE_SCALE))
+    scores[~valid] = -np.inf
+
+    width = min(k, scores.shape[1])
+    top = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    top_positions = np.take_along_axis(candidates, top, axis=1)
+    # Best first; equal scores by catalog position
+    order = np.lexsort((top_positions, -top_scores), axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    top_positions = np.take_along_axis(top_positions, order, axis=1)
+
+    neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float16)
+    found = np.isfinite(top_scores)
+    neighbors[:, :width] = np.where(found, top_positions, -1)
+    scores[:, :width] = np.where(found, top_scores, 0)
+    return neighbors, scores
+
+
+class SimilarityTable:
+    """
+    Precomputed item-to-item neighbours: the top-k most similar products of every product
+
+    Similarity combines subcategory, category and brand matches, tag overlap
+    (Jaccard) and price proximity. Each product is only compared with the
+    products closest to it in price within its subcategory and its category,
+    so a build is linear in catalog size. The table is two dense arrays (k
+    int32 positions and k float16 scores per product), saved as .npy files
+    and memory-mapped, so a recommendation merges the lists of the browsed
+    products instead of searching the catalog.
+
+    Per-product attribute fingerprints are stored alongside, so a catalog
+    update only recomputes the products that changed and the products whose
+    neighbour lists or candidate windows they appear in (about a hundred per
+    changed product). Inventory is not an input, so stock updates cost nothing.
+    """
+
+    _ARRAYS = ('neighbors', 'scores', 'id_hashes', 'fingerprints', 'category_keys', 'subcategory_keys',
+               'prices')
+
+    def __init__(self, neighbors, scores, id_hashes, fingerprints, category_keys, subcategory_keys, prices,
+                 source_fingerprint=None):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.id_hashes = id_hashes
+        self.fingerprints = fingerprints
+        self.category_keys = category_keys
+        self.subcategory_keys = subcategory_keys
+        self.prices = prices
+        self.source_fingerprint = source_fingerprint
+        self.recomputed = len(neighbors)
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._ARRAYS)
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, table, k=20, previous=None):
+        """
+        Compute the table for a ProductTable, reusing a previous table where possible
+
+        Parameters:
+        - table (ProductTable): Catalog to compute neighbours for
+        - k (int): Neighbours kept per product
+        - previous (SimilarityTable): Table of an earlier catalog version;
+          returned as is if it was built from the same catalog file, otherwise
+          only the rows affected by changed, added or removed products are
+          recomputed
+
+        Returns:
+        - SimilarityTable: `recomputed` holds the number of rows that were scored
+        """
+        if previous is not None and previous.k == k and len(previous) == len(table) and \
+                table.fingerprint is not None and previous.source_fingerprint == table.fingerprint:
+            previous.recomputed = 0
+            return previous
+
+        attributes = _Attributes(table)
+        if previous is not None and previous.k == k and len(previous):
+            updated = cls._update(previous, attributes, k, table.fingerprint)
+            if updated is not None:
+                return updated
+        return cls._compute(attributes, np.arange(len(table)), k, table.fingerprint)
+
+    @classmethod
+    def _compute(cls, attributes, rows, k, source_fingerprint, neighbors=None, scores=None):
+        """
+        Score `rows` into the given arrays (new ones if None) and wrap them in a table
+        """
+        if neighbors is None:
+            neighbors = np.full((attributes.count, k), -1, dtype=np.int32)
+            scores = np.zeros((attributes.count, k), dtype=np.float16)
+        for start in range(0, len(rows), ROWS_PER_CHUNK):
+            chunk = rows[start:start + ROWS_PER_CHUNK]
+            neighbors[chunk], scores[chunk] = _score_rows(attributes, chunk, k)
+        result = cls(neighbors, scores, attributes.id_hashes, attributes.fingerprints, attributes.category,
+                     attributes.subcategory, attributes.prices, source_fingerprint)
+        result.recomputed = len(rows)
+        return result
+
+    @classmethod
+    def _update(cls, previous, attributes, k, source_fingerprint):
+        """
+        Carry unaffected rows over from `previous` and recompute the rest
+
+        Returns None when so much changed that a full build is cheaper.
+        """
+        count = attributes.count
+        old_hashes = np.asarray(previous.id_hashes)
+        old_order = np.argsort(old_hashes)
+        slots = np.minimum(np.searchsorted(old_hashes[old_order], attributes.id_hashes), len(old_order) - 1)
+        old_rows = old_order[slots]
+        found = old_hashes[old_rows] == attributes.id_hashes
+        unchanged = found & (np.asarray(previous.fingerprints)[old_rows] == attributes.fingerprints)
+
+        # Old rows that are gone or whose attributes changed
+        new_rows = np.full(len(old_hashes), -1, dtype=np.int64)
+        new_rows[old_rows[found]] = np.flatnonzero(found)
+        stale = np.ones(len(old_hashes), dtype=bool)
+        stale[old_rows[unchanged]] = False
+        changed = np.flatnonzero(~unchanged)
+        if len(changed) + int((new_rows < 0).sum()) > REBUILD_FRACTION * count:
+            return None
+
+        # Unchanged rows keep their lists, renumbered to new positions
+        neighbors = np.full((count, k), -1, dtype=np.int32)
+        scores = np.zeros((count, k), dtype=np.float16)
+        kept = np.flatnonzero(unchanged)
+        old_neighbors = np.asarray(previous.neighbors[old_rows[kept]])
+        present = old_neighbors >= 0
+        neighbors[kept] = np.where(present, new_rows[np.maximum(old_neighbors, 0)], -1)
+        scores[kept] = previous.scores[old_rows[kept]]
+
+        # Recompute changed rows, rows that listed a stale product, and rows
+        # whose candidate windows a changed product enters or leaves
+        dirty = ~unchanged
+        dirty[kept] |= (present & stale[np.maximum(old_neighbors, 0)]).any(axis=1)
+        stale_rows = np.flatnonzero(stale)
+        old_keys = (np.asarray(previous.subcategory_keys)[stale_rows], np.asarray(previous.category_keys)[stale_rows])
+        old_prices = np.asarray(previous.prices)[stale_rows]
+        for window, old in zip(attributes.windows, old_keys):
+            dirty[window.covering_gap(old, old_prices)] = True
+            dirty[window.covering(changed)] = True
+
+        rows = np.flatnonzero(dirty)
+        if len(rows) > REBUILD_FRACTION * count:
+            return None
+        return cls._compute(attributes, rows, k, source_fingerprint, neighbors, scores)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def related(self, positions, k=20, mask=None):
+        """
+        Products related to a set of products, merged from their neighbour lists
+
+        Neighbour scores are summed across the browsed products, with later
+        products in `positions` (the most recently browsed) weighted higher.
+
+        Parameters:
+        - positions (list): Catalog positions of browsed products, oldest first
+        - k (int): Number of products to return
+        - mask (numpy.ndarray): Optional boolean mask of allowed positions
+
+        Returns:
+        - numpy.ndarray: Up to k positions, most related first; never one of `positions`
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        positions = positions[(positions >= 0) & (positions < len(self))]
+        if not len(positions) or k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        recency = np.arange(1, len(positions) + 1, dtype=np.float32) / len(positions)
+        neighbors = np.asarray(self.neighbors[positions]).ravel()
+        weights = (np.asarray(self.scores[positions], dtype=np.float32) * recency[:, None]).ravel()
+        keep = neighbors >= 0
+        keep[keep] = ~np.isin(neighbors[keep], positions)
+        if mask is not None:
+            keep[keep] = mask[neighbors[keep]]
+        related, inverse = np.unique(neighbors[keep], return_inverse=True)
+        totals = np.bincount(inverse, weights=weights[keep])
+        return related[np.lexsort((related, -totals))[:k]].astype(np.int64)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        """
+        Write the table to a directory, replacing any existing one atomically
+        """
+        staging = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in self._ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+        meta = {
+            'format': TABLE_FORMAT,
+            'count': len(self),
+            'k': self.k,
+            'source_fingerprint': self.source_fingerprint,
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+        previous = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a saved table with every array memory-mapped read-only
+
+        Raises:
+        - ValueError: The directory is not a complete table of a supported format
+        """
+        try:
+            with open(os.path.join(path, 'meta.json')) as file:
+                meta = json.load(file)
+            if meta.get('format') != TABLE_FORMAT:
+                raise ValueError(f"table format {meta.get('format')} is not supported (expected {TABLE_FORMAT})")
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in cls._ARRAYS}
+        except (OSError, KeyError) as e:
+            raise ValueError(f"not a similarity table: {str(e)}")
+        if {len(array) for array in arrays.values()} != {meta['count']}:
+            raise ValueError(f"similarity table arrays do not match its product count {meta['count']}")
+        table = cls(source_fingerprint=meta.get('source_fingerprint'), **arrays)
+        table.recomputed = 0
+        return table
@@ -0,0 +1,50 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await the same task and receive the same result
+    (or exception). The task is shielded, so a disconnecting caller does not
+    cancel the work for everyone else.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Run `fn()` for `key` unless an identical call is already in flight
+
+        Parameters:
+        - key (str): Identity of the call
+        - fn (callable): Zero-argument coroutine function doing the work
+
+        Returns:
+        - The result of the shared call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _, key=key: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """
+        Counters for monitoring
+        """
+        total = self.leaders + self.coalesced
+        return {
+            'in_flight': len(self._calls),
+            'executed': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesced_ratio': self.coalesced / total if total else 0.0,
+        }
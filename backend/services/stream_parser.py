@@ -0,0 +1,82 @@
+import json
+
+
+class IncrementalJSONArrayParser:
+    """
+    Incrementally extract the objects of a top-level JSON array from streamed text
+
+    Text before the opening `[` (e.g. "Here are my recommendations:") is
+    skipped. Each element object is decoded as soon as its closing brace
+    arrives, so callers can act on it before the rest of the array has been
+    generated. Everything after the closing `]` is ignored.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+        self.errors = 0
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text
+
+        Returns:
+        - list: Objects completed within this chunk (malformed ones are skipped
+          and counted in `errors`)
+        """
+        completed = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                if char == '[':
+                    self._started = True
+                continue
+
+            if self._depth == 0:
+                # Between elements: only an object start or the array end matters
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == ']':
+                    self._finished = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads(''.join(self._buffer)))
+                    except ValueError:
+                        self.errors += 1
+                    self._buffer = []
+        return completed
+
+    def close(self):
+        """
+        End of the stream: an object cut off before its closing brace is not recoverable
+
+        Returns:
+        - list: Always empty (kept for parity with IncrementalLineParser)
+        """
+        return []
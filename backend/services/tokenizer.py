@@ -0,0 +1,137 @@
+import base64
+import json
+import math
+import os
+import re
+
+from config import config
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Pre-tokenization pattern modelled on the GPT BPE splitter
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+# Encoding used for models tiktoken does not know
+DEFAULT_ENCODING = 'cl100k_base'
+
+TOKENIZER_KINDS = ('tiktoken', 'approximate')
+
+
+class TokenizerUnavailable(RuntimeError):
+    """
+    Raised when the tiktoken encoding for the model cannot be loaded from local files
+    """
+
+
+def encoding_name(model_name):
+    """
+    tiktoken encoding of a model, DEFAULT_ENCODING for unknown models
+    """
+    try:
+        return tiktoken.encoding_name_for_model(model_name)
+    except KeyError:
+        return DEFAULT_ENCODING
+
+
+def encoding_files(path, name):
+    """
+    (BPE ranks file, parameters file) of an encoding saved by scripts/fetch_tokenizer.py
+    """
+    return os.path.join(path, f"{name}.tiktoken"), os.path.join(path, f"{name}.json")
+
+
+def save_encoding(encoding, path):
+    """
+    Write a tiktoken encoding to `path` so it can be loaded without network access
+    """
+    os.makedirs(path, exist_ok=True)
+    ranks_path, params_path = encoding_files(path, encoding.name)
+    with open(ranks_path, 'wb') as file:
+        for token, rank in sorted(encoding._mergeable_ranks.items(), key=lambda item: item[1]):
+            file.write(base64.b64encode(token) + b' ' + str(rank).encode() + b'\n')
+    with open(params_path, 'w') as file:
+        json.dump({'pat_str': encoding._pat_str, 'special_tokens': encoding._special_tokens}, file)
+
+
+def load_encoding(path, name):
+    """
+    Build a tiktoken encoding from the files save_encoding wrote
+
+    Raises:
+    - TokenizerUnavailable: tiktoken is not installed or the files are missing or invalid
+    """
+    if tiktoken is None:
+        raise TokenizerUnavailable("tiktoken is not installed (pip install -r requirements.txt)")
+    ranks_path, params_path = encoding_files(path, name)
+    try:
+        with open(params_path) as file:
+            params = json.load(file)
+        with open(ranks_path, 'rb') as file:
+            ranks = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in file if line.strip())}
+        return tiktoken.Encoding(name, pat_str=params['pat_str'], mergeable_ranks=ranks,
+                                 special_tokens=params['special_tokens'])
+    except (OSError, ValueError, KeyError) as e:
+        raise TokenizerUnavailable(
+            f"cannot load the {name} encoding from {path}: {str(e)}. "
+            f"Run `python -m scripts.fetch_tokenizer`, or set TOKENIZER=approximate"
+        )
+
+
+class Tokenizer:
+    """
+    Token counter for prompt budgeting
+
+    With kind 'tiktoken' (the default), counts with the model's tiktoken
+    encoding, read from files under `path` that scripts/fetch_tokenizer.py
+    downloads ahead of time; nothing is fetched at runtime, and missing files
+    are an error. Kind 'approximate' must be asked for explicitly: it splits
+    text the way GPT tokenizers do and charges long words one token per six
+    characters.
+    """
+
+    def __init__(self, model_name, kind='tiktoken', path='data/tiktoken'):
+        """
+        Parameters:
+        - model_name (str): Model whose encoding is used
+        - kind (str): 'tiktoken' or 'approximate'
+        - path (str): Directory holding the saved encoding
+
+        Raises:
+        - TokenizerUnavailable: kind is 'tiktoken' and the encoding cannot be loaded
+        - ValueError: Unknown kind
+        """
+        if kind not in TOKENIZER_KINDS:
+            raise ValueError(f"tokenizer must be one of {', '.join(TOKENIZER_KINDS)}")
+        self.model_name = model_name
+        self._encoding = None
+        if kind == 'tiktoken':
+            self._encoding = load_encoding(path, encoding_name(model_name))
+        self.name = self._encoding.name if self._encoding is not None else 'approximate'
+
+    @classmethod
+    def from_config(cls):
+        """
+        Tokenizer for the configured model (MODEL_NAME, TOKENIZER, TOKENIZER_PATH)
+        """
+        return cls(config['MODEL_NAME'], config['TOKENIZER'], config['TOKENIZER_PATH'])
+
+    def count(self, text):
+        """
+        Number of tokens in `text`
+        """
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        tokens = 0
+        for piece in _PIECE_RE.findall(text):
+            length = len(piece.strip())
+            tokens += 1 if length <= 6 else math.ceil(length / 6)
+        return tokens
+
+    def count_messages(self, messages):
+        """
+        Tokens for a chat request: content plus the per-message framing overhead
+        """
+        return sum(self.count(m['content']) + 4 for m in messages) + 3
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from config import config
+from services.catalog_loader import load_catalog
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+SAMPLE_CATALOG = os.path.join(DATA_DIR, 'products.json')
+
+# Token counts in tests do not depend on a downloaded tiktoken encoding
+config['TOKENIZER'] = 'approximate'
+
+
+@pytest.fixture(scope='session')
+def sample_products():
+    with open(SAMPLE_CATALOG) as file:
+        return json.load(file)
+
+
+@pytest.fixture(scope='session')
+def sample_table():
+    return load_catalog(SAMPLE_CATALOG)
+
+
+@pytest.fixture
+def product_service(tmp_path):
+    """
+    ProductService over the sample catalog, writing its derived indexes under tmp_path
+    """
+    from services.product_service import ProductService
+
+    overrides = {
+        'DATA_PATH': SAMPLE_CATALOG,
+        'EMBEDDING_INDEX_PATH': str(tmp_path / 'embeddings'),
+        'SIMILARITY_TABLE_PATH': str(tmp_path / 'similarity'),
+        'RECOMMENDATION_CACHE_BACKEND': '',
+    }
+    saved = {key: config[key] for key in overrides}
+    config.update(overrides)
+    try:
+        yield ProductService()
+    finally:
+        config.update(saved)
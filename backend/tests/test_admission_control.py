@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from services.admission_control import AdmissionController, AdmissionRejected
+from services.llm_service import LLMService
+
+PREFERENCES = {'priceRange': 'all', 'categories': ['Electronics'], 'brands': []}
+
+
+def test_queue_full_is_shed():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=1)
+        ticket = await admission.acquire()
+        queued = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        assert rejected.value.reason == 'queue_full'
+        admission.release(ticket)
+        admission.release(await queued)
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['admitted'] == 2
+    assert stats['shed']['queue_full'] == 1
+    assert stats['in_progress'] == 0
+
+
+def test_projected_wait_past_the_deadline_is_shed():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=10)
+        admission.service_time = 1.0
+        ticket = await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire(deadline=time.monotonic() + 0.5)
+        admission.release(ticket)
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == 'deadline'
+
+
+def test_waiters_are_admitted_in_order():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=10)
+        order = []
+
+        async def request(name):
+            async with admission.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request(i) for i in range(5)))
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+
+def coalescing_service(product_service, admission, calls, delay=0.1):
+    service = LLMService(product_service, llm_client=object(), admission=admission,
+                         coalesce=True, latency_budget_ms=0)
+
+    async def generate(user_preferences, browsing_history, catalog):
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {'recommendations': [{'product': {'id': 'prod001'}}], 'count': 1}
+
+    service._generate = generate
+    return service
+
+
+def test_coalesced_requests_share_one_admission_slot(product_service):
+    calls = []
+    admission = AdmissionController(max_concurrency=4, max_queue=8)
+    service = coalescing_service(product_service, admission, calls)
+
+    async def burst():
+        return await asyncio.gather(*(
+            service.generate_recommendations(PREFERENCES, ['prod002']) for _ in range(50)
+        ), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert not any(isinstance(result, Exception) for result in results)
+    assert len(calls) == 1
+    assert admission.stats()['admitted'] == 1
+    assert sum(admission.stats()['shed'].values()) == 0
+    assert service.single_flight.coalesced == 49
+
+
+def test_followers_are_shed_with_their_leader(product_service):
+    calls = []
+    admission = AdmissionController(max_concurrency=1, max_queue=0)
+    service = coalescing_service(product_service, admission, calls)
+
+    async def scenario():
+        # Another request holds the only slot, so the next LLM call is rejected
+        ticket = await admission.acquire()
+        try:
+            return await asyncio.gather(*(
+                service.generate_recommendations(PREFERENCES, ['prod002']) for _ in range(3)
+            ), return_exceptions=True)
+        finally:
+            admission.release(ticket)
+
+    results = asyncio.run(scenario())
+    assert calls == []
+    assert all(isinstance(result, AdmissionRejected) for result in results)
+    assert admission.stats()['shed']['queue_full'] == 1
@@ -0,0 +1,35 @@
+from services.candidate_filter import PRICE_BUCKETS, CandidateFilter, parse_price_range
+from services.session_store import price_band
+
+PRICES = [0.0, 49.99, 50.0, 199.99, 200.0, 1000.0]
+
+
+def candidate_filter():
+    return CandidateFilter.from_products([
+        {'id': f"p{i}", 'category': 'Books', 'brand': 'A', 'price': price, 'rating': 4.0, 'inventory': 1}
+        for i, price in enumerate(PRICES)
+    ])
+
+
+def prices_in(price_range):
+    mask = candidate_filter().candidate_mask({'priceRange': price_range, 'categories': [], 'brands': []})
+    return [price for price, kept in zip(PRICES, mask.tolist()) if kept]
+
+
+def test_named_buckets_exclude_their_upper_bound():
+    assert prices_in('low') == [0.0, 49.99]
+    assert prices_in('medium') == [50.0, 199.99]
+    assert prices_in('high') == [200.0, 1000.0]
+
+
+def test_named_buckets_agree_with_session_price_bands():
+    for name in PRICE_BUCKETS:
+        assert all(price_band(price) == name for price in prices_in(name))
+
+
+def test_explicit_ranges_include_both_bounds():
+    assert parse_price_range('50-200') == (50.0, 200.0)
+    assert prices_in('50-200') == [50.0, 199.99, 200.0]
+    assert prices_in('$200+') == [200.0, 1000.0]
+    assert parse_price_range('all') == (None, None)
+    assert parse_price_range('cheap') == (None, None)
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from benchmarks.synthetic_catalog import generate_products
+from services.catalog_loader import CatalogValidationError, load_catalog
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_json_array_and_jsonl_load_the_same_table(tmp_path):
+    products = generate_products(50)
+    from_json = load_catalog(write(tmp_path, 'products.json', json.dumps(products, indent=1)))
+    from_jsonl = load_catalog(write(tmp_path, 'products.jsonl', '\n'.join(json.dumps(p) for p in products)))
+    assert list(from_json) == list(from_jsonl)
+    assert from_json[49]['id'] == products[49]['id']
+
+
+def test_invalid_products_are_all_reported(tmp_path):
+    products = generate_products(3)
+    del products[0]['name']
+    products[2]['id'] = products[1]['id']
+    with pytest.raises(CatalogValidationError) as error:
+        load_catalog(write(tmp_path, 'products.json', json.dumps(products)))
+    assert "missing 'name'" in str(error.value)
+    assert "duplicate" in str(error.value)
+
+
+@pytest.mark.parametrize('text, message', [
+    ('{"id": "p1"}', 'must be a JSON array'),
+    ('[{"id": "p1"} {"id": "p2"}]', "cannot read"),
+    ('[] []', "cannot read"),
+])
+def test_malformed_json_is_rejected(tmp_path, text, message):
+    with pytest.raises(CatalogValidationError, match=message):
+        load_catalog(write(tmp_path, 'products.json', text))
@@ -0,0 +1,71 @@
+from services.compact_response import CompactResponseFormat, IncrementalLineParser
+
+
+def test_parse_line():
+    assert CompactResponseFormat.parse_line('p3 9 C,H') == ('p3', 9, 'CH')
+    assert CompactResponseFormat.parse_line('c12 7') == ('c12', 7, '')
+    # Unknown reason codes are dropped, the line is kept
+    assert CompactResponseFormat.parse_line('p1 5 C,Z,B') == ('p1', 5, 'CB')
+
+
+def test_parse_line_rejects_bad_ids_and_scores():
+    for line in ('p3', 'p3 high C', 'p3 0 C', 'p3 11', 'Here are my picks:'):
+        assert CompactResponseFormat.parse_line(line) is None
+
+
+def test_parse_whole_reply():
+    items, rejected = CompactResponseFormat(recommendation_count=2).parse('Sure!\np1 9 C\n\np2 8 B\np3 7 P\n')
+    assert items == [('p1', 9, 'C'), ('p2', 8, 'B')]
+    assert rejected == 1
+
+
+def test_incremental_lines_across_chunks():
+    parser = IncrementalLineParser(limit=3)
+    assert parser.feed('p1 9') == []
+    assert parser.feed(' C\np2 ') == [('p1', 9, 'C')]
+    assert parser.feed('8 B\n') == [('p2', 8, 'B')]
+    assert not parser.finished
+    # A last line without its newline is only parsed on close
+    assert parser.feed('p3 7 H') == []
+    assert parser.close() == [('p3', 7, 'H')]
+    assert parser.finished
+
+
+def test_incremental_parser_stops_at_limit():
+    parser = IncrementalLineParser(limit=1)
+    assert parser.feed('p1 9 C\np2 8 B\n') == [('p1', 9, 'C')]
+    assert parser.finished
+    assert parser.feed('p3 7\n') == []
+
+
+def test_explain_uses_catalog_data():
+    product = {'category': 'Electronics', 'brand': 'Acme', 'price': 19.5, 'rating': 4.7}
+    assert CompactResponseFormat.explain('CP', product) == (
+        "Recommended because it matches your interest in Electronics and it is within your price range at $19.50."
+    )
+    assert CompactResponseFormat.explain('', product) == CompactResponseFormat.DEFAULT_EXPLANATION
+
+
+def test_refused_lines_do_not_count_toward_the_limit():
+    seen = set()
+
+    def accept(item):
+        if item[0] not in {'p1', 'p2'} or item[0] in seen:
+            return False
+        seen.add(item[0])
+        return True
+
+    parser = IncrementalLineParser(limit=2, accept=accept)
+    assert parser.feed('p9 9 C\np1 8 C\np1 7 C\n') == [('p1', 8, 'C')]
+    assert not parser.finished
+    assert parser.feed('p2 6 B\n') == [('p2', 6, 'B')]
+    assert parser.finished
+    assert parser.errors == 2
+
+
+def test_highly_rated_only_for_high_ratings():
+    assert CompactResponseFormat.explain('R', {'rating': 4.8}) == "Recommended because it is highly rated (4.8/5)."
+    assert CompactResponseFormat.explain('R', {'rating': 2.1}) == CompactResponseFormat.DEFAULT_EXPLANATION
+    assert CompactResponseFormat.explain('RC', {'rating': 2.1, 'category': 'Books'}) == (
+        "Recommended because it matches your interest in Books."
+    )
@@ -0,0 +1,34 @@
+from services.catalog_index import CatalogIndex
+from services.fallback_ranker import FallbackRanker
+
+
+def product(product_id, category, rating, brand='Acme'):
+    return {
+        'id': product_id, 'name': f"Product {product_id}", 'category': category, 'subcategory': category,
+        'price': 20.0, 'brand': brand, 'description': '', 'features': [], 'rating': rating,
+        'inventory': 3, 'tags': [],
+    }
+
+
+def explanations(products, preferences):
+    result = FallbackRanker().rank(preferences, [], CatalogIndex(products), k=len(products))
+    return {r['product']['id']: r['explanation'] for r in result['recommendations']}
+
+
+def test_only_high_ratings_are_called_highly_rated():
+    explained = explanations(
+        [product('p1', 'Books', 4.8), product('p2', 'Books', 3.1)],
+        {'priceRange': 'all', 'categories': [], 'brands': []},
+    )
+    assert explained['p1'] == "Recommended because it is highly rated (4.8/5)."
+    assert 'highly rated' not in explained['p2']
+    assert explained['p2'] == "Recommended because it is one of the best-ranked Books products in stock."
+
+
+def test_matched_preferences_without_a_high_rating():
+    explained = explanations(
+        [product('p1', 'Books', 2.5)],
+        {'priceRange': 'all', 'categories': ['Books'], 'brands': ['Acme']},
+    )
+    assert explained['p1'] == ("Recommended because it matches your interest in Books "
+                               "and it is from Acme, a brand you like.")
@@ -0,0 +1,97 @@
+import asyncio
+
+import openai
+import pytest
+
+from services.llm_router import AdaptiveConcurrencyLimit, LLMBackend, LLMRouter
+from services.rate_limiter import TokenBucket
+from services.tokenizer import Tokenizer
+
+MESSAGES = [{'role': 'user', 'content': 'Recommend five products from the catalog below.'}]
+
+
+class FakeTransport:
+    """
+    Answers every call, or raises the queued errors first
+    """
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def create(self, payload):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'choices': [{'message': {'content': 'ok'}}], 'model': payload['model']}
+
+    async def close(self):
+        pass
+
+
+def rate_limited():
+    return openai.error.RateLimitError('slow down', headers={'Retry-After': '0.01'})
+
+
+def test_aimd_grows_per_round_and_halves_once_per_round():
+    async def scenario():
+        limit = AdaptiveConcurrencyLimit(initial=4, maximum=8)
+        epochs = [await limit.acquire() for _ in range(4)]
+        for epoch in epochs:
+            limit.release(epoch, latency=0.01)
+        grown = limit.limit
+        # A burst of 429s from the same round halves the limit once
+        epochs = [await limit.acquire() for _ in range(4)]
+        for epoch in epochs:
+            limit.release(epoch, overloaded=True)
+        return grown, limit.limit, limit.decreases
+
+    grown, shrunk, decreases = asyncio.run(scenario())
+    assert 4.8 < grown < 5.0
+    assert shrunk == pytest.approx(grown / 2)
+    assert decreases == 1
+
+
+def test_slow_calls_count_as_overload():
+    async def scenario():
+        limit = AdaptiveConcurrencyLimit(initial=4, latency_target=0.1)
+        limit.release(await limit.acquire(), latency=0.5)
+        return limit.limit
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_token_bucket_waits_for_refill_and_clamps_to_capacity():
+    bucket = TokenBucket(rate_per_minute=600)
+    assert bucket.wait_time(600) == 0.0
+    bucket.take(600)
+    assert bucket.wait_time(60) == pytest.approx(6.0, rel=0.01)
+    # More than the capacity waits for a full bucket, not forever
+    assert bucket.wait_time(10000) == pytest.approx(60.0, rel=0.01)
+
+
+def test_rate_limited_call_fails_over_to_the_next_backend():
+    primary = FakeTransport(errors=[rate_limited()])
+    secondary = FakeTransport()
+    router = LLMRouter([LLMBackend('a', primary), LLMBackend('b', secondary, model='m2')],
+                       tokenizer=Tokenizer('gpt-3.5-turbo', 'approximate'))
+    response = asyncio.run(router.chat_completion('m1', MESSAGES, 100, 0))
+    assert response['model'] == 'm2'
+    assert (primary.calls, secondary.calls) == (1, 1)
+    assert router.stats()['failovers'] == 1
+
+
+def test_per_call_retries_override():
+    transport = FakeTransport(errors=[rate_limited(), rate_limited()])
+    router = LLMRouter([LLMBackend('a', transport)], max_retries=3, backoff=0.001,
+                       tokenizer=Tokenizer('gpt-3.5-turbo', 'approximate'))
+    with pytest.raises(openai.error.RateLimitError):
+        asyncio.run(router.chat_completion('m', MESSAGES, 100, 0, max_retries=0))
+    assert transport.calls == 1
+    assert router.stats()['retries'] == 0
+
+
+def test_token_reservation_counts_the_prompt_with_the_tokenizer():
+    tokenizer = Tokenizer('gpt-3.5-turbo', 'approximate')
+    router = LLMRouter([LLMBackend('a', FakeTransport())], tokenizer=tokenizer)
+    assert router._estimate_tokens(MESSAGES, 100) == tokenizer.count_messages(MESSAGES) + 100
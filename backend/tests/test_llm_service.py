@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from services.llm_service import LLMService
+
+PREFERENCES = {'priceRange': 'all', 'categories': ['Electronics'], 'brands': []}
+
+
+class SlowStream:
+    def __init__(self, delay, chunks):
+        self.delay = delay
+        self.chunks = chunks
+
+    async def stream_chat_completion(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        for chunk in self.chunks:
+            yield chunk
+
+
+def stream(service, deadline=None):
+    async def collect():
+        return [event async for event in service.stream_recommendations(PREFERENCES, [], deadline=deadline)]
+    return asyncio.run(collect())
+
+
+def test_stream_falls_back_when_the_first_delta_misses_the_budget(product_service):
+    service = LLMService(product_service, llm_client=SlowStream(5.0, ['[']), latency_budget_ms=100)
+    start = time.perf_counter()
+    events = stream(service)
+    assert time.perf_counter() - start < 2.0
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['source'] == 'fallback'
+    assert all(name == 'recommendation' for name, _ in events[:-1])
+
+
+def test_stream_budget_is_shortened_to_the_deadline(product_service):
+    service = LLMService(product_service, llm_client=SlowStream(5.0, ['[']), latency_budget_ms=0)
+    start = time.perf_counter()
+    events = stream(service, deadline=time.monotonic() + 0.3)
+    assert time.perf_counter() - start < 2.0
+    assert events[-1][1]['source'] == 'fallback'
+
+
+def test_stream_within_budget_is_served_from_the_llm(product_service):
+    service = LLMService(product_service, llm_client=None, latency_budget_ms=1000)
+    prompt = service.build_prompt(PREFERENCES, [], product_service.catalog)
+    short_id, product_id = next(iter(prompt.id_map.items()))
+    reply = f'[{{"product_id": "{short_id}", "explanation": "Fits.", "score": 9}}]'
+    if prompt.response_format == 'compact':
+        reply = f"{short_id} 9 C\n"
+    service.llm_client = SlowStream(0.01, [reply[:5], reply[5:]])
+    events = stream(service)
+    assert [payload['product']['id'] for name, payload in events if name == 'recommendation'] == [product_id]
+    assert 'source' not in events[-1][1]
+
+
+def test_compact_stream_skips_unknown_and_repeated_ids(product_service):
+    service = LLMService(product_service, llm_client=None, latency_budget_ms=1000)
+    service.prompt_builder.response_format = 'compact'
+    preferences = {'priceRange': 'all', 'categories': [], 'brands': []}
+    prompt = service.build_prompt(preferences, [], product_service.catalog)
+    assert prompt.response_format == 'compact'
+    count = service.prompt_builder.recommendation_count
+    short_ids = list(prompt.id_map)[:count]
+    lines = ['zz999 9 C', f"{short_ids[0]} 9 C", f"{short_ids[0]} 8 C"] + [f"{s} 7 P" for s in short_ids[1:]]
+    service.llm_client = SlowStream(0.01, ['\n'.join(lines) + '\n'])
+
+    async def collect():
+        return [event async for event in service.stream_recommendations(preferences, [])]
+    events = asyncio.run(collect())
+    recommended = [payload['product']['id'] for name, payload in events if name == 'recommendation']
+    assert recommended == [prompt.id_map[s] for s in short_ids]
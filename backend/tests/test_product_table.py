@@ -0,0 +1,38 @@
+from fastapi.responses import JSONResponse
+
+from benchmarks.synthetic_catalog import generate_products
+from services.product_table import ProductTable
+
+UNUSUAL = {
+    'id': 'prod-ü1', 'name': 'Café "Deluxe" \\ Grinder\n', 'category': 'Home & Kitchen', 'subcategory': 'Cöffee',
+    'price': 0.1, 'brand': 'Brühl', 'description': 'Tab\there, emoji \U0001f600, control \x01',
+    'features': ['Ünïcode', ''], 'rating': 4.0, 'inventory': 0, 'tags': [],
+}
+
+
+def test_to_json_matches_json_response(sample_products):
+    table = ProductTable.from_products(sample_products)
+    assert table.to_json() == JSONResponse(sample_products).body
+
+
+def test_to_json_escapes_like_json_response():
+    products = generate_products(200) + [UNUSUAL]
+    table = ProductTable.from_products(products)
+    assert table.to_json() == JSONResponse(products).body
+
+
+def test_to_json_of_selected_positions(sample_products):
+    table = ProductTable.from_products(sample_products)
+    positions = [5, 0, 17]
+    assert table.to_json(positions) == JSONResponse([sample_products[p] for p in positions]).body
+    assert table.to_json([]) == b'[]'
+
+
+def test_snapshot_round_trip(tmp_path, sample_products):
+    table = ProductTable.from_products(sample_products, fingerprint='abc')
+    table.save(str(tmp_path / 'catalog'))
+    opened = ProductTable.open(str(tmp_path / 'catalog'))
+    assert opened.fingerprint == 'abc'
+    assert opened.to_json() == table.to_json()
+    assert opened.position_of(sample_products[3]['id']) == 3
+    assert opened.position_of('missing') is None
@@ -0,0 +1,82 @@
+from services.catalog_index import CatalogIndex
+from services.prompt_builder import PromptBuilder, _CatalogSections
+from services.tokenizer import Tokenizer
+
+PREFERENCES = {'priceRange': 'all', 'categories': ['Electronics'], 'brands': []}
+
+
+def products(count, prefix='c'):
+    return [
+        {
+            'id': f"{prefix}{i}", 'name': f"Product number {i} with a fairly long descriptive name",
+            'category': 'Electronics', 'subcategory': 'Audio', 'brand': 'Acme', 'price': 10.0 + i,
+            'rating': 4.5, 'description': 'A product description that is long enough to be shortened. ' * 3,
+            'features': [], 'tags': [], 'inventory': 3,
+        }
+        for i in range(count)
+    ]
+
+
+def builder(max_prompt_tokens, **options):
+    return PromptBuilder(Tokenizer('gpt-3.5-turbo', 'approximate'), max_prompt_tokens, section_rows=0, **options)
+
+
+def test_prompt_within_budget_keeps_everything():
+    prompt = builder(4000).build(PREFERENCES, products(3, 'h'), products(10))
+    assert prompt.candidates == 10
+    assert prompt.dropped == 0
+    assert prompt.abbreviated == 0
+    assert prompt.prompt_tokens <= 4000
+
+
+def test_over_budget_drops_the_lowest_ranked_candidates_first():
+    full = builder(100000).build(PREFERENCES, [], products(40))
+    budget = full.prompt_tokens // 2
+    prompt = builder(budget).build(PREFERENCES, [], products(40))
+    assert prompt.prompt_tokens <= budget
+    assert prompt.dropped > 0
+    kept = sorted(prompt.id_map.values(), key=lambda product_id: int(product_id[1:]))
+    assert kept == [f"c{i}" for i in range(len(kept))]
+
+
+def test_never_drops_below_min_candidates():
+    prompt = builder(50, min_candidates=5).build(PREFERENCES, products(5, 'h'), products(20))
+    assert prompt.candidates == 5
+    # What is still over budget comes out of the history, oldest first
+    assert 'Recently viewed:\n- None' in prompt.text
+
+
+def test_ids_in_the_prompt_map_back_to_catalog_ids():
+    prompt = builder(4000).build(PREFERENCES, [], products(3))
+    assert prompt.id_map == {'p1': 'c0', 'p2': 'c1', 'p3': 'c2'}
+    assert 'p1|' in prompt.text
+
+
+def test_custom_price_range_sections_are_cached_with_a_cap(sample_table):
+    catalog = CatalogIndex(sample_table)
+    rendered = []
+    sections = _CatalogSections(catalog, lambda short_id, product: rendered.append(short_id) or f"{short_id}\n", 3,
+                                max_custom=2)
+    first = sections.get(None, '10-50')
+    count = len(rendered)
+    assert sections.get(None, '$10 - 50') is first
+    assert len(rendered) == count
+    sections.get(None, '50-100')
+    sections.get(None, '100+')
+    assert len(sections) == 2
+    sections.get(None, '10-50')
+    assert len(rendered) > count
+
+
+def test_prefixes_of_earlier_catalog_versions_are_dropped(sample_table):
+    prompt_builder = PromptBuilder(Tokenizer('gpt-3.5-turbo', 'approximate'), 4000)
+    old, new = CatalogIndex(sample_table, version=1), CatalogIndex(sample_table, version=2)
+    prompt_builder.prefix(PREFERENCES, old)
+    assert prompt_builder.stats()['prefixes'] == 1
+    prompt_builder.prefix(PREFERENCES, new)
+    assert prompt_builder.stats()['prefixes'] == 1
+    # A request still on the replaced snapshot is served but not cached
+    assert prompt_builder.prefix(PREFERENCES, old)[1] is False
+    assert prompt_builder.prefix(PREFERENCES, old)[1] is False
+    assert prompt_builder.stats()['prefixes'] == 1
+    assert prompt_builder.prefix(PREFERENCES, new)[1] is True
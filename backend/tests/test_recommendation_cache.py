@@ -0,0 +1,89 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from services.recommendation_cache import (
+    RecommendationCache, SQLiteCacheBackend, catalog_identity, make_cache_key, normalize_preferences
+)
+
+PREFERENCES = {'priceRange': 'all', 'categories': ['Electronics', 'Books'], 'brands': ['Acme']}
+
+
+def catalog(fingerprint, version=1):
+    return SimpleNamespace(products=SimpleNamespace(fingerprint=fingerprint), version=version)
+
+
+def test_normalize_preferences():
+    assert normalize_preferences({'priceRange': ' Low ', 'categories': ['b', ' a', 'b', ''], 'brands': None}) == {
+        'priceRange': 'low', 'categories': ['a', 'b'], 'brands': []
+    }
+    assert normalize_preferences({})['priceRange'] == 'all'
+
+
+def test_key_ignores_list_order_and_duplicates():
+    reordered = {'priceRange': 'ALL', 'categories': ['Books', 'Electronics', 'Books'], 'brands': ['Acme']}
+    assert make_cache_key(PREFERENCES, ['p2', 'p1'], 'fp') == make_cache_key(reordered, ['p1', 'p2'], 'fp')
+
+
+def test_key_depends_on_preferences_history_and_catalog():
+    key = make_cache_key(PREFERENCES, ['p1'], 'fp')
+    assert key != make_cache_key({**PREFERENCES, 'priceRange': 'low'}, ['p1'], 'fp')
+    assert key != make_cache_key(PREFERENCES, ['p1', 'p3'], 'fp')
+    assert key != make_cache_key(PREFERENCES, ['p1'], 'other-fp')
+
+
+def test_catalog_identity_is_the_fingerprint_whatever_the_version():
+    # Workers and restarts number versions independently; the file fingerprint is shared
+    assert catalog_identity(catalog('abc', version=1)) == catalog_identity(catalog('abc', version=7))
+    assert catalog_identity(catalog(None, version=3)) == 'v3'
+
+
+def test_lru_eviction():
+    cache = RecommendationCache(max_entries=2, ttl_seconds=60)
+    cache.set('a', {'n': 1})
+    cache.set('b', {'n': 2})
+    cache.get('a')
+    cache.set('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_only_served_stale():
+    cache = RecommendationCache(ttl_seconds=0.01)
+    cache.set('a', {'n': 1})
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.get_stale('a') == {'n': 1}
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    first = RecommendationCache(ttl_seconds=60, backend=SQLiteCacheBackend(path))
+    second = RecommendationCache(ttl_seconds=60, backend=SQLiteCacheBackend(path))
+    first.set('a', {'n': 1})
+    first.flush()
+    assert second.get('a') == {'n': 1}
+    assert second.backend_hits == 1
+
+
+def test_async_lookup_reads_the_shared_backend(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    first = RecommendationCache(ttl_seconds=60, backend=SQLiteCacheBackend(path))
+    second = RecommendationCache(ttl_seconds=60, backend=SQLiteCacheBackend(path))
+    first.set('a', {'n': 1})
+    first.flush()
+    assert asyncio.run(second.get_async('a')) == {'n': 1}
+    assert asyncio.run(second.get_async('b')) is None
+    assert (second.backend_hits, second.misses) == (1, 1)
+
+
+def test_local_invalidation_keeps_the_shared_backend(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = RecommendationCache(ttl_seconds=60, backend=SQLiteCacheBackend(path))
+    cache.set('a', {'n': 1})
+    cache.invalidate(shared=False)
+    assert len(cache) == 0
+    assert cache.get('a') == {'n': 1}
+    cache.invalidate()
+    assert cache.get('a') is None
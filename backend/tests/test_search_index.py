@@ -0,0 +1,71 @@
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_products
+from services import search_index
+from services.product_table import ProductTable
+from services.search_index import SearchIndex, tokenize
+
+
+def product(product_id, name, description='', features=(), tags=(), price=10.0):
+    return {
+        'id': product_id, 'name': name, 'category': 'Electronics', 'subcategory': 'Audio', 'price': price,
+        'brand': 'Acme', 'description': description, 'features': list(features), 'rating': 4.0,
+        'inventory': 5, 'tags': list(tags),
+    }
+
+
+PRODUCTS = [
+    product('p0', 'Wireless Headphones', 'Over-ear headphones with noise cancelling', tags=['audio']),
+    product('p1', 'Wired Earbuds', 'Small earbuds for running', features=['Wireless charging case']),
+    product('p2', 'Desk Lamp', 'LED lamp for the office'),
+    product('p3', 'Wireless Speaker', 'Portable speaker', tags=['wireless', 'audio']),
+]
+
+
+def build(products=PRODUCTS):
+    table = ProductTable.from_products(products)
+    return table, SearchIndex.build(table)
+
+
+def test_tokenize():
+    assert tokenize("Noise-cancelling, USB-C & 4K!") == ['noise', 'cancelling', 'usb', 'c', '4k']
+
+
+def test_field_weights_rank_name_and_tag_matches_first():
+    _, index = build()
+    positions, scores = index.search('wireless', k=10, prefix=False)
+    # Name and tag beat name alone, which beats a feature match
+    assert positions.tolist() == [3, 0, 1]
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_typeahead_matches_the_last_word_as_a_prefix():
+    _, index = build()
+    assert index.search('desk la', k=10)[0].tolist() == [2]
+    assert index.search('desk la ', k=10)[0].tolist() == [2]
+    assert len(index.search('la ', k=10)[0]) == 0
+
+
+def test_accept_filter():
+    _, index = build()
+    positions, _ = index.search('wireless', k=10, prefix=False, accept=lambda p: p != 3)
+    assert 3 not in positions.tolist()
+
+
+def test_unchanged_text_reuses_the_index():
+    table, index = build()
+    repriced = [{**p, 'price': p['price'] * 2, 'inventory': 0} for p in PRODUCTS]
+    assert SearchIndex.build(ProductTable.from_products(repriced), previous=index) is index
+    renamed = [{**PRODUCTS[0], 'name': 'Bluetooth Headphones'}] + PRODUCTS[1:]
+    assert SearchIndex.build(ProductTable.from_products(renamed), previous=index) is not index
+
+
+def test_chunked_build_matches_a_single_pass(monkeypatch):
+    table = ProductTable.from_products(generate_products(500))
+    whole = SearchIndex.build(table)
+    monkeypatch.setattr(search_index, 'BUILD_CHUNK', 7)
+    chunked = SearchIndex.build(table)
+    assert chunked.vocab == whole.vocab
+    assert np.array_equal(chunked.term_offsets, whole.term_offsets)
+    assert np.array_equal(chunked.docs, whole.docs)
+    assert np.array_equal(chunked.impacts, whole.impacts)
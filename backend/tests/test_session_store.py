@@ -0,0 +1,54 @@
+from services.session_store import SessionProfile, SessionStore, price_band
+
+
+def product(product_id, category, brand, tags, price):
+    return {'id': product_id, 'category': category, 'brand': brand, 'tags': tags, 'price': price}
+
+
+def test_ring_buffer_keeps_counts_in_line_with_views():
+    profile = SessionProfile('s1', max_views=3)
+    views = [
+        product('p1', 'Books', 'A', ['x'], 10.0),
+        product('p2', 'Books', 'B', ['x', 'y'], 20.0),
+        product('p3', 'Toys', 'A', ['y'], 30.0),
+        product('p4', 'Toys', 'C', [], 40.0),
+        product('p5', 'Garden', 'C', ['z'], 50.0),
+    ]
+    for view in views:
+        profile.record(view)
+    assert profile.history() == ['p3', 'p4', 'p5']
+    assert dict(profile.categories) == {'Toys': 2, 'Garden': 1}
+    assert dict(profile.brands) == {'A': 1, 'C': 2}
+    assert dict(profile.tags) == {'y': 1, 'z': 1}
+    assert profile.average_price() == 40.0
+
+
+def test_price_band_upper_bounds():
+    assert price_band(10.0) == 'low'
+    assert price_band(49.99) == 'low'
+    assert price_band(50.0) == 'medium'
+    assert price_band(200.0) == 'high'
+    assert price_band(500.0) == 'high'
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2, idle_seconds=0)
+    store.record_view('a', product('p1', 'Books', 'A', [], 10.0))
+    store.record_view('b', product('p2', 'Books', 'A', [], 10.0))
+    store.history('a')
+    store.record_view('c', product('p3', 'Books', 'A', [], 10.0))
+    assert store.history('b') == []
+    assert store.history('a') == ['p1']
+    assert store.evictions == 1
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'sessions.json')
+    store = SessionStore(max_views=2, snapshot_path=path)
+    for product_id in ('p1', 'p2', 'p3'):
+        store.record_view('a', product(product_id, 'Books', 'A', ['x'], 10.0))
+    store.snapshot()
+    restored = SessionStore(max_views=2, snapshot_path=path)
+    assert restored.load() == 1
+    assert restored.profile('a')['history'] == ['p2', 'p3']
+    assert restored.profile('a')['tags'] == {'x': 2}
@@ -0,0 +1,52 @@
+import copy
+import random
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import generate_products
+from services.product_table import ProductTable
+from services.similarity_table import SimilarityTable
+
+
+def test_incremental_update_matches_a_full_build(tmp_path):
+    products = generate_products(20000)
+    full = SimilarityTable.build(ProductTable.from_products(products), k=10)
+
+    rng = random.Random(1)
+    changed = copy.deepcopy(products)
+    for i in rng.sample(range(len(changed)), 10):
+        changed[i]['price'] = round(changed[i]['price'] * rng.uniform(0.5, 2), 2)
+    for i in rng.sample(range(len(changed)), 10):
+        changed[i]['tags'] = ['gift', 'eco']
+    for i in sorted(rng.sample(range(len(changed)), 5), reverse=True):
+        del changed[i]
+    added = generate_products(10, seed=7)
+    for j, product in enumerate(added):
+        product['id'] = f"new{j}"
+    table = ProductTable.from_products(changed + added)
+
+    updated = SimilarityTable.build(table, k=10, previous=full)
+    reference = SimilarityTable.build(table, k=10)
+    assert 0 < updated.recomputed < len(table)
+    assert np.array_equal(updated.neighbors, reference.neighbors)
+    assert np.array_equal(updated.scores, reference.scores)
+
+
+def test_inventory_changes_recompute_nothing():
+    products = generate_products(500)
+    full = SimilarityTable.build(ProductTable.from_products(products), k=5)
+    restocked = [{**p, 'inventory': p['inventory'] + 1} for p in products]
+    updated = SimilarityTable.build(ProductTable.from_products(restocked), k=5, previous=full)
+    assert updated.recomputed == 0
+    assert np.array_equal(updated.neighbors, full.neighbors)
+
+
+def test_neighbours_exclude_the_product_itself(tmp_path):
+    table = ProductTable.from_products(generate_products(500))
+    similarity = SimilarityTable.build(table, k=5)
+    rows = np.arange(len(table))[:, None]
+    assert not np.any(similarity.neighbors == rows)
+
+    similarity.save(str(tmp_path / 'similarity'))
+    opened = SimilarityTable.open(str(tmp_path / 'similarity'))
+    assert np.array_equal(opened.related([0, 1], k=5), similarity.related([0, 1], k=5))
@@ -0,0 +1,53 @@
+import json
+
+from services.stream_parser import IncrementalJSONArrayParser
+
+REPLY = (
+    'Here are my picks:\n'
+    '[{"product_id": "p1", "explanation": "Has {braces} and \\"quotes\\"", "score": 9},\n'
+    ' {"product_id": "p2", "explanation": "Nested [list] too", "tags": ["a", "b"]}]\n'
+    'Trailing text [{"product_id": "ignored"}]'
+)
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalJSONArrayParser()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return parser, items
+
+
+def test_whole_reply():
+    parser, items = feed_in_chunks(REPLY, len(REPLY))
+    assert [item['product_id'] for item in items] == ['p1', 'p2']
+    assert items[0]['explanation'] == 'Has {braces} and "quotes"'
+    assert parser.finished
+    assert parser.errors == 0
+
+
+def test_any_chunking_gives_the_same_objects():
+    expected = feed_in_chunks(REPLY, len(REPLY))[1]
+    for size in (1, 2, 3, 7, 16):
+        assert feed_in_chunks(REPLY, size)[1] == expected
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"product_id": "p1"') == []
+    assert parser.feed('}, {"product_id"') == [{'product_id': 'p1'}]
+    assert not parser.finished
+
+
+def test_malformed_objects_are_skipped_and_counted():
+    parser = IncrementalJSONArrayParser()
+    items = parser.feed('[{"product_id": p1}, {"product_id": "p2"}]')
+    assert items == [{'product_id': 'p2'}]
+    assert parser.errors == 1
+
+
+def test_cut_off_object_is_dropped_on_close():
+    parser = IncrementalJSONArrayParser()
+    parser.feed(json.dumps([{'product_id': 'p1'}])[:-3])
+    assert parser.close() == []
+    assert not parser.finished
@@ -0,0 +1,37 @@
+import pytest
+import tiktoken
+
+from services.tokenizer import Tokenizer, TokenizerUnavailable, encoding_name, load_encoding, save_encoding
+
+
+def toy_encoding():
+    ranks = {bytes([i]): i for i in range(256)}
+    ranks[b'ab'] = 256
+    return tiktoken.Encoding('toy', pat_str=r"\w+|\s+|[^\w\s]+", mergeable_ranks=ranks,
+                             special_tokens={'<|endoftext|>': 257})
+
+
+def test_saved_encoding_loads_offline(tmp_path):
+    encoding = toy_encoding()
+    save_encoding(encoding, str(tmp_path))
+    loaded = load_encoding(str(tmp_path), 'toy')
+    for text in ('abab x', 'Wireless héadphones, 30h!', ''):
+        assert loaded.encode(text) == encoding.encode(text)
+
+
+def test_missing_encoding_is_an_error(tmp_path):
+    with pytest.raises(TokenizerUnavailable, match='fetch_tokenizer'):
+        Tokenizer('gpt-3.5-turbo', 'tiktoken', str(tmp_path))
+
+
+def test_approximation_only_when_asked_for():
+    tokenizer = Tokenizer('gpt-3.5-turbo', 'approximate')
+    assert tokenizer.name == 'approximate'
+    assert tokenizer.count("Wireless headphones") == 4
+    with pytest.raises(ValueError):
+        Tokenizer('gpt-3.5-turbo', 'words')
+
+
+def test_unknown_models_use_the_default_encoding():
+    assert encoding_name('gpt-3.5-turbo') == 'cl100k_base'
+    assert encoding_name('some-local-model') == 'cl100k_base'